@@ -0,0 +1,116 @@
+import datetime
+from typing import List, Optional, Tuple
+
+# Event kinds, stored as small ints
+COMPLETE = 0
+UNCOMPLETE = 1
+QUEST_COMPLETE = 2
+CHECK_IN = 3
+
+KIND_NAMES = {COMPLETE: "complete", UNCOMPLETE: "uncomplete", QUEST_COMPLETE: "quest_complete", CHECK_IN: "check_in"}
+
+MAX_HISTORY_DAYS = 366
+
+# Check-in outcomes from advance_streak
+PUSHED = "pushed"
+MAINTAINED = "maintained"
+BROKEN = "broken"
+
+
+class DayRollup:
+    """Running totals for one local day, updated as each event is appended."""
+
+    __slots__ = ("completed", "uncompleted", "quests_completed", "check_ins", "perfect_day", "streak")
+
+    def __init__(self, completed=0, uncompleted=0, quests_completed=0, check_ins=0, perfect_day=False, streak=None):
+        self.completed = completed
+        self.uncompleted = uncompleted
+        self.quests_completed = quests_completed
+        self.check_ins = check_ins
+        self.perfect_day = perfect_day
+        self.streak = streak  # streak after the day's last check-in
+
+    def apply(self, kind: int, perfect_day: bool = False, streak: Optional[int] = None):
+        if kind == COMPLETE:
+            self.completed += 1
+        elif kind == UNCOMPLETE:
+            self.uncompleted += 1
+        elif kind == QUEST_COMPLETE:
+            self.quests_completed += 1
+        elif kind == CHECK_IN:
+            self.check_ins += 1
+            self.perfect_day = self.perfect_day or perfect_day
+            self.streak = streak
+
+    def to_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class ActivityLog:
+    """Append-only record of one user's activity, segmented by local day.
+
+    Each event is a compact ``(unix seconds, kind, task id)`` tuple appended
+    to its day's segment and written through to storage. Nothing is updated
+    or deleted, so history survives the midnight reset. Every append also
+    updates that day's rollup, so a history query reads one rollup per day
+    instead of rescanning events. Only the last ``keep_days`` segments stay
+    in memory; the rollups of every day do.
+    """
+
+    def __init__(self, storage, keep_days: int = 7):
+        self.storage = storage  # this user's storage view
+        self.keep_days = keep_days
+        self.segments = {}  # local date -> [(unix seconds, kind, task id), ...]
+        self.rollups = {
+            datetime.date.fromisoformat(day): DayRollup(**data) for day, data in storage.load_rollups().items()
+        }
+
+    def append(self, kind: int, at: datetime.datetime, task_id: Optional[int] = None, **outcome) -> DayRollup:
+        """Log an event at ``at`` (aware, in the user's timezone); ``outcome`` goes to the rollup."""
+        day = at.date()
+        event = (int(at.timestamp()), kind, task_id)
+        segment = self.segments.get(day)
+        if segment is None:
+            segment = self.segments[day] = []
+            cutoff = day - datetime.timedelta(days=self.keep_days)
+            for old_day in [d for d in self.segments if d < cutoff]:
+                del self.segments[old_day]
+        segment.append(event)
+
+        rollup = self.rollups.get(day)
+        if rollup is None:
+            rollup = self.rollups[day] = DayRollup()
+        rollup.apply(kind, **outcome)
+        self.storage.append_event(day.isoformat(), *event)
+        self.storage.save_rollup(day.isoformat(), rollup.to_dict())
+        return rollup
+
+    def history(self, start: datetime.date, end: datetime.date) -> List[Tuple[datetime.date, Optional[DayRollup]]]:
+        """Each day from ``start`` to ``end`` inclusive with its rollup (None if nothing happened)."""
+        return [
+            (day, self.rollups.get(day))
+            for day in (start + datetime.timedelta(days=n) for n in range((end - start).days + 1))
+        ]
+
+
+def advance_streak(stats, today: datetime.date, perfect_day: bool, active: bool) -> str:
+    """Move the streak for a check-in on ``today`` (the user's local date), in O(1).
+
+    A perfect day pushes the streak forward once per day, continuing it if
+    the previous active day was yesterday. Any other day with activity keeps
+    it, and a day with none breaks it.
+    """
+    today_string = today.isoformat()
+    if perfect_day and stats.last_streak_date != today_string:
+        yesterday = (today - datetime.timedelta(days=1)).isoformat()
+        stats.current_streak = stats.current_streak + 1 if stats.last_activity_date == yesterday else 1
+        stats.longest_streak = max(stats.longest_streak, stats.current_streak)
+        stats.last_activity_date = today_string
+        stats.last_streak_date = today_string
+        return PUSHED
+    if active:
+        stats.last_activity_date = today_string
+        return MAINTAINED
+    stats.current_streak = 0
+    stats.last_streak_date = None
+    return BROKEN
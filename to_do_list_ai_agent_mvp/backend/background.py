@@ -0,0 +1,29 @@
+import asyncio
+
+from telemetry import StructuredLogger
+
+log = StructuredLogger("background")
+
+_running = set()  # the event loop only holds weak references to tasks
+
+
+def spawn(coro, what: str, loop=None) -> asyncio.Task:
+    """Run ``coro`` as a task nobody awaits (on ``loop``, else the running loop).
+
+    The task is referenced here until it finishes, so it cannot be garbage
+    collected mid-run, and a failure is logged under ``what`` instead of
+    surfacing later as "Task exception was never retrieved".
+    """
+    task = (loop or asyncio.get_running_loop()).create_task(coro)
+    _running.add(task)
+    task.add_done_callback(lambda done: _finished(done, what))
+    return task
+
+
+def _finished(task: asyncio.Task, what: str):
+    _running.discard(task)
+    if task.cancelled():
+        return
+    error = task.exception()
+    if error is not None:
+        log.error("background task failed", task=what, error=type(error).__name__, detail=str(error))
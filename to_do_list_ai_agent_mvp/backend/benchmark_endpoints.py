@@ -0,0 +1,190 @@
+"""Throughput and per-endpoint latency of scripted user sessions, with baselines.
+
+Each simulated user does what script.js does over a day: load the home
+page (/bootstrap), add tasks, list them, set and complete the daily quest,
+toggle tasks, check in, call it a day and reset at midnight. Sessions run
+against the app in-process, with the real genai client and gateway talking
+to fake_gemini.py, at increasing concurrency and task-list sizes.
+
+The results are written as JSON. Given ``--compare`` with an earlier file,
+any endpoint whose p95 grew by more than ``--tolerance`` (and by at least
+``--min-delta-ms``) is reported and the exit status is 1. Compare runs
+made with the same levels and fake-model settings.
+
+Run with:  python benchmark_endpoints.py [--out baseline.json] [--compare baseline.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import time
+from collections import defaultdict
+
+import httpx
+
+os.environ.setdefault("GOOGLE_API_KEY", "benchmark")
+
+import main  # noqa: E402
+from fake_gemini import FakeGemini, FakeGeminiServer  # noqa: E402
+
+
+def percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)  # endpoint -> seconds
+        self.errors = defaultdict(int)
+
+    async def call(self, http, method, endpoint, url, user_id, **kwargs):
+        started = time.perf_counter()
+        response = await http.request(method, url, headers={"X-User-Id": user_id}, **kwargs)
+        self.latencies[f"{method} {endpoint}"].append(time.perf_counter() - started)
+        if response.status_code >= 400:
+            self.errors[f"{method} {endpoint}"] += 1
+        return response
+
+
+async def session(http, recorder: Recorder, user_id: str, tasks: int):
+    call = recorder.call
+    await call(http, "GET", "/bootstrap", "/bootstrap", user_id)
+    for n in range(tasks):
+        await call(http, "POST", "/tasks/", "/tasks/", user_id, json={"description": f"Task {n}"})
+    await call(http, "GET", "/tasks/", "/tasks/", user_id)
+    await call(http, "POST", "/daily-quests/", "/daily-quests/", user_id, json={"quest_name": "Drink water"})
+    for task_id in range(1, tasks + 1, max(1, tasks // 10)):
+        await call(http, "POST", "/tasks/{task_id}/complete", f"/tasks/{task_id}/complete", user_id)
+        await call(http, "GET", "/bootstrap", "/bootstrap", user_id)
+    await call(http, "PATCH", "/daily-quests/complete", "/daily-quests/complete", user_id)
+    await call(http, "POST", "/task-progress-check", "/task-progress-check", user_id)
+    await call(http, "POST", "/check-in", "/check-in", user_id)
+    await call(http, "POST", "/call-it-a-day", "/call-it-a-day", user_id)
+    await call(http, "POST", "/midnight-reset", "/midnight-reset", user_id)
+
+
+async def run_level(tasks: int, concurrency: int) -> dict:
+    recorder = Recorder()
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as http:
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            session(http, recorder, f"bench-{tasks}-{concurrency}-{n}", tasks) for n in range(concurrency)
+        ))
+        elapsed = time.perf_counter() - started
+
+    endpoints = {}
+    for endpoint, samples in sorted(recorder.latencies.items()):
+        samples.sort()
+        endpoints[endpoint] = {
+            "count": len(samples),
+            "errors": recorder.errors[endpoint],
+            "p50_ms": round(percentile(samples, 0.50) * 1000, 3),
+            "p95_ms": round(percentile(samples, 0.95) * 1000, 3),
+            "p99_ms": round(percentile(samples, 0.99) * 1000, 3),
+        }
+    requests = sum(stats["count"] for stats in endpoints.values())
+    return {
+        "tasks": tasks,
+        "concurrency": concurrency,
+        "requests": requests,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(requests / elapsed, 1),
+        "endpoints": endpoints,
+    }
+
+
+async def run_levels(task_counts, concurrencies) -> list:
+    # One event loop for every level, so background refills started in one carry on into the next
+    await run_level(min(task_counts), 1)  # warm-up: fills the response pools, not recorded
+    results = []
+    for tasks in task_counts:
+        for concurrency in concurrencies:
+            level = await run_level(tasks, concurrency)
+            print_level(level)
+            results.append(level)
+    return results
+
+
+def compare(results, baseline, tolerance: float, min_delta_ms: float) -> list:
+    """(level, endpoint, baseline p95, current p95) for every endpoint that got slower."""
+    previous = {(level["tasks"], level["concurrency"]): level["endpoints"] for level in baseline["results"]}
+    regressions = []
+    for level in results:
+        before = previous.get((level["tasks"], level["concurrency"]))
+        if before is None:
+            continue
+        for endpoint, stats in level["endpoints"].items():
+            if endpoint not in before:
+                continue
+            old, new = before[endpoint]["p95_ms"], stats["p95_ms"]
+            if new > old * tolerance and new - old >= min_delta_ms:
+                regressions.append((f"{level['tasks']} tasks x {level['concurrency']} users", endpoint, old, new))
+    return regressions
+
+
+def print_level(level):
+    print(f"\n{level['tasks']} tasks x {level['concurrency']} users: "
+          f"{level['requests']} requests in {level['elapsed_s']}s, {level['throughput_rps']} req/s")
+    print(f"{'endpoint':<32} | {'count':>6} | {'p50 ms':>8} | {'p95 ms':>8} | {'p99 ms':>8} | {'errors':>6}")
+    print("-" * 83)
+    for endpoint, stats in level["endpoints"].items():
+        print(f"{endpoint:<32} | {stats['count']:>6} | {stats['p50_ms']:>8.2f} | {stats['p95_ms']:>8.2f} | "
+              f"{stats['p99_ms']:>8.2f} | {stats['errors']:>6}")
+
+
+def parse_list(text):
+    return [int(value) for value in text.split(",")]
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tasks", type=parse_list, default=[10, 50, 200], help="task-list sizes, comma separated")
+    parser.add_argument("--concurrency", type=parse_list, default=[1, 10, 50], help="concurrent users, comma separated")
+    parser.add_argument("--latency", type=float, default=0.3, help="fake model mean seconds per call")
+    parser.add_argument("--jitter", type=float, default=0.1, help="fake model +/- seconds around the mean")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of fake model calls that fail")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", default="benchmark_baseline.json", help="where to write the results")
+    parser.add_argument("--compare", help="an earlier results file to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=1.5, help="allowed p95 growth factor")
+    parser.add_argument("--min-delta-ms", type=float, default=2.0, help="ignore p95 growth smaller than this")
+    args = parser.parse_args()
+
+    model = FakeGemini(args.latency, args.jitter, args.error_rate, seed=args.seed)
+    with FakeGeminiServer(model) as server:
+        main.llm.client = server.client()
+        results = asyncio.run(run_levels(args.tasks, args.concurrency))
+
+    report = {
+        "config": {
+            "fake_latency_s": args.latency,
+            "fake_jitter_s": args.jitter,
+            "fake_error_rate": args.error_rate,
+            "seed": args.seed,
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+        },
+        "fake_model": {"calls": model.calls, "errors": model.errors},
+        "results": results,
+    }
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nfake model calls: {model.calls}, results written to {args.out}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance, args.min_delta_ms)
+        for level, endpoint, old, new in regressions:
+            print(f"REGRESSION {level} {endpoint}: p95 {old:.2f}ms -> {new:.2f}ms")
+        if regressions:
+            return 1
+        print(f"no p95 regressions against {args.compare}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
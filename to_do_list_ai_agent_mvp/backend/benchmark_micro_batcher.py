@@ -0,0 +1,54 @@
+"""Items per model call and added latency of MicroBatcher under bursty load.
+
+Run with:  python benchmark_micro_batcher.py
+"""
+import asyncio
+import random
+import time
+
+from micro_batcher import MicroBatcher
+
+MODEL_LATENCY = 0.3  # seconds per fake model call
+REQUESTS = 2_000
+WINDOWS = [0.0, 0.005, 0.02, 0.05]
+
+
+class FakeGateway:
+    def __init__(self):
+        self.calls = 0
+
+    async def generate(self, prompt, fallback=None):
+        self.calls += 1
+        await asyncio.sleep(MODEL_LATENCY)
+        count = prompt.count("\n") + 1
+        return "\n".join(f"{n}. Potato line {n}" for n in range(1, count + 1))
+
+
+async def run(window):
+    gateway = FakeGateway()
+    batcher = MicroBatcher(gateway, lambda s: s, lambda items: "\n".join(items), window=window, max_items=8)
+    latencies = []
+
+    async def one():
+        await asyncio.sleep(random.uniform(0, 1.0))  # requests spread over one second
+        start = time.perf_counter()
+        await batcher.generate("User completed a task")
+        latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(one() for _ in range(REQUESTS)))
+    latencies.sort()
+    stats = batcher.stats()
+    return gateway.calls, stats, latencies[int(len(latencies) * 0.99)]
+
+
+def main():
+    print(f"{'window ms':>9} | {'model calls':>11} | {'items/call':>10} | {'wait p99 ms':>11} | {'total p99 ms':>12}")
+    print("-" * 66)
+    for window in WINDOWS:
+        calls, stats, p99 = asyncio.run(run(window))
+        print(f"{window * 1000:>9.0f} | {calls:>11} | {stats['items_per_call']:>10} | "
+              f"{stats['batch_wait_p99_ms']:>11} | {p99 * 1000:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""Schedule / reschedule / cancel cost of ReminderScheduler as pending reminders grow.
+
+Run with:  python benchmark_reminder_scheduler.py
+"""
+import datetime
+import random
+import time
+
+from reminder_scheduler import ReminderScheduler
+
+SIZES = [1_000, 10_000, 100_000]
+OPS = 5_000
+
+
+async def _noop(key, task):
+    return ""
+
+
+def main():
+    now = datetime.datetime.now(datetime.timezone.utc)
+    print(f"{'pending':>8} | {'reschedule us':>13} | {'cancel+add us':>13}")
+    print("-" * 40)
+    for size in SIZES:
+        tasks = [
+            {"id": i, "is_completed": False, "reminder_at": now + datetime.timedelta(minutes=random.randint(1, 10_000))}
+            for i in range(size)
+        ]
+        scheduler = ReminderScheduler(_noop, lambda key, task, text: None)
+        scheduler.rebuild((task["id"], task) for task in tasks)
+
+        start = time.perf_counter()
+        for _ in range(OPS):
+            task = random.choice(tasks)
+            task["reminder_at"] = now + datetime.timedelta(minutes=random.randint(1, 10_000))
+            scheduler.schedule(task["id"], task)
+        reschedule_us = (time.perf_counter() - start) / OPS * 1e6
+
+        start = time.perf_counter()
+        for _ in range(OPS):
+            task = random.choice(tasks)
+            scheduler.cancel(task["id"])
+            scheduler.schedule(task["id"], task)
+        cancel_us = (time.perf_counter() - start) / OPS * 1e6
+
+        print(f"{size:>8} | {reschedule_us:>13.2f} | {cancel_us:>13.2f}")
+
+
+if __name__ == "__main__":
+    main()
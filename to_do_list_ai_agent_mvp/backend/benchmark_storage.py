@@ -0,0 +1,49 @@
+"""Mutation latency of TaskStore on the in-memory vs. SQLite (WAL) backends.
+
+Run with:  python benchmark_storage.py
+"""
+import os
+import random
+import tempfile
+import time
+
+from storage import MemoryStorage, SQLiteStorage
+from task_store import TaskStore
+
+OPS = 5_000
+
+
+def bench(storage):
+    store = TaskStore(storage.for_user("bench"))
+    start = time.perf_counter()
+    for i in range(OPS):
+        store.add({"description": f"Task {i}"})
+    add_us = (time.perf_counter() - start) / OPS * 1e6
+
+    ids = [random.randint(1, OPS) for _ in range(OPS)]
+    start = time.perf_counter()
+    for task_id in ids:
+        store.set_completed(task_id, not store.get(task_id)["is_completed"])
+    toggle_us = (time.perf_counter() - start) / OPS * 1e6
+
+    start = time.perf_counter()
+    storage.flush()
+    flush_ms = (time.perf_counter() - start) * 1e3
+    storage.close()
+    return add_us, toggle_us, flush_ms
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        results = {
+            "memory": bench(MemoryStorage()),
+            "sqlite": bench(SQLiteStorage(os.path.join(tmp, "bench.db"))),
+        }
+    print(f"{'backend':>8} | {'add us':>8} | {'toggle us':>9} | {'final flush ms':>14}")
+    print("-" * 49)
+    for name, (add_us, toggle_us, flush_ms) in results.items():
+        print(f"{name:>8} | {add_us:>8.2f} | {toggle_us:>9.2f} | {flush_ms:>14.2f}")
+
+
+if __name__ == "__main__":
+    main()
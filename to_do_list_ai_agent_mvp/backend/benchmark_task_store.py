@@ -0,0 +1,170 @@
+"""Toggle / progress-status latency of TaskStore vs. the old list scan,
+deadline range queries (due soon, overdue, next N) vs. a scan of every task,
+description search (a word, two words, a typed prefix) vs. a substring scan,
+and filtered, sorted task pages vs. sorting the whole list.
+
+Run with:  python benchmark_task_store.py
+"""
+import datetime
+import itertools
+import random
+import time
+
+from task_store import TaskStore
+
+SIZES = [10, 100, 1_000, 10_000, 100_000]
+OPS = 2_000
+
+
+def build_store(size):
+    store = TaskStore()
+    for i in range(size):
+        store.add({"description": f"Task {i}", "is_completed": i % 2 == 0})
+    return store
+
+
+def time_per_op(fn, ops=OPS):
+    start = time.perf_counter()
+    for _ in range(ops):
+        fn()
+    return (time.perf_counter() - start) / ops * 1e6  # microseconds
+
+
+def bench_store(size):
+    store = build_store(size)
+    ids = [random.randint(1, size) for _ in range(OPS)]
+    it = iter(ids)
+
+    def toggle():
+        task_id = next(it)
+        store.set_completed(task_id, not store.get(task_id)["is_completed"])
+
+    def status():
+        return store.completed_count, store.total_count, store.completion_rate
+
+    return time_per_op(toggle), time_per_op(status)
+
+
+def bench_list_scan(size, ops=50):
+    # The pre-TaskStore implementation: scan for the id, then rescan for progress.
+    todo_list = [{"id": i + 1, "is_completed": i % 2 == 0} for i in range(size)]
+    ids = iter([random.randint(1, size) for _ in range(ops)])
+
+    def toggle():
+        task_id = next(ids)
+        for task in todo_list:
+            if task["id"] == task_id:
+                task["is_completed"] = not task["is_completed"]
+                break
+        return len([t for t in todo_list if t["is_completed"]])
+
+    return time_per_op(toggle, ops)
+
+
+def bench_deadlines(size, ops=200):
+    now = time.time()
+    store = TaskStore()
+    for i in range(size):
+        deadline = datetime.datetime.fromtimestamp(now + random.uniform(-30, 30) * 86400, datetime.timezone.utc)
+        store.add({"description": f"Task {i}", "deadline": deadline, "is_completed": i % 4 == 0})
+    window = 3600
+
+    def due_soon():
+        return store.due_between(now, now + window)
+
+    def overdue_and_next():
+        return store.overdue(now, 20), store.next_due(now, 5)
+
+    def scan():
+        return [t for t in store if not t["is_completed"] and now <= t["deadline"].timestamp() < now + window]
+
+    return time_per_op(due_soon, ops), time_per_op(overdue_and_next, ops), time_per_op(scan, max(1, ops // 20))
+
+
+WORDS = ("water peel mash boil fry bake buy call email write read clean wash walk plan book pay fix "
+         "potatoes chips groceries report invoice dentist garden dog car kitchen laundry mum friend team "
+         "project budget slides tickets tax bike plants garage homework").split()
+
+
+def bench_search(size, ops=200):
+    # Real descriptions follow Zipf's law: a few words are everywhere, most are rare
+    rng = random.Random(size)
+    vocabulary = WORDS + [f"{rng.choice(WORDS)[:3]}{n}" for n in range(5_000)]
+    cum_weights = list(itertools.accumulate(1 / rank for rank in range(1, len(vocabulary) + 1)))
+
+    def description():
+        return " ".join(rng.choices(vocabulary, cum_weights=cum_weights, k=rng.randint(2, 6)))
+
+    store = TaskStore()
+    for _ in range(size):
+        store.add({"description": description()})
+    queries = {"common word": "water", "word": "dentist", "two words": "pay invoice", "prefix": "gro"}
+    timings = {name: time_per_op(lambda q=query: store.search(q), ops) for name, query in queries.items()}
+    timings["scan"] = time_per_op(lambda: [t for t in store if "dentist" in t["description"]], max(1, ops // 20))
+
+    def rename():
+        task_id = rng.randint(1, size)
+        store.update(task_id, description=description())
+
+    timings["rename"] = time_per_op(rename, ops)
+    return timings
+
+
+def bench_pages(size, ops=200):
+    rng = random.Random(size)
+    start = datetime.datetime(2025, 1, 1)
+    store = TaskStore()
+    for i in range(size):
+        store.add({"description": f"Task {i}", "created_at": start + datetime.timedelta(minutes=i),
+                   "deadline": start + datetime.timedelta(hours=rng.randint(0, 10_000)) if i % 3 else None,
+                   "is_completed": i % 2 == 0})
+    _, middle = store.page("deadline", limit=size // 4, completed=False)
+
+    def first_page():
+        return store.page("completion", limit=50)
+
+    def deep_page():
+        return store.page("deadline", limit=50, after=middle, completed=False, has_deadline=True)
+
+    def toggle():
+        task_id = rng.randint(1, size)
+        store.set_completed(task_id, not store.get(task_id)["is_completed"])
+
+    def sort_all():
+        return sorted(store, key=lambda t: (t["is_completed"], t["created_at"]))[:50]
+
+    return (time_per_op(first_page, ops), time_per_op(deep_page, ops), time_per_op(toggle, ops),
+            time_per_op(sort_all, max(1, ops // 20)))
+
+
+def main():
+    print(f"{'tasks':>8} | {'toggle us':>10} | {'status us':>10} | {'list scan us':>13}")
+    print("-" * 52)
+    for size in SIZES:
+        toggle_us, status_us = bench_store(size)
+        scan_us = bench_list_scan(size)
+        print(f"{size:>8} | {toggle_us:>10.3f} | {status_us:>10.3f} | {scan_us:>13.1f}")
+
+    print(f"\n{'tasks':>8} | {'due 1h us':>10} | {'overdue+next us':>15} | {'scan 1h us':>11}")
+    print("-" * 54)
+    for size in SIZES:
+        due_us, overdue_us, scan_us = bench_deadlines(size)
+        print(f"{size:>8} | {due_us:>10.2f} | {overdue_us:>15.2f} | {scan_us:>11.1f}")
+
+    print(f"\n{'tasks':>8} | {'common us':>9} | {'word us':>9} | {'2 words us':>10} | {'prefix us':>9} | "
+          f"{'rename us':>9} | {'scan us':>9}")
+    print("-" * 82)
+    for size in SIZES:
+        t = bench_search(size)
+        print(f"{size:>8} | {t['common word']:>9.1f} | {t['word']:>9.1f} | {t['two words']:>10.1f} | "
+              f"{t['prefix']:>9.1f} | {t['rename']:>9.1f} | {t['scan']:>9.1f}")
+
+    print(f"\n{'tasks':>8} | {'page 1 us':>9} | {'deep page us':>12} | {'toggle us':>9} | {'sort all us':>11}")
+    print("-" * 63)
+    for size in SIZES:
+        first_us, deep_us, toggle_us, sort_us = bench_pages(size)
+        print(f"{size:>8} | {first_us:>9.1f} | {deep_us:>12.1f} | {toggle_us:>9.1f} | {sort_us:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
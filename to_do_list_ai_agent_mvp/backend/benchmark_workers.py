@@ -0,0 +1,151 @@
+"""Requests per second on CPU-bound routes as uvicorn workers are added.
+
+Starts the app with ``uvicorn --workers N`` on a shared SQLite database
+(POTATODO_MULTI_WORKER=1) for each N, seeds a few users with large task
+lists, then hammers GET /tasks/ and GET /bootstrap from several client
+processes for a fixed time. Between runs it also checks coherence: a
+toggle made through one connection must be visible through every other
+connection, whichever worker serves it.
+
+Scaling is bounded by the cores left over for the client processes, so run
+it on a machine with at least twice as many cores as the largest N.
+
+Run with:  python benchmark_workers.py [max_workers]
+"""
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import httpx
+
+from fake_gemini import FakeGemini, FakeGeminiServer
+
+MAX_WORKERS = int(sys.argv[1]) if len(sys.argv) > 1 else os.cpu_count() or 1
+USERS = 8
+TASKS_PER_USER = 200
+CLIENT_PROCESSES = max(2, MAX_WORKERS)
+CONNECTIONS_PER_PROCESS = 4
+DURATION = 5.0
+ROUTES = ["/tasks/", "/bootstrap"]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(workers: int, db_path: str, port: int, model_url: str) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "GOOGLE_API_KEY": "benchmark",
+        "POTATODO_GEMINI_BASE_URL": model_url,
+        "POTATODO_DB_PATH": db_path,
+        "POTATODO_MULTI_WORKER": "1",
+        "POTATODO_LOG_LEVEL": "ERROR",
+    }
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning", "--no-access-log"],
+        cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/tasks/", timeout=1).raise_for_status()
+            return server
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    server.kill()
+    raise RuntimeError("server did not start")
+
+
+def seed(base_url: str):
+    with httpx.Client(base_url=base_url, timeout=30) as http:
+        for user in range(USERS):
+            headers = {"X-User-Id": f"bench-{user}"}
+            operations = [{"op": "create", "task": {"description": f"Task {n}"}} for n in range(TASKS_PER_USER)]
+            http.post("/tasks/batch", json={"operations": operations}, headers=headers).raise_for_status()
+
+
+def check_coherence(base_url: str, connections: int = 16) -> bool:
+    """Toggle through one connection, then read back through many fresh ones."""
+    headers = {"X-User-Id": "bench-0"}
+    with httpx.Client(base_url=base_url) as writer:
+        task = writer.post("/tasks/1/complete", headers=headers).json()["task"]
+    for _ in range(connections):
+        with httpx.Client(base_url=base_url) as reader:  # a new connection may land on another worker
+            tasks = reader.get("/tasks/", headers=headers).json()
+            if tasks[0]["is_completed"] != task["is_completed"]:
+                return False
+    return True
+
+
+def client_process(base_url: str, route: str, start_at: float, counts):
+    def hammer(n):
+        done = 0
+        with httpx.Client(base_url=base_url, timeout=30) as http:
+            while time.time() < start_at:
+                time.sleep(0.001)
+            stop_at = start_at + DURATION
+            while time.time() < stop_at:
+                http.get(route, headers={"X-User-Id": f"bench-{n % USERS}"}).raise_for_status()
+                done += 1
+        counts.append(done)
+
+    threads = [threading.Thread(target=hammer, args=(n,)) for n in range(CONNECTIONS_PER_PROCESS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def measure(base_url: str, route: str) -> float:
+    with multiprocessing.Manager() as manager:
+        counts = manager.list()
+        start_at = time.time() + 1.0
+        processes = [
+            multiprocessing.Process(target=client_process, args=(base_url, route, start_at, counts))
+            for _ in range(CLIENT_PROCESSES)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        return sum(counts) / DURATION
+
+
+def main():
+    worker_counts = sorted({1, *[n for n in (2, 4, 8, 16) if n <= MAX_WORKERS], MAX_WORKERS})
+    print(f"cores: {os.cpu_count()}, users: {USERS}, tasks per user: {TASKS_PER_USER}, "
+          f"clients: {CLIENT_PROCESSES}x{CONNECTIONS_PER_PROCESS}")
+    print(f"{'workers':>7} | " + " | ".join(f"{route + ' req/s':>18} | {'speedup':>7}" for route in ROUTES)
+          + f" | {'coherent':>8}")
+    print("-" * (20 + 31 * len(ROUTES)))
+    baseline = {}
+    for workers in worker_counts:
+        with tempfile.TemporaryDirectory() as tmp, FakeGeminiServer(FakeGemini(latency=0.05)) as model:
+            port = free_port()
+            base_url = f"http://127.0.0.1:{port}"
+            server = start_server(workers, os.path.join(tmp, "potatodo.db"), port, model.url)
+            try:
+                seed(base_url)
+                coherent = check_coherence(base_url)
+                cells = []
+                for route in ROUTES:
+                    rps = measure(base_url, route)
+                    baseline.setdefault(route, rps)
+                    cells.append(f"{rps:>18.0f} | {rps / baseline[route]:>6.2f}x")
+                print(f"{workers:>7} | " + " | ".join(cells) + f" | {str(coherent):>8}")
+            finally:
+                server.terminate()
+                server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import time
+from collections import deque
+from typing import Optional
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Error-rate and latency circuit breaker for the model.
+
+    Every model call reports its outcome; a call that errors or takes longer
+    than ``latency_budget`` counts as a failure. Once at least ``min_calls``
+    of the last ``window`` calls have been seen and the failure rate reaches
+    ``failure_rate``, the breaker opens and callers stop calling the model.
+    After ``open_for`` seconds one probe is let through (half-open): a good
+    probe closes the breaker, a bad one opens it again. The probe is
+    identified by the token ``probe_due`` hands out, so a slow call started
+    before the trip that finishes while half-open cannot decide for it.
+    """
+
+    def __init__(self, latency_budget: float, window: int = 20, min_calls: int = 5,
+                 failure_rate: float = 0.5, open_for: float = 30.0):
+        self.latency_budget = latency_budget
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.open_for = open_for
+        self.state = CLOSED
+        self.trips = 0
+        self._outcomes = deque(maxlen=window)  # True for a good call
+        self._opened_at = 0.0
+        self._probes = 0  # tokens handed out
+        self._probe = None  # token of the probe in flight while half-open
+
+    def allow(self) -> bool:
+        return self.state == CLOSED
+
+    def probe_due(self) -> Optional[int]:
+        """A probe token once per cooldown while open, else None; the caller then
+        sends one probe and reports its outcome with that token."""
+        if self.state == OPEN and time.monotonic() - self._opened_at >= self.open_for:
+            self.state = HALF_OPEN
+            self._probes += 1
+            self._probe = self._probes
+            return self._probe
+        return None
+
+    def record(self, ok: bool, seconds: float, probe: Optional[int] = None):
+        good = ok and seconds <= self.latency_budget
+        if self.state == HALF_OPEN:
+            if probe is None or probe != self._probe:
+                return  # only the probe decides
+            self._probe = None
+            if good:
+                self.state = CLOSED
+                self._outcomes.clear()
+            else:
+                self._open()
+            return
+        self._outcomes.append(good)
+        failures = self._outcomes.count(False)
+        if (self.state == CLOSED and len(self._outcomes) >= self.min_calls
+                and failures / len(self._outcomes) >= self.failure_rate):
+            self._open()
+
+    def _open(self):
+        self.state = OPEN
+        self.trips += 1
+        self._opened_at = time.monotonic()
+
+    def summary(self) -> dict:
+        return {
+            "state": self.state,
+            "trips": self.trips,
+            "recent_failure_rate": round(self._outcomes.count(False) / len(self._outcomes), 2) if self._outcomes else 0,
+        }
@@ -0,0 +1,85 @@
+import bisect
+import datetime
+import functools
+from typing import List, Optional
+from zoneinfo import ZoneInfo
+
+from midnight_sweeper import zone_name
+
+
+def deadline_ts(value) -> Optional[float]:
+    """A task's deadline as epoch seconds (UTC); naive datetimes and ISO strings are UTC."""
+    if value is None or value == "":
+        return None
+    if isinstance(value, str):
+        value = datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=datetime.timezone.utc)
+    return value.timestamp()
+
+
+@functools.lru_cache(maxsize=None)
+def zone_info(timezone: str) -> ZoneInfo:
+    return ZoneInfo(zone_name(timezone))
+
+
+@functools.lru_cache(maxsize=4096)
+def to_local(ts: float, timezone: str) -> datetime.datetime:
+    """``ts`` in ``timezone``; cached, as the same deadlines are converted for every reminder and query."""
+    return datetime.datetime.fromtimestamp(ts, zone_info(timezone))
+
+
+class DeadlineIndex:
+    """Open tasks' deadlines in a sorted list of ``(epoch seconds, task id)``.
+
+    Range lookups bisect the list, so "due between", "overdue" and "next N"
+    cost O(log n) plus the tasks returned. ``add`` and ``discard`` bisect
+    too and then shift the list in place, which stays cheap well past 100k
+    tasks because the list holds only small tuples.
+    """
+
+    def __init__(self):
+        self._entries = []  # (epoch seconds, task id), ascending
+        self._due = {}  # task id -> epoch seconds of its entry
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def add(self, task_id: int, ts: Optional[float]):
+        """Index ``task_id`` at ``ts``, moving or dropping (``ts`` None) its old entry."""
+        if self._due.get(task_id) == ts:
+            return
+        self.discard(task_id)
+        if ts is not None:
+            bisect.insort(self._entries, (ts, task_id))
+            self._due[task_id] = ts
+
+    def discard(self, task_id: int):
+        ts = self._due.pop(task_id, None)
+        if ts is not None:
+            del self._entries[bisect.bisect_left(self._entries, (ts, task_id))]
+
+    def clear(self):
+        self._entries = []
+        self._due = {}
+
+    def due_at(self, task_id: int) -> Optional[float]:
+        return self._due.get(task_id)
+
+    def between(self, start: float, end: float) -> List[int]:
+        """Ids due at or after ``start`` and before ``end``, soonest first."""
+        lo = bisect.bisect_left(self._entries, (start, -1))
+        hi = bisect.bisect_left(self._entries, (end, -1))
+        return [task_id for _, task_id in self._entries[lo:hi]]
+
+    def before(self, end: float, limit: Optional[int] = None) -> List[int]:
+        """Ids due before ``end``, most overdue first."""
+        hi = bisect.bisect_left(self._entries, (end, -1))
+        if limit is not None:
+            hi = min(hi, limit)
+        return [task_id for _, task_id in self._entries[:hi]]
+
+    def next(self, start: float, n: int) -> List[int]:
+        """The first ``n`` ids due at or after ``start``."""
+        lo = bisect.bisect_left(self._entries, (start, -1))
+        return [task_id for _, task_id in self._entries[lo:lo + n]]
@@ -0,0 +1,160 @@
+"""A local stand-in for the Gemini API with configurable latency and errors.
+
+It answers the REST calls the genai client makes (generateContent,
+streamGenerateContent and cachedContents), so benchmarks exercise the real
+client and gateway without network access or quota. Numbered multi-item
+prompts from the micro-batcher get one numbered line per item.
+
+Run standalone with:  python fake_gemini.py [--port 8765] [--latency 0.3] [--jitter 0.1]
+and point the app at it with POTATODO_GEMINI_BASE_URL=http://127.0.0.1:8765
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import re
+import socket
+import threading
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from google import genai
+from google.genai import types
+
+_NUMBERED_ITEM = re.compile(r"^\s*\d+\.\s", re.MULTILINE)
+
+
+def _prompt_text(body: dict) -> str:
+    return "\n".join(
+        part.get("text", "") for content in body.get("contents", []) for part in content.get("parts", [])
+    )
+
+
+def _usage(prompt: str, reply: str) -> dict:
+    prompt_tokens = len(prompt) // 4 + 1
+    output_tokens = len(reply) // 4 + 1
+    return {
+        "promptTokenCount": prompt_tokens,
+        "candidatesTokenCount": output_tokens,
+        "totalTokenCount": prompt_tokens + output_tokens,
+    }
+
+
+def _candidate(text: str) -> dict:
+    return {"content": {"role": "model", "parts": [{"text": text}]}, "finishReason": "STOP", "index": 0}
+
+
+class FakeGemini:
+    """The fake model: how long it takes, how often it fails, what it says."""
+
+    def __init__(self, latency: float = 0.3, jitter: float = 0.1, error_rate: float = 0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.calls = 0
+        self.errors = 0
+        self._lines = itertools.count(1)
+        self.app = self._build_app()
+
+    def reply(self, prompt: str) -> str:
+        items = len(_NUMBERED_ITEM.findall(prompt))
+        if items > 1:
+            return "\n".join(f"{n}. Spud line {next(self._lines)}" for n in range(1, items + 1))
+        return f"Spud line {next(self._lines)}"
+
+    async def _delay(self):
+        await asyncio.sleep(max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter)))
+
+    def _failed(self) -> bool:
+        self.calls += 1
+        if self.random.random() < self.error_rate:
+            self.errors += 1
+            return True
+        return False
+
+    def _build_app(self) -> FastAPI:
+        app = FastAPI()
+        unavailable = {"error": {"code": 503, "message": "The model is overloaded.", "status": "UNAVAILABLE"}}
+
+        @app.post("/{version}/cachedContents")
+        async def create_cache(version: str, request: Request):
+            body = await request.json()
+            return {"name": "cachedContents/fake-persona", "model": body.get("model"), "expireTime": "2099-01-01T00:00:00Z"}
+
+        @app.post("/{version}/models/{call}")
+        async def generate(version: str, call: str, request: Request):
+            body = await request.json()
+            prompt = _prompt_text(body)
+            _, method = call.split(":", 1)
+            if method == "streamGenerateContent":
+                return StreamingResponse(self._stream(prompt), media_type="text/event-stream")
+            await self._delay()
+            if self._failed():
+                return JSONResponse(unavailable, status_code=503)
+            text = self.reply(prompt)
+            return {"candidates": [_candidate(text)], "usageMetadata": _usage(prompt, text)}
+
+        return app
+
+    async def _stream(self, prompt: str):
+        await self._delay()
+        if self._failed():
+            return
+        text = self.reply(prompt)
+        words = text.split(" ")
+        for n, word in enumerate(words):
+            chunk = {"candidates": [_candidate(word if n == 0 else " " + word)]}
+            if n == len(words) - 1:
+                chunk["usageMetadata"] = _usage(prompt, text)
+            yield f"data: {json.dumps(chunk)}\r\n\r\n"
+            await asyncio.sleep(0.01)
+
+
+class FakeGeminiServer:
+    """Serves a FakeGemini on a free local port from a background thread.
+
+    Use as a context manager; ``client()`` returns a genai client pointed at it.
+    """
+
+    def __init__(self, model: FakeGemini, port: int = 0):
+        self.model = model
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._socket.bind(("127.0.0.1", port))
+        self.url = f"http://127.0.0.1:{self._socket.getsockname()[1]}"
+        self._server = uvicorn.Server(uvicorn.Config(model.app, log_level="warning", lifespan="off", ws="none"))
+        self._thread = threading.Thread(target=self._server.run, kwargs={"sockets": [self._socket]}, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        while not self._server.started:
+            if not self._thread.is_alive():
+                raise RuntimeError("fake Gemini server failed to start")
+            self._thread.join(0.01)
+        return self
+
+    def __exit__(self, *exc):
+        self._server.should_exit = True
+        self._thread.join()
+
+    def client(self) -> genai.Client:
+        return genai.Client(api_key="fake", http_options=types.HttpOptions(base_url=self.url))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.3, help="mean seconds per call")
+    parser.add_argument("--jitter", type=float, default=0.1, help="+/- seconds around the mean")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of calls answered with a 503")
+    args = parser.parse_args()
+    model = FakeGemini(args.latency, args.jitter, args.error_rate)
+    print(f"Fake Gemini on http://127.0.0.1:{args.port}")
+    uvicorn.run(model.app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
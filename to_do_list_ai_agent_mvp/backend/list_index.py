@@ -0,0 +1,133 @@
+import base64
+import bisect
+import datetime
+import heapq
+import itertools
+import json
+import math
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from deadline_index import deadline_ts
+from reminder_scheduler import has_reminder
+
+SORTS = ("created", "deadline", "completion")
+
+
+def list_flags(task: dict) -> Tuple[bool, bool, bool]:
+    """The filterable flags of a task: (completed, has deadline, has reminder)."""
+    return (bool(task["is_completed"]), task.get("deadline") not in (None, ""),
+            has_reminder(task))
+
+
+def created_ts(value) -> float:
+    """A task's creation time as epoch seconds; naive values are server-local time, as tasks used to be stamped."""
+    if value is None or value == "":
+        return 0.0
+    if isinstance(value, str):
+        value = datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+    return value.timestamp()
+
+
+def list_keys(task: dict) -> Tuple[tuple, ...]:
+    """The task's position in every order of ``SORTS``; each key ends with the task id."""
+    created = created_ts(task.get("created_at"))
+    deadline = deadline_ts(task.get("deadline"))
+    return (
+        (created, task["id"]),
+        (math.inf if deadline is None else deadline, created, task["id"]),  # no deadline sorts last
+        (bool(task["is_completed"]), created, task["id"]),  # open tasks first, as the home screen lists them
+    )
+
+
+def encode_cursor(sort: str, descending: bool, key: tuple) -> str:
+    """An opaque cursor resuming ``sort`` (in that direction) after ``key``."""
+    raw = json.dumps([sort, descending, list(key)], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: str, descending: bool) -> tuple:
+    """The key in ``cursor``; ValueError if it is malformed or from another order."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        cursor_sort, cursor_descending, key = json.loads(raw)
+    except (ValueError, TypeError) as error:
+        raise ValueError("malformed cursor") from error
+    if cursor_sort != sort or cursor_descending != descending or not isinstance(key, list) or not key:
+        raise ValueError("cursor is for a different sort order")
+    return tuple(key)
+
+
+class TaskListIndex:
+    """Every task in every list order, split by the filter flags.
+
+    For each sort order there is one sorted list of keys per combination of
+    ``list_flags``, so a filter picks its lists instead of testing tasks, and
+    a page merges those lists from the cursor key (found by bisect) onwards.
+    A page therefore costs O(log n + page size) however long the list is.
+    Keys are unique (they end with the task id), which keeps a cursor stable
+    while tasks are added, completed or deleted between pages.
+    """
+
+    def __init__(self):
+        self._lists: Dict[str, Dict[tuple, list]] = {sort: {} for sort in SORTS}  # sort -> flags -> keys
+        self._entries: Dict[int, tuple] = {}  # task id -> (flags, keys) it is indexed under
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def add(self, task: dict):
+        """Index ``task``, moving it if its flags or keys changed."""
+        entry = (list_flags(task), list_keys(task))
+        if self._entries.get(task["id"]) == entry:
+            return
+        self.discard(task["id"])
+        flags, keys = self._entries[task["id"]] = entry
+        for sort, key in zip(SORTS, keys):
+            bisect.insort(self._lists[sort].setdefault(flags, []), key)
+
+    def discard(self, task_id: int):
+        entry = self._entries.pop(task_id, None)
+        if entry is None:
+            return
+        flags, keys = entry
+        for sort, key in zip(SORTS, keys):
+            keys_in_order = self._lists[sort][flags]
+            del keys_in_order[bisect.bisect_left(keys_in_order, key)]
+
+    def clear(self):
+        self._lists = {sort: {} for sort in SORTS}
+        self._entries = {}
+
+    def page(self, sort: str, flags: Iterable[tuple], limit: int, after: Optional[tuple] = None,
+             descending: bool = False, created: Tuple[float, float] = (-math.inf, math.inf)) -> List[tuple]:
+        """Up to ``limit`` keys of ``sort`` past the cursor key ``after``.
+
+        Only the lists for ``flags`` are read. Keys are limited to tasks
+        created in ``[created[0], created[1])``, by bisecting where the
+        order starts with the creation time and by skipping otherwise (the
+        deadline order), so only that order pays for a narrow range.
+        """
+        start_ts, end_ts = created
+        bounded = start_ts != -math.inf or end_ts != math.inf
+        runs = []
+        for f in flags:
+            keys = self._lists[sort].get(f)
+            if not keys:
+                continue
+            start, end = 0, len(keys)
+            if bounded and sort != "deadline":
+                prefix = (f[0],) if sort == "completion" else ()  # one completion state per list
+                start = bisect.bisect_left(keys, prefix + (start_ts,))
+                end = bisect.bisect_left(keys, prefix + (end_ts,))
+            if after is not None:
+                if descending:
+                    end = min(end, bisect.bisect_left(keys, after))
+                else:
+                    start = max(start, bisect.bisect_right(keys, after))
+            if start < end:
+                indexes = range(end - 1, start - 1, -1) if descending else range(start, end)
+                runs.append(map(keys.__getitem__, indexes))
+        merged = heapq.merge(*runs, reverse=descending)
+        if bounded and sort == "deadline":
+            merged = (key for key in merged if start_ts <= key[-2] < end_ts)
+        return list(itertools.islice(merged, limit))
@@ -0,0 +1,318 @@
+import asyncio
+import random
+import time
+from typing import TYPE_CHECKING, Callable, Optional
+
+from circuit_breaker import CircuitBreaker
+from telemetry import Histogram, StructuredLogger
+
+if TYPE_CHECKING:
+    from google.genai import types
+
+DEFAULT_FALLBACK = "Potato brain is buffering, but I'm still proud of you!"
+PROBE_PROMPT = "Situation: health check. Reply with the single word OK."
+
+log = StructuredLogger("llm_gateway")
+
+
+def resolve_fallback(fallback) -> str:
+    """A fallback is a line, a zero-argument callable producing one, or None for the default."""
+    if fallback is None:
+        return DEFAULT_FALLBACK
+    return fallback() if callable(fallback) else fallback
+
+
+def compact_prompt(text: str) -> str:
+    """Collapse indentation, newlines and runs of spaces into single spaces."""
+    return " ".join(text.split())
+
+
+class TokenUsage:
+    """Running token totals from each response's usage metadata."""
+
+    def __init__(self):
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.output_tokens = 0
+
+    def record(self, metadata):
+        if metadata is None:
+            return
+        self.calls += 1
+        self.prompt_tokens += metadata.prompt_token_count or 0
+        self.cached_tokens += metadata.cached_content_token_count or 0
+        self.output_tokens += metadata.candidates_token_count or 0
+
+    def summary(self) -> dict:
+        return {
+            "calls": self.calls,
+            "prompt_tokens": self.prompt_tokens,
+            "cached_tokens": self.cached_tokens,
+            "output_tokens": self.output_tokens,
+            "avg_prompt_tokens": round(self.prompt_tokens / self.calls, 1) if self.calls else None,
+        }
+
+
+class LLMGateway:
+    """Single async entry point for every Gemini call.
+
+    Calls go through the async genai client, so a slow model never holds a
+    threadpool worker. Concurrency is bounded by a semaphore, each attempt
+    has its own timeout, failed attempts are retried with jittered
+    exponential backoff, and once the overall deadline has passed the caller
+    gets a deterministic fallback line instead of an error.
+
+    Callers never wait longer than ``latency_budget``: past it they get the
+    fallback while the call finishes in the background, and its outcome
+    still feeds the circuit ``breaker``. With ``hedge_after`` set, a call
+    still unanswered after that many seconds is hedged with a second one and
+    the first good reply wins; the other finishes in the background. While the breaker is open the model
+    is not called at all, and a background probe checks for recovery. A
+    fallback may be a callable, so a local line is only produced when it is
+    actually needed.
+
+    The fixed ``system_instruction`` (the persona) is sent as the model's
+    system instruction rather than pasted into every prompt. With
+    ``cache_ttl`` set it is first put in a context cache and referenced by
+    name; if the API refuses (the instruction is below the minimum cacheable
+    size, say) it is sent inline and the cache is retried after ``cache_ttl``.
+    Token counts from every response are totalled in ``usage``, and each
+    call's duration goes into ``call_seconds`` by outcome.
+
+    Pass ``client_factory`` instead of a client to build it on the first
+    model call; ``google.genai`` is only imported at that point, so
+    processes that never generate text skip its import cost.
+    """
+
+    def __init__(
+        self,
+        client,
+        model: str,
+        max_concurrency: int = 32,
+        attempt_timeout: float = 4.0,
+        deadline: float = 8.0,
+        max_retries: int = 2,
+        backoff: float = 0.2,
+        system_instruction: Optional[str] = None,
+        cache_ttl: Optional[int] = None,
+        latency_budget: Optional[float] = None,
+        breaker: Optional[CircuitBreaker] = None,
+        client_factory: Optional[Callable[[], object]] = None,
+        hedge_after: Optional[float] = None,
+    ):
+        self._client = client
+        self.client_factory = client_factory
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.attempt_timeout = attempt_timeout
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.system_instruction = system_instruction
+        self.cache_ttl = cache_ttl
+        self.usage = TokenUsage()
+        self.call_seconds = Histogram(
+            "potatodo_llm_call_seconds", "Model call latency including retries", ("outcome",)
+        )
+        self.budget_misses = 0  # callers handed the fallback at the latency budget
+        self.hedge_after = hedge_after
+        self.hedges = 0  # second calls sent for slow first ones
+        self.hedge_wins = 0  # answers that came from the second call
+        self.latency_budget = latency_budget or deadline
+        self.breaker = breaker or CircuitBreaker(self.latency_budget)
+        self._semaphores = {}  # event loop -> semaphore, since the semaphore is loop-bound
+        self._cached_content = None  # name of the context cache holding the system instruction
+        self._cache_due_at = 0.0  # when to (re)create the context cache
+        self._background = set()  # calls nobody may be awaiting any more (probes, budget misses)
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = self.client_factory()
+        return self._client
+
+    @client.setter
+    def client(self, client):
+        self._client = client
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._semaphores = {loop: semaphore}
+        return semaphore
+
+    async def _config(self) -> Optional["types.GenerateContentConfig"]:
+        if self.system_instruction is None:
+            return None
+        from google.genai import types
+
+        if self.cache_ttl and time.monotonic() >= self._cache_due_at:
+            self._cache_due_at = time.monotonic() + self.cache_ttl
+            try:
+                cache = await asyncio.wait_for(
+                    self.client.aio.caches.create(
+                        model=self.model,
+                        config=types.CreateCachedContentConfig(
+                            system_instruction=self.system_instruction, ttl=f"{self.cache_ttl}s"
+                        ),
+                    ),
+                    self.attempt_timeout,
+                )
+                self._cached_content = cache.name
+                self._cache_due_at -= 60  # renew a minute before it expires
+            except Exception as e:
+                self._cached_content = None
+                log.warning("context cache unavailable, sending the system instruction inline", error=type(e).__name__)
+        if self._cached_content:
+            return types.GenerateContentConfig(cached_content=self._cached_content)
+        return types.GenerateContentConfig(system_instruction=self.system_instruction)
+
+    async def generate(self, prompt: str, fallback=None) -> str:
+        """Return the model's text for ``prompt``, or ``fallback`` past the latency budget."""
+        if not self._available():
+            return resolve_fallback(fallback)
+        give_up_at = time.monotonic() + self.latency_budget
+        first = self._spawn(prompt)
+        pending = {first}
+        hedged = self.hedge_after is None
+        error = None
+        while pending:
+            wait = give_up_at - time.monotonic()
+            if not hedged:
+                wait = min(wait, self.hedge_after)
+            done, pending = await asyncio.wait(pending, timeout=max(wait, 0), return_when=asyncio.FIRST_COMPLETED)
+            for call in done:
+                if call.exception() is None:
+                    if call is not first:
+                        self.hedge_wins += 1
+                    return call.result()
+                error = call.exception()
+            if done:
+                continue
+            if hedged or time.monotonic() >= give_up_at:
+                self.budget_misses += 1
+                log.warning("no answer within the latency budget, using the fallback", budget=self.latency_budget)
+                return resolve_fallback(fallback)
+            # Slow, not failed: race a second call against it
+            hedged = True
+            self.hedges += 1
+            pending.add(self._spawn(prompt))
+        log.error("model call failed", error=type(error).__name__, detail=str(error))
+        return resolve_fallback(fallback)
+
+    def _spawn(self, prompt: str, probe: Optional[int] = None) -> asyncio.Future:
+        """Start a call that keeps running (and reporting to the breaker) if its caller stops waiting."""
+        call = asyncio.ensure_future(self._call(prompt, probe))
+        self._background.add(call)  # the loop only holds it weakly
+        call.add_done_callback(self._background.discard)
+        call.add_done_callback(_consume)
+        return call
+
+    def _available(self) -> bool:
+        if self.breaker.allow():
+            return True
+        probe = self.breaker.probe_due()
+        if probe is not None:
+            self._spawn(PROBE_PROMPT, probe)
+        return False
+
+    async def _call(self, prompt: str, probe: Optional[int] = None) -> str:
+        """One model call within the overall deadline, with its outcome reported to the breaker."""
+        started = time.monotonic()
+        try:
+            text = await asyncio.wait_for(self._generate_bounded(prompt, started + self.deadline), self.deadline)
+        except Exception as e:
+            self._record(False, time.monotonic() - started, "timeout" if isinstance(e, asyncio.TimeoutError) else "error",
+                         probe)
+            raise
+        self._record(True, time.monotonic() - started, "ok", probe)
+        return text
+
+    def _record(self, ok: bool, seconds: float, outcome: str, probe: Optional[int] = None):
+        self.breaker.record(ok, seconds, probe)
+        self.call_seconds.observe(seconds, outcome)
+
+    async def _generate_bounded(self, prompt: str, give_up_at: float) -> str:
+        async with self._semaphore():
+            return await self._generate_with_retries(prompt, give_up_at)
+
+    async def _generate_with_retries(self, prompt: str, give_up_at: float) -> str:
+        config = await self._config()
+        attempt = 0
+        while True:
+            try:
+                response = await asyncio.wait_for(
+                    self.client.aio.models.generate_content(model=self.model, contents=prompt, config=config),
+                    self.attempt_timeout,
+                )
+                self.usage.record(getattr(response, "usage_metadata", None))
+                if not response.text:
+                    raise ValueError("Model returned an empty response")
+                return response.text
+            except Exception:
+                attempt += 1
+                # Full jitter keeps retries from many requests from arriving in lockstep
+                delay = random.uniform(0, self.backoff * 2 ** (attempt - 1))
+                if attempt > self.max_retries or time.monotonic() + delay >= give_up_at:
+                    raise
+                await asyncio.sleep(delay)
+
+    async def stream(self, prompt: str, fallback=None):
+        """Yield the model's text chunk by chunk as it arrives.
+
+        Streaming is for time-to-first-character, so there are no retries:
+        if the stream cannot start within ``attempt_timeout`` the fallback
+        line is yielded instead, and an error mid-stream ends it with the
+        text produced so far. While the breaker is open the fallback is
+        yielded straight away, and the wait for the first chunk is capped by
+        the latency budget.
+        """
+        if not self._available():
+            yield resolve_fallback(fallback)
+            return
+        started = time.monotonic()
+        give_up_at = started + self.deadline
+        async with self._semaphore():
+            try:
+                config = await self._config()
+                chunks = await asyncio.wait_for(
+                    self.client.aio.models.generate_content_stream(model=self.model, contents=prompt, config=config),
+                    self.attempt_timeout,
+                )
+                chunks = chunks.__aiter__()
+                first = await asyncio.wait_for(
+                    chunks.__anext__(), min(self.attempt_timeout, started + self.latency_budget - time.monotonic())
+                )
+            except Exception as e:
+                log.error("model stream failed to start", error=type(e).__name__, detail=str(e))
+                self._record(False, time.monotonic() - started, "timeout" if isinstance(e, asyncio.TimeoutError) else "error")
+                yield resolve_fallback(fallback)
+                return
+            self._record(True, time.monotonic() - started, "ok")
+
+            # Usage metadata on the last chunk carries the totals for the whole stream
+            usage = getattr(first, "usage_metadata", None)
+            try:
+                if first.text:
+                    yield first.text
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(chunks.__anext__(), give_up_at - time.monotonic())
+                    except StopAsyncIteration:
+                        return
+                    except Exception as e:
+                        log.error("model stream ended early", error=type(e).__name__, detail=str(e))
+                        return
+                    usage = getattr(chunk, "usage_metadata", None) or usage
+                    if chunk.text:
+                        yield chunk.text
+            finally:
+                self.usage.record(usage)
+
+
+def _consume(task):
+    if not task.cancelled():
+        task.exception()  # a failure is already recorded by the breaker; this just marks it retrieved
@@ -0,0 +1,186 @@
+import asyncio
+import heapq
+import itertools
+import time
+from collections import Counter, deque
+
+from llm_gateway import resolve_fallback
+
+# Priority classes, most urgent first
+INTERACTIVE = 0  # the line for a task the user just completed
+REMINDER = 1
+NUDGE = 2  # progress check-ins
+CELEBRATION = 3
+BACKGROUND = 4  # pool refills and pre-generation nobody is waiting on yet
+
+PRIORITY_NAMES = {
+    INTERACTIVE: "interactive",
+    REMINDER: "reminder",
+    NUDGE: "nudge",
+    CELEBRATION: "celebration",
+    BACKGROUND: "background",
+}
+
+DEFAULT_QUEUE_LIMITS = {INTERACTIVE: 512, REMINDER: 128, NUDGE: 32, CELEBRATION: 32, BACKGROUND: 16}
+DEFAULT_DEADLINES = {INTERACTIVE: 3.0, REMINDER: 30.0, NUDGE: 5.0, CELEBRATION: 5.0, BACKGROUND: 60.0}
+
+
+def estimate_tokens(prompt: str, output_tokens: int = 30) -> int:
+    return len(prompt) // 4 + output_tokens
+
+
+class _TokenBucket:
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def take(self, amount: float) -> bool:
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.level < amount:
+            return False
+        self.level -= amount
+        return True
+
+    def refund(self, amount: float):
+        self.level = min(self.capacity, self.level + amount)
+
+
+class LLMWorkScheduler:
+    """Admission control and priority queueing in front of every model call.
+
+    At most ``max_in_flight`` generations run at once. Work that cannot start
+    straight away waits in one heap ordered by priority class, then arrival.
+    Work is shed to its fallback (a cached or local line) instead of queued
+    when its class's queue is full, when its user is over their per-minute
+    request or token budget, or when it is still queued at its class
+    deadline, so low-priority bursts never push out interactive work.
+    """
+
+    def __init__(self, max_in_flight: int = 64, queue_limits=None, deadlines=None,
+                 user_requests_per_minute: float = 30, user_tokens_per_minute: float = 8000):
+        self.max_in_flight = max_in_flight
+        self.queue_limits = queue_limits or DEFAULT_QUEUE_LIMITS
+        self.deadlines = deadlines or DEFAULT_DEADLINES
+        self.user_requests_per_minute = user_requests_per_minute
+        self.user_tokens_per_minute = user_tokens_per_minute
+        self._queue = []  # (priority, seq, future)
+        self._depth = Counter()  # priority -> queued entries
+        self._seq = itertools.count()
+        self._in_flight = 0
+        self._budgets = {}  # user id -> (request bucket, token bucket)
+        self.shed = Counter()  # "class:reason" -> count
+        self._waits = {priority: deque(maxlen=500) for priority in PRIORITY_NAMES}
+
+    async def run(self, work, priority: int = BACKGROUND, user_id=None, fallback=None, cost: int = 0):
+        """Run ``work()`` (a coroutine factory) when admitted, else return the fallback line."""
+        reason = await self._admit(priority, user_id, cost)
+        if reason is not None:
+            return self._shed(priority, reason, fallback)
+        try:
+            return await work()
+        finally:
+            self._release()
+
+    async def stream(self, chunks, priority: int = BACKGROUND, user_id=None, fallback=None, cost: int = 0):
+        """Yield from ``chunks()`` (an async iterator factory) when admitted, holding the slot
+        until the stream ends or is closed; a shed stream yields just the fallback line."""
+        reason = await self._admit(priority, user_id, cost)
+        if reason is not None:
+            yield self._shed(priority, reason, fallback)
+            return
+        source = chunks()
+        try:
+            async for chunk in source:
+                yield chunk
+        finally:
+            try:
+                if hasattr(source, "aclose"):
+                    await source.aclose()
+            finally:
+                self._release()
+
+    async def _admit(self, priority: int, user_id, cost: int):
+        """Take a slot for work of ``priority``, waiting in the queue if need be.
+
+        Returns None once the slot is held (the caller must ``_release`` it),
+        or the reason the work is shed instead.
+        """
+        # Capacity first, so work shed for a full queue doesn't use up its user's budget
+        starts_now = self._in_flight < self.max_in_flight and not self._queue
+        if not starts_now and self._depth[priority] >= self.queue_limits[priority]:
+            return "queue_full"
+        if user_id is not None and not self._within_budget(user_id, cost):
+            return "budget"
+
+        queued_at = time.monotonic()
+        if starts_now:
+            self._in_flight += 1
+        else:
+            future = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._queue, (priority, next(self._seq), future))
+            self._depth[priority] += 1
+            try:
+                await asyncio.wait_for(asyncio.shield(future), self.deadlines[priority])
+            except asyncio.TimeoutError:
+                self._abandon(priority, future)
+                return "deadline"
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    self._release()  # it was handed a slot just as the caller went away
+                else:
+                    self._abandon(priority, future)
+                raise
+
+        self._waits[priority].append(time.monotonic() - queued_at)
+        return None
+
+    def _within_budget(self, user_id, cost: int) -> bool:
+        budget = self._budgets.get(user_id)
+        if budget is None:
+            budget = self._budgets[user_id] = (
+                _TokenBucket(self.user_requests_per_minute),
+                _TokenBucket(self.user_tokens_per_minute),
+            )
+        requests, tokens = budget
+        if not requests.take(1):
+            return False
+        if not tokens.take(cost):
+            requests.refund(1)
+            return False
+        return True
+
+    def _abandon(self, priority: int, future):
+        """Give up a queued entry; it stays in the heap until popped, but no longer counts as queued."""
+        future.cancel()
+        self._depth[priority] -= 1
+
+    def _shed(self, priority: int, reason: str, fallback):
+        self.shed[f"{PRIORITY_NAMES[priority]}:{reason}"] += 1
+        return resolve_fallback(fallback)
+
+    def _release(self):
+        self._in_flight -= 1
+        while self._queue and self._in_flight < self.max_in_flight:
+            priority, _, future = heapq.heappop(self._queue)
+            if future.done():  # timed out or cancelled while queued, and already uncounted
+                continue
+            self._depth[priority] -= 1
+            self._in_flight += 1
+            future.set_result(True)
+
+    def stats(self) -> dict:
+        waits = {}
+        for priority, samples in self._waits.items():
+            ordered = sorted(samples)
+            if ordered:
+                waits[PRIORITY_NAMES[priority]] = round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000, 2)
+        return {
+            "in_flight": self._in_flight,
+            "queued": {PRIORITY_NAMES[p]: n for p, n in self._depth.items() if n},
+            "shed": dict(self.shed),
+            "queue_wait_p99_ms": waits,
+        }
@@ -0,0 +1,93 @@
+"""Toggle latency and throughput as concurrent users are added, against the app in-process.
+
+For each user count in the sweep, every user gets a few tasks and then all
+users toggle them concurrently. The model is replaced with a fake so only
+the request path is measured. Each row reports per-request toggle latency
+and overall toggles per second; on one event loop throughput should hold
+flat as users are added while latency stays put, so a p50 that grows with
+the user count means requests are queueing (e.g. on the threadpool) rather
+than doing more work. For scaling across cores see benchmark_workers.py.
+
+After each step every user's partition is checked: each task must have been
+toggled exactly the number of times it was requested, with no lost updates.
+
+Run with:  python load_test_users.py [users ...]   (default sweep: 10 100 1000)
+"""
+import asyncio
+import os
+import sys
+import time
+
+import httpx
+
+os.environ.setdefault("GOOGLE_API_KEY", "load-test")
+
+import main  # noqa: E402
+
+SWEEP = [int(arg) for arg in sys.argv[1:]] or [10, 100, 1_000]
+TASKS_PER_USER = 3
+TOGGLES_PER_TASK = 5
+
+
+async def fake_generate(task_status, fallback=None, **options):
+    return "Mashed it!"
+
+
+async def run_user(http, user_id, latencies):
+    headers = {"X-User-Id": user_id}
+    for n in range(TASKS_PER_USER):
+        await http.post("/tasks/", json={"description": f"Task {n}"}, headers=headers)
+
+    async def toggle(task_id):
+        start = time.perf_counter()
+        response = await http.post(f"/tasks/{task_id}/complete", headers=headers)
+        latencies.append(time.perf_counter() - start)
+        response.raise_for_status()
+
+    await asyncio.gather(*(
+        toggle(task_id)
+        for task_id in range(1, TASKS_PER_USER + 1)
+        for _ in range(TOGGLES_PER_TASK)
+    ))
+
+
+async def run_step(http, users):
+    """One sweep step with ``users`` fresh users; returns (row, users with lost updates)."""
+    prefix = f"load-{users}-"
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*(run_user(http, f"{prefix}{n}", latencies) for n in range(users)))
+    elapsed = time.perf_counter() - start
+
+    # An odd number of toggles leaves every task completed
+    expected = TASKS_PER_USER if TOGGLES_PER_TASK % 2 else 0
+    lost = [
+        user.user_id for user in main.users
+        if user.user_id.startswith(prefix) and user.tasks.completed_count != expected
+    ]
+
+    latencies.sort()
+    row = (f"{users:>6} {len(latencies):>8} {elapsed:>9.2f} {len(latencies) / elapsed:>10.0f} "
+           f"{latencies[len(latencies) // 2] * 1e3:>9.2f} {latencies[int(len(latencies) * 0.95)] * 1e3:>9.2f} "
+           f"{len(lost):>5}")
+    return row, lost
+
+
+async def run():
+    main.generate_reminder = fake_generate
+    main.response_cache.generate = fake_generate
+    main.speculative.generate = fake_generate
+
+    print(f"{'users':>6} {'toggles':>8} {'elapsed s':>9} {'toggles/s':>10} {'p50 ms':>9} {'p95 ms':>9} {'lost':>5}")
+    failed = False
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+        for users in SWEEP:
+            row, lost = await run_step(http, users)
+            print(row, flush=True)
+            failed = failed or bool(lost)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(run()))
@@ -0,0 +1,123 @@
+import random
+import re
+from collections import deque
+
+# Situation type -> phrases that identify it in a prompt, checked in order
+SITUATIONS = [
+    ("batch", ("in one go",)),
+    ("all_done", ("all of their tasks", "all their tasks", "last task", "perfect day", "all tasks")),
+    ("unchecked", ("unchecked", "undoing")),
+    ("reminder", ("remind", "is due at")),
+    ("no_tasks", ("no tasks",)),
+    ("zero_done", ("zero",)),
+    ("less_than_half", ("less than half",)),
+    ("more_than_half", ("more than half",)),
+    ("quest", ("daily quest",)),
+    ("completed", ("completed", "finished")),
+]
+
+WORDS = {
+    "spud": ["spud", "tater", "couch potato", "hash brown", "baked potato"],
+    "dish": ["fries", "mash", "hash browns", "tater tots", "wedges", "chips"],
+    "feeling": ["proud", "crispy", "golden", "buttery", "starchy"],
+    "cheer": ["Spud-tacular", "Tater-rific", "Fry-tastic", "Mash-terful", "Un-peel-ievable"],
+}
+
+TEMPLATES = {
+    "completed": [
+        "{cheer}! '{task}' is done and I'm feeling {feeling}!",
+        "You mashed '{task}'! This {spud} salutes you.",
+        "'{task}' done? I'm so {feeling} I could turn into {dish}!",
+        "{cheer}! '{task}' got peeled, boiled and served!",
+    ],
+    "all_done": [
+        "{cheer}! Every task done, I'm {feeling} enough to become {dish}!",
+        "ALL DONE! This {spud} is crying starch tears of joy!",
+        "Task list cleared! Someone fry me, I'm too {feeling}!",
+        "{cheer}! Zero tasks left, 100% golden {spud} energy!",
+    ],
+    "unchecked": [
+        "You unchecked '{task}'? My eyes are sprouting in shock.",
+        "Un-doing '{task}'? Even {dish} don't go back in the fryer.",
+        "'{task}' is back on the menu. This {spud} is confused.",
+    ],
+    "reminder": [
+        "Hey! '{task}' is waiting. Don't leave me half-baked!",
+        "Psst, '{task}' time! This {spud} believes in you.",
+        "Don't forget '{task}', or I'll turn into sad {dish}.",
+    ],
+    "no_tasks": [
+        "No tasks? Even a {spud} has plans. Add one?",
+        "Empty list! Want to give this {spud} something to cheer?",
+        "Nothing to do? I'm starting to feel like plain mash.",
+    ],
+    "zero_done": [
+        "Zero tasks done? I've aged three potato years waiting.",
+        "Nothing checked yet... this {spud} is slowly going soft.",
+        "Still zero? I'm one sigh away from becoming {dish}.",
+    ],
+    "less_than_half": [
+        "Less than half done. Come on, don't leave me half-baked!",
+        "Some progress! Now finish before I turn into cold {dish}.",
+        "A few down! This {spud} needs you to keep frying.",
+    ],
+    "more_than_half": [
+        "Over halfway! I'm getting {feeling} over here!",
+        "{cheer}! More than half done, keep that oil hot!",
+        "Past halfway, this {spud} can smell the {dish}!",
+    ],
+    "quest": [
+        "Daily quest done! {cheer}! Now let's tackle the rest!",
+        "Quest complete! This {spud} is {feeling}, keep rolling!",
+    ],
+    "batch": [
+        "A whole batch at once? {cheer}, you're a {dish} factory!",
+        "Bulk mode! This {spud} can barely keep up!",
+    ],
+    "general": [
+        "{cheer}! This {spud} is {feeling} of you!",
+        "Keep going! I'm feeling extra {feeling} today.",
+    ],
+}
+
+# A quoted task name; quotes only count at word edges, so "Buy Mom's gift" stays whole
+_QUOTED = re.compile(r"""(?<!\w)(['"])(.+?)\1(?!\w)""")
+
+
+def situation_type(prompt: str) -> str:
+    text = prompt.lower()
+    for name, phrases in SITUATIONS:
+        if any(phrase in text for phrase in phrases):
+            return name
+    return "general"
+
+
+class LocalJokeGenerator:
+    """Offline potato lines for when the model is slow or down.
+
+    A small template grammar in the persona's style: the prompt is matched
+    to a situation type, a template for that type is picked and its slots
+    are filled from word lists (the task name comes from the quoted text in
+    the prompt). Recently served lines are remembered so the same line is
+    not handed out twice in a row.
+    """
+
+    def __init__(self, memory: int = 50, seed=None):
+        self._recent = deque(maxlen=memory)
+        self._random = random.Random(seed)
+
+    def generate(self, prompt: str, max_chars: int = 75) -> str:
+        kind = situation_type(prompt)
+        quoted = _QUOTED.search(prompt)
+        task = quoted.group(2).strip() if quoted else "that task"
+        if len(task) > 24:
+            task = task[:21].rstrip() + "..."
+
+        line = None
+        for _ in range(10):
+            template = self._random.choice(TEMPLATES[kind])
+            line = template.format(task=task, **{slot: self._random.choice(words) for slot, words in WORDS.items()})
+            if len(line) <= max_chars and line not in self._recent:
+                break
+        self._recent.append(line)
+        return line
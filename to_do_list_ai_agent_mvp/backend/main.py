@@ -1,17 +1,63 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field
-from fastapi import HTTPException, Path
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from pydantic import BaseModel, Field, model_validator
+from fastapi import Depends, Header, HTTPException, Path, Query, Request
+import asyncio
 import datetime
-from typing import Optional
+import math
+import time
+from contextlib import asynccontextmanager
+from typing import List, Literal, Optional
 from zoneinfo import ZoneInfo
-from google import genai
 from dotenv import load_dotenv
 import os
+from user_state import UserRegistry, UserState
+from llm_gateway import LLMGateway, compact_prompt
+from llm_scheduler import BACKGROUND, CELEBRATION, INTERACTIVE, NUDGE, REMINDER, LLMWorkScheduler, estimate_tokens
+from micro_batcher import MicroBatcher
+from local_jokes import LocalJokeGenerator
+from speculative import SpeculativeLines
+from response_cache import ResponseCache, count_bucket, streak_bucket
+from message_channel import MessageHub
+from streaming import TTFCRecorder, once, stream_message
+from storage import open_storage
+from activity_log import CHECK_IN, MAINTAINED, MAX_HISTORY_DAYS, PUSHED, QUEST_COMPLETE, advance_streak
+from reminder_scheduler import ReminderScheduler, reminder_due_at
+from midnight_sweeper import MidnightSweeper, due_for_reset
+from deadline_index import deadline_ts, to_local, zone_info
+from list_index import decode_cursor, encode_cursor
+from telemetry import RequestMetrics, StructuredLogger, TelemetryMiddleware, TracedRoute, render_samples, span
 
 load_dotenv()
 api_key = os.getenv("GOOGLE_API_KEY")
-app = FastAPI()
+
+# Set POTATODO_DB_PATH to keep state in SQLite across restarts; in-memory otherwise.
+# Add POTATODO_MULTI_WORKER=1 to run several workers (uvicorn --workers N) on that database
+storage = open_storage()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    for user_id in storage.user_ids():
+        users.get(user_id)
+    reminder_scheduler.rebuild(
+        ((user.user_id, task["id"]), task) for user in users for task in user.tasks
+    )
+    scheduler_task = asyncio.create_task(reminder_scheduler.run(scheduled_task))
+    sweeper_task = asyncio.create_task(midnight_sweeper.run(users))
+    yield
+    scheduler_task.cancel()
+    sweeper_task.cancel()
+    storage.close()
+
+app = FastAPI(lifespan=lifespan)
+# Every route reports validation, handler and serialization spans
+app.router.route_class = TracedRoute
+
+log = StructuredLogger("main")
+request_metrics = RequestMetrics()
+app.add_middleware(TelemetryMiddleware, metrics=request_metrics)
 
 # Add CORS middleware for Electron app
 app.add_middleware(
@@ -27,23 +73,20 @@ class Task(BaseModel):
     is_completed: bool = False
     deadline: Optional[datetime.datetime] = Field(default=None)
     reminder_minutes: Optional[int] = Field(default=None)
-    created_at: Optional[datetime.datetime] = Field(default_factory=datetime.datetime.now)  # ADD THIS
+    created_at: Optional[datetime.datetime] = Field(default_factory=lambda: datetime.datetime.now(datetime.timezone.utc))
 
 
 def convert_to_user_timezone(dt, user_timezone="UTC"):
-    if isinstance(dt, str):
-        dt = datetime.datetime.fromisoformat(dt.replace('Z', '+00:00'))
-    if dt.tzinfo is None:
-        dt = dt.replace(tzinfo=ZoneInfo("UTC"))
-    return dt.astimezone(ZoneInfo(user_timezone))
+    return to_local(deadline_ts(dt), user_timezone)
 
 class User(BaseModel):
-    id: int = 1
+    id: str = "1"
     current_streak: int = 0
     longest_streak: int = 0
     total_tasks_completed: int = 0
     last_activity_date: Optional[str] = None
     last_streak_date: Optional[str] = None  # NEW: Track when streak was last incremented
+    last_reset_date: Optional[str] = None  # local day the tasks were last reset for
     timezone: str = "UTC"
 
 class DailyQuest(BaseModel):
@@ -53,14 +96,97 @@ class DailyQuest(BaseModel):
     created_date: str
     last_completed_date: Optional[str] = None
 
-# Global variables
-user_stats = User()
-daily_quests = []
-todo_list = []
+# Per-user state: each user key resolves to its own partition of tasks, quest and
+# stats (loaded from storage, which is a no-op unless persistence is enabled)
+DEFAULT_USER_ID = "1"
+
+def load_user_stats(user_id, saved):
+    return User(**saved) if saved else User(id=user_id)
+
+def reschedule_reminders(user, old_tasks):
+    """After another worker changed ``user``, schedule reminders from the reloaded tasks"""
+    for task in old_tasks:
+        reminder_scheduler.cancel((user.user_id, task["id"]))
+    for task in user.tasks:
+        reminder_scheduler.schedule((user.user_id, task["id"]), task)
+    midnight_sweeper.track(user.user_id, user.stats.timezone)
+
+def reset_day(user: UserState, today: datetime.date, closing_day: Optional[datetime.date] = None):
+    """Archive and clear ``user``'s tasks and un-check their quest, starting ``today``
+    afresh; callers hold ``user.lock``. Returns (tasks cleared, quest reset)."""
+    tasks = user.tasks.all()
+    if tasks or user.quests:
+        day = (closing_day or today).isoformat()
+        user.storage.archive_day(day, {"tasks": tasks, "quests": user.quests})
+        user.tasks.archive(day)  # still found by search
+
+    # Clear all tasks
+    for task in tasks:
+        reminder_scheduler.cancel((user.user_id, task["id"]))
+        speculative.discard((user.user_id, task["id"]))
+    user.tasks.clear()
+
+    # Clear/uncheck daily quest
+    if user.quests:
+        user.quests[0]["is_completed"] = False
+        user.quests[0]["completed_at"] = None
+        user.save_quests()
+
+    user.stats.last_reset_date = today.isoformat()
+    user.save_stats()
+    return len(tasks), bool(user.quests)
+
+def close_day(user: UserState, today: datetime.date):
+    """The reset at the start of ``today``: yesterday's tasks are archived under yesterday"""
+    return reset_day(user, today, closing_day=today - datetime.timedelta(days=1))
+
+# Resets each user's tasks and quest at their own local midnight
+midnight_sweeper = MidnightSweeper(close_day)
 
-def yesterday_string():
-    yesterday = datetime.datetime.now() - datetime.timedelta(days=1)
-    return yesterday.strftime("%Y-%m-%d")
+users = UserRegistry(storage, load_user_stats, on_reload=reschedule_reminders,
+                     on_create=lambda user: midnight_sweeper.track(user.user_id, user.stats.timezone))
+
+async def off_loop(fn, *args):
+    """``fn(*args)`` from async code. When workers share the database, looking a
+    user up can wait on another worker's write transaction (and reload the
+    partition), so there it runs on a worker thread instead of stalling the
+    event loop; otherwise it is a dict lookup."""
+    if storage.shared:
+        return await asyncio.to_thread(fn, *args)
+    return fn(*args)
+
+async def current_user(x_user_id: str = Header(default=DEFAULT_USER_ID)) -> UserState:
+    """Resolve the caller's partition from the X-User-Id header (the desktop app is user "1").
+    Async, so a lookup of an in-memory partition doesn't cost every request a threadpool hop."""
+    return await off_loop(users.get, x_user_id)
+
+async def run_locked(user: UserState, fn, *args):
+    """``fn(*args)`` under ``user.lock``, never waiting for the lock on the event loop.
+
+    Sync handlers hold user locks on threadpool threads (a read of a big list
+    included), so waiting for one on the loop would stall every user, not just
+    this one. When the lock is free it is taken without blocking and the short
+    critical section runs right here; when another thread holds it, or taking
+    it starts a database transaction (workers sharing state), it is waited for
+    on a worker thread.
+    """
+    if not storage.shared and user.lock.acquire(blocking=False):
+        try:
+            return fn(*args)
+        finally:
+            user.lock.release()
+
+    def locked():
+        with user.lock:
+            return fn(*args)
+    return await asyncio.to_thread(locked)
+
+def detached(tasks) -> list:
+    """Copies of task dicts, to encode after ``user.read_lock`` is released (task fields are immutable values)"""
+    return [dict(task) for task in tasks]
+
+# AI lines for task mutations are delivered after the response, over /events
+message_hub = MessageHub()
 
 def today_string():
     return datetime.datetime.now().strftime("%Y-%m-%d")
@@ -70,8 +196,7 @@ class DailyQuestCreate(BaseModel):
     quest_name: str
 
 @app.post("/daily-quests/")
-def create_daily_quest(quest_data: DailyQuestCreate):
-    daily_quests.clear()
+def create_daily_quest(quest_data: DailyQuestCreate, user: UserState = Depends(current_user)):
     quest_dict = {
         "id": 1,
         "quest_name": quest_data.quest_name,
@@ -79,71 +204,216 @@ def create_daily_quest(quest_data: DailyQuestCreate):
         "created_date": datetime.datetime.now().strftime("%Y-%m-%d"),
         "last_completed_date": None
     }
-    daily_quests.append(quest_dict)
+    with user.lock:
+        user.quests.clear()
+        user.quests.append(quest_dict)
+        user.save_quests()
     return {"message": "Daily quest created!", "quest": quest_dict}
 
 @app.get("/daily-quests/")
-def get_daily_quest():
-    today = datetime.datetime.now().strftime("%Y-%m-%d")
-    if daily_quests:
-        quest = daily_quests[0]
-        if quest.get("last_completed_date") != today:
-            quest["is_completed"] = False
-        return {"daily_quest": quest}
-    return {"daily_quest": None}
+def get_daily_quest(user: UserState = Depends(current_user)):
+    with user.read_lock:
+        return {"daily_quest": current_quest(user)}
+
+def current_quest(user: UserState):
+    """Today's quest, unchecked if it was last completed on an earlier day; callers hold
+    ``user.lock`` or ``user.read_lock`` (the uncheck is a rare write, so it may go write-behind)"""
+    if not user.quests:
+        return None
+    quest = user.quests[0]
+    if quest.get("last_completed_date") != user.now().date().isoformat() and quest["is_completed"]:
+        quest["is_completed"] = False
+        user.save_quests()
+    return quest
 
 @app.patch("/daily-quests/complete")
-def complete_daily_quest():
-    today = datetime.datetime.now().strftime("%Y-%m-%d")
-    
-    if daily_quests:
-        quest = daily_quests[0]
-        quest["is_completed"] = True
-        quest["last_completed_date"] = today
-        
-        # FIXED: Better logic for daily quest completion
-        incomplete_tasks = [t for t in todo_list if not t["is_completed"]]
-        total_tasks = len(todo_list)
-        completed_tasks = len([t for t in todo_list if t["is_completed"]])
-        
-        if incomplete_tasks:
-            quest_context = f"User completed daily quest '{quest['quest_name']}'! {completed_tasks}/{total_tasks} regular tasks done. Encourage them to tackle their remaining tasks. Write ONE encouraging sentence under 75 characters."
+async def complete_daily_quest(stream: bool = False, user: UserState = Depends(current_user)):
+    """Complete today's quest. With ``stream`` the AI line is left to /stream/daily-quest
+    (``message_stream``) so the client can type it out as it arrives."""
+    if user.quests:
+        quest, remaining_tasks, total_tasks, completed_tasks = await run_locked(user, mark_quest_completed, user)
+
+        if stream:
+            ai_response = None
         else:
-            quest_context = f"User completed daily quest '{quest['quest_name']}' and all {total_tasks} tasks are done! Perfect! Write ONE celebration sentence under 75 characters."
-        
-        ai_response = generate_reminder(quest_context)
+            quest_context, bucket = quest_line_prompt(quest, completed_tasks, total_tasks, remaining_tasks)
+            if bucket is None:
+                ai_response = await generate_reminder(quest_context, priority=INTERACTIVE, user_id=user.user_id)
+            else:
+                # Fixed situation, so it is answered from the pre-generated pool
+                ai_response = await response_cache.get(quest_context, bucket=bucket,
+                                                       priority=INTERACTIVE, user_id=user.user_id)
         
         return {
             "message": "Daily quest completed!",
             "quest": quest,
             "ai_message": ai_response,
-            "remaining_tasks": len(incomplete_tasks),
+            "message_stream": "/stream/daily-quest" if stream else None,
+            "remaining_tasks": remaining_tasks,
             "progress": f"{completed_tasks}/{total_tasks}"
         }
     
     return {"error": "No daily quest found"}
 
+def mark_quest_completed(user: UserState):
+    """Complete today's quest; callers hold ``user.lock``. Returns the quest and task counts."""
+    today = user.now().date().isoformat()
+    quest = user.quests[0]
+    if not (quest["is_completed"] and quest.get("last_completed_date") == today):
+        user.record(QUEST_COMPLETE)
+    quest["is_completed"] = True
+    quest["last_completed_date"] = today
+    user.save_quests()
+
+    # FIXED: Better logic for daily quest completion
+    return quest, user.tasks.remaining_count, user.tasks.total_count, user.tasks.completed_count
+
+def quest_line_prompt(quest, completed_tasks, total_tasks, remaining_tasks):
+    """The prompt for the line after completing ``quest``, and its pool bucket when the situation is fixed (else None)"""
+    if remaining_tasks:
+        return (f"User completed daily quest '{quest['quest_name']}'! {completed_tasks}/{total_tasks} regular tasks done. Encourage them to tackle their remaining tasks. Write ONE encouraging sentence under 75 characters.",
+                None)
+    return (f"User completed their daily quest and all of their tasks ({count_bucket(total_tasks)}) are done! Perfect! Write ONE celebration sentence under 75 characters.",
+            count_bucket(total_tasks))
+
 
 @app.post("/onboarding")
-def set_timezone(timezone: str):
-    user_stats.timezone = timezone
+def set_timezone(timezone: str, user: UserState = Depends(current_user)):
+    with user.lock:
+        user.stats.timezone = timezone
+        user.save_stats()
+    midnight_sweeper.track(user.user_id, timezone)
     return {"message": f"Timezone set to {timezone}"}
 
+DEFAULT_PAGE_SIZE = 50
+
 @app.get("/tasks/")
-def view_tasks():
-    return todo_list
+def view_tasks(request: Request, since: Optional[int] = None,
+               sort: Optional[Literal["created", "deadline", "completion"]] = None, descending: bool = False,
+               limit: Optional[int] = Query(None, ge=1, le=500), cursor: Optional[str] = None,
+               completed: Optional[bool] = None, has_deadline: Optional[bool] = None,
+               has_reminder: Optional[bool] = None, created_from: Optional[datetime.datetime] = None,
+               created_before: Optional[datetime.datetime] = None, user: UserState = Depends(current_user)):
+    """The task list, or with ``since`` only what changed after that version.
+
+    With any of ``sort``, ``limit``, ``cursor`` or a filter it is one page
+    instead, read from the task list index: tasks matching every filter in
+    ``sort`` order (creation by default), ``limit`` at a time, and a
+    ``next_cursor`` to pass back for the page after, null on the last one.
+
+    The list version is the ETag, so a refresh of an unchanged list is a
+    bodyless 304. A delta too old to answer falls back to the full list,
+    flagged with ``"full": true``.
+    """
+    paged = any(value is not None for value in (sort, limit, cursor, completed, has_deadline, has_reminder,
+                                                created_from, created_before))
+    if paged and since is not None:
+        raise HTTPException(status_code=400, detail="since cannot be combined with paging or filters")
+    sort = sort or "created"
+    after = None
+    if cursor is not None:
+        try:
+            after = decode_cursor(cursor, sort, descending)
+        except ValueError as error:
+            raise HTTPException(status_code=400, detail=f"Invalid cursor: {error}")
+    created = (-math.inf if created_from is None else deadline_ts(created_from),
+               math.inf if created_before is None else deadline_ts(created_before))
+
+    with user.read_lock:
+        etag = f'"{user.tasks.version}"'
+        headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "X-User-Id"}
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=headers)
+
+        if paged:
+            tasks, last = user.tasks.page(sort, limit or DEFAULT_PAGE_SIZE, after, descending, completed,
+                                          has_deadline, has_reminder, created)
+            body = {"version": user.tasks.version, "tasks": detached(tasks),
+                    "next_cursor": encode_cursor(sort, descending, last) if last else None}
+        elif since is None:
+            body = detached(user.tasks.all())
+        else:
+            body = user.tasks.changes_since(since)
+            if body is None:
+                body = {"version": user.tasks.version, "full": True, "upserts": user.tasks.all(), "deleted": []}
+            body["upserts"] = detached(body["upserts"])
+    # Encoded after the lock is released, so writers to this user wait only for the copy
+    return JSONResponse(jsonable_encoder(body), headers=headers)
+
+# === DEADLINE QUERIES ===
+# Served from each task store's deadline index, so they bisect rather than scan
+@app.get("/tasks/due")
+def tasks_due_soon(within_minutes: int = Query(60, ge=1, le=366 * 24 * 60), user: UserState = Depends(current_user)):
+    """Open tasks due in the next ``within_minutes``, soonest first"""
+    now = time.time()
+    with user.read_lock:
+        return due_response(user, now, user.tasks.due_between(now, now + within_minutes * 60))
+
+@app.get("/tasks/overdue")
+def tasks_overdue(limit: Optional[int] = Query(None, ge=1), user: UserState = Depends(current_user)):
+    """Open tasks whose deadline has passed, most overdue first"""
+    now = time.time()
+    with user.read_lock:
+        return due_response(user, now, user.tasks.overdue(now, limit))
+
+@app.get("/tasks/next-due")
+def tasks_next_due(limit: int = Query(5, ge=1, le=100), user: UserState = Depends(current_user)):
+    """The next ``limit`` open tasks to fall due"""
+    now = time.time()
+    with user.read_lock:
+        return due_response(user, now, user.tasks.next_due(now, limit))
+
+@app.get("/tasks/search")
+def search_tasks(q: str = Query(..., max_length=200), limit: int = Query(10, ge=1, le=100), prefix: bool = True,
+                 user: UserState = Depends(current_user)):
+    """Tasks whose description matches every word of ``q``, best match first.
+
+    With ``prefix`` (the default) the last word may be unfinished, so the
+    add-task screen can suggest earlier tasks as the user types. Tasks from
+    past days match too, flagged ``archived`` and carrying their ``archived_day``.
+    """
+    with user.read_lock:
+        tasks = [{**task, "score": round(score, 3), "archived": "archived_day" in task}
+                 for task, score in user.tasks.search(q, limit, prefix)]
+    return jsonable_encoder({"query": q, "tasks": tasks})
+
+def due_response(user: UserState, now: float, tasks: list) -> dict:
+    """Tasks with their deadline in the user's timezone; callers hold ``user.read_lock``"""
+    timezone = user.stats.timezone
+    entries = []
+    for task in tasks:
+        due_at = user.tasks.deadlines.due_at(task["id"])
+        entries.append({
+            **task,
+            "deadline_local": to_local(due_at, timezone).isoformat(),
+            "due_in_minutes": int((due_at - now) // 60),
+        })
+    return jsonable_encoder({"timezone": timezone, "now": datetime.datetime.fromtimestamp(now, zone_info(timezone)).isoformat(), "tasks": entries})
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
 
 @app.post("/tasks/")
-def add_task(task: Task):
+async def add_task(task: Task, user: UserState = Depends(current_user)):
+    task_data = await run_locked(user, create_task_record, user, task)
+    speculative.prepare((user.user_id, task_data["id"]), task_data["description"])
+    log.debug("task added", user_id=user.user_id, task_id=task_data["id"])
+    return {"message": "Task added successfully!", "task": task_data}
+
+def create_task_record(user: UserState, task: Task):
+    """Add a task to ``user``'s list; callers hold ``user.lock`` and then prepare its completion lines"""
     task_data = task.model_dump()
-    task_data["id"] = len(todo_list) + 1
+    task_data["id"] = user.tasks.allocate_id()
     task_data["name"] = task_data["description"]
     
-     # Ensure created_at is set
+     # Ensure created_at is set, in UTC like the created_from/created_before filters; naive is local time
     if not task_data.get("created_at"):
-        task_data["created_at"] = datetime.datetime.now()
+        task_data["created_at"] = datetime.datetime.now(datetime.timezone.utc)
+    task_data["created_at"] = task_data["created_at"].astimezone(datetime.timezone.utc)
 
-    print(f"Received task data: {task_data}")
     # Ensure reminder_minutes is properly handled
     if "reminder_minutes" not in task_data or task_data["reminder_minutes"] is None:
         task_data["reminder_minutes"] = None
@@ -154,217 +424,341 @@ def add_task(task: Task):
     # Ensure is_completed is set
     if "is_completed" not in task_data:
         task_data["is_completed"] = False
-    todo_list.append(task_data)
-    return {"message": "Task added successfully!", "task": task_data}
+    task_data["reminder_at"] = reminder_due_at(task_data)
+    user.tasks.add(task_data)
+    reminder_scheduler.schedule((user.user_id, task_data["id"]), task_data)
+    return task_data
 
 @app.post("/tasks/{task_id}/complete")
-def complete_task_with_ai(task_id: int):
-    """Complete a task and get AI response"""
-    for task in todo_list:
-        if task["id"] == task_id:
-            # Toggle completion status
-            task["is_completed"] = not task["is_completed"]
-            
-            # Calculate progress
-            completed_count = len([t for t in todo_list if t["is_completed"]])
-            total_count = len(todo_list)
-            remaining = total_count - completed_count
-            
-            # Generate AI response based on completion status
-            if task["is_completed"]:
-                # Task was just completed
-                if remaining > 0:
-                    # Focus on the specific task, not just counting
-                    task_context = f"User just completed the task '{task['description']}'. Make a funny potato comment specifically about this task they just finished. Don't mention how many tasks are left."
-                else:
-                    # ALL TASKS DONE - This should be the ONLY message when everything is complete
-                    task_context = f"User just completed '{task['description']}' and that was the LAST task! ALL {total_count} tasks are now complete! Write ONE big celebration message about finishing everything."
-            else:
-                # Task was unchecked
-                task_context = f"User unchecked the task '{task['description']}'. Make a funny potato comment about them undoing this specific task."
-            
-            ai_response = generate_reminder(task_context)
-            
+async def complete_task_with_ai(task_id: int, stream: bool = False, user: UserState = Depends(current_user)):
+    """Complete a task and get AI response. The line comes on /events (``message_ticket``), or
+    with ``stream`` from /stream/task-line/{task_id} (``message_stream``) to be typed out as it arrives."""
+    task, completed_count, total_count, remaining = await run_locked(user, toggle_task, user, task_id)
+
+    key = (user.user_id, task_id)
+    if stream:
+        if not task["is_completed"]:
+            speculative.prepare(key, task["description"])
+        return {
+            "message": "Task toggled successfully!",
+            "task": task,
+            "message_ticket": None,
+            "message_stream": f"/stream/task-line/{task_id}",
+            "progress": f"{completed_count}/{total_count}",
+            "is_completed": task["is_completed"],
+            "all_tasks_complete": remaining == 0
+        }
+
+    if task["is_completed"]:
+        # The line was generated when the task was created; no model call needed
+        ai_message = speculative.take(key, task["description"], last=remaining == 0)
+        if ai_message is not None:
+            # An uncheck's line may still be queued for this task; this line is for the latest state
+            message_hub.supersede(user.user_id, f"task:{task_id}", ai_message, task_id=task_id)
             return {
                 "message": "Task toggled successfully!",
                 "task": task,
-                "ai_message": ai_response,
+                "ai_message": ai_message,
+                "message_ticket": None,
                 "progress": f"{completed_count}/{total_count}",
-                "is_completed": task["is_completed"],
-                "all_tasks_complete": remaining == 0  # Add this flag
+                "is_completed": True,
+                "all_tasks_complete": remaining == 0
             }
-    
-    raise HTTPException(status_code=404, detail="Task not found.")
+    else:
+        speculative.prepare(key, task["description"])  # fresh lines for when it is completed again
+
+    # Generate AI response based on completion status
+    task_context, bucket = task_line_prompt(task, total_count, remaining)
+    if bucket is not None:
+        produce = lambda: response_cache.get(task_context, bucket=bucket,
+                                             priority=INTERACTIVE, user_id=user.user_id)
+    else:
+        produce = lambda: generate_reminder(task_context, priority=INTERACTIVE, user_id=user.user_id)
 
+    # Respond as soon as the toggle is stored; the AI line follows on /events
+    ticket = message_hub.submit(user.user_id, f"task:{task_id}", produce, task_id=task_id)
+
+    return {
+        "message": "Task toggled successfully!",
+        "task": task,
+        "message_ticket": ticket,
+        "progress": f"{completed_count}/{total_count}",
+        "is_completed": task["is_completed"],
+        "all_tasks_complete": remaining == 0  # Add this flag
+    }
+
+
+def task_line_prompt(task, total_count, remaining):
+    """The prompt for the line after ``task`` was toggled, and its pool bucket when the situation is fixed (else None)"""
+    if not task["is_completed"]:
+        # Task was unchecked
+        return f"User unchecked the task '{task['description']}'. Make a funny potato comment about them undoing this specific task.", None
+    if remaining > 0:
+        # Focus on the specific task, not just counting
+        return completion_prompt(task["description"]), None
+    # ALL TASKS DONE - This should be the ONLY message when everything is complete
+    return (f"User just completed the LAST task! ALL of their tasks ({count_bucket(total_count)}) are now complete! Write ONE big celebration message about finishing everything.",
+            count_bucket(total_count))
+
+def toggle_task(user: UserState, task_id: int):
+    """Flip a task's completion; callers hold ``user.lock``. Returns the task and progress counts."""
+    task = user.tasks.get(task_id)
+    if task is None:
+        raise HTTPException(status_code=404, detail="Task not found.")
+
+    # Toggle completion status
+    user.set_task_completed(task_id, not task["is_completed"])
+    reminder_scheduler.schedule((user.user_id, task_id), task)
+
+    # Calculate progress
+    return task, user.tasks.completed_count, user.tasks.total_count, user.tasks.remaining_count
 
 
 @app.delete("/tasks/{task_id}")
-def delete_task(task_id: int):
-    for i, task in enumerate(todo_list):
-        if task["id"] == task_id:
-            deleted_task = todo_list.pop(i)
-            return {"message": "Task deleted successfully!", "task": deleted_task}
-    raise HTTPException(status_code=404, detail="Task not found.")
+def delete_task(task_id: int, user: UserState = Depends(current_user)):
+    with user.lock:
+        deleted_task = user.tasks.delete(task_id)
+    if deleted_task is None:
+        raise HTTPException(status_code=404, detail="Task not found.")
+    reminder_scheduler.cancel((user.user_id, task_id))
+    speculative.discard((user.user_id, task_id))
+    return {"message": "Task deleted successfully!", "task": deleted_task}
 
 @app.put("/tasks/{task_id}")
-def mark_task_completed(task_id: int = Path(..., description="The ID of the task to complete")):
-    for task in todo_list:
-        if task["id"] == task_id:
-            task["is_completed"] = True
-            completed_count = len([t for t in todo_list if t["is_completed"]])
-            total_count = len(todo_list)
-            remaining = total_count - completed_count
-            
-            if remaining > 0:
-                task_context = f"User completed '{task['description']}'! Progress: {completed_count}/{total_count}. {remaining} tasks left. Write ONE encouraging sentence under 75 characters."
-            else:
-                task_context = f"User completed '{task['description']}'! ALL {total_count} tasks done! Write ONE celebration sentence under 75 characters."
-            
-            ai_response = generate_reminder(task_context)
-            return {
-                "message": "Task marked as completed!",
-                "task": task,
-                "ai_message": ai_response,
-                "progress": f"{completed_count}/{total_count}"
-            }  # FIXED: Added missing closing brace
-    raise HTTPException(status_code=404, detail="Task not found.")
+async def mark_task_completed(task_id: int = Path(..., description="The ID of the task to complete"),
+                              stream: bool = False, user: UserState = Depends(current_user)):
+    task, completed_count, total_count, remaining = await run_locked(user, complete_task, user, task_id)
+
+    if stream:
+        # The client types the line out from /stream/task-line as it arrives
+        return {
+            "message": "Task marked as completed!",
+            "task": task,
+            "message_ticket": None,
+            "message_stream": f"/stream/task-line/{task_id}",
+            "progress": f"{completed_count}/{total_count}"
+        }
+
+    ai_message = speculative.take((user.user_id, task_id), task["description"], last=remaining == 0)
+    if ai_message is not None:
+        message_hub.supersede(user.user_id, f"task:{task_id}", ai_message, task_id=task_id)
+        return {
+            "message": "Task marked as completed!",
+            "task": task,
+            "ai_message": ai_message,
+            "message_ticket": None,
+            "progress": f"{completed_count}/{total_count}"
+        }
+
+    if remaining > 0:
+        task_context = f"User completed '{task['description']}'! Progress: {completed_count}/{total_count}. {remaining} tasks left. Write ONE encouraging sentence under 75 characters."
+        produce = lambda: generate_reminder(task_context, priority=INTERACTIVE, user_id=user.user_id)
+    else:
+        task_context = f"User completed their last task! ALL of their tasks ({count_bucket(total_count)}) done! Write ONE celebration sentence under 75 characters."
+        produce = lambda: response_cache.get(task_context, bucket=count_bucket(total_count),
+                                             priority=INTERACTIVE, user_id=user.user_id)
+
+    ticket = message_hub.submit(user.user_id, f"task:{task_id}", produce, task_id=task_id)
+    return {
+        "message": "Task marked as completed!",
+        "task": task,
+        "message_ticket": ticket,
+        "progress": f"{completed_count}/{total_count}"
+    }
+
+def complete_task(user: UserState, task_id: int):
+    """Mark a task completed; callers hold ``user.lock``. Returns the task and progress counts."""
+    task = user.set_task_completed(task_id, True)
+    if task is None:
+        raise HTTPException(status_code=404, detail="Task not found.")
+    reminder_scheduler.cancel((user.user_id, task_id))
+    return task, user.tasks.completed_count, user.tasks.total_count, user.tasks.remaining_count
+
+@app.get("/events")
+async def message_events(user: UserState = Depends(current_user)):
+    """Server-sent events stream of AI messages for mutation tickets"""
+    return StreamingResponse(message_hub.stream(user.user_id), media_type="text/event-stream")
 
 @app.post("/task-progress-check")
-def check_task_progress():
-    completed_tasks = [t for t in todo_list if t["is_completed"]]
-    total_tasks = len(todo_list)
+async def check_task_progress(user: UserState = Depends(current_user)):
+    completed_count = user.tasks.completed_count
+    total_tasks = user.tasks.total_count
     
-    progress_checker = len(completed_tasks) / total_tasks if total_tasks > 0 else 0
+    progress_checker = user.tasks.completion_rate
     
-    # DEBUG: Add this to see what's happening
-    print(f"DEBUG: completed={len(completed_tasks)}, total={total_tasks}, progress={progress_checker}")
+    log.debug("progress check", completed=completed_count, total=total_tasks, progress=progress_checker)
     
-    if total_tasks == 0:
-        ai_prompt = "User has no tasks today. Write ONE funny sentence asking if they want to add a task under 75 characters."
-    elif len(completed_tasks) == 0:
-        ai_prompt = "User has tasks but completed ZERO of them. Write ONE super guilt-trippy funny sentence under 75 characters."
-    elif len(completed_tasks) == total_tasks:
-        ai_prompt = "User completed ALL their tasks! Perfect day! Write ONE big celebration sentence under 75 characters."
-    elif progress_checker >= 0.5:
-        ai_prompt = "User has completed more than half of their tasks. Write ONE celebration sentence under 75 characters."
-    else:  # This should catch 33% completion
-        ai_prompt = "User has completed less than half of their tasks. Write ONE guilt-trippy sentence to motivate them under 75 characters."
+    ai_prompt = progress_prompt(completed_count, total_tasks, progress_checker)
     
-    print(f"DEBUG: Using prompt: {ai_prompt}")
-    ai_message = generate_reminder(ai_prompt)
+    log.debug("progress prompt", prompt=ai_prompt)
+    # Every progress situation is fixed, so answer from the pre-generated pool
+    ai_message = await response_cache.get(ai_prompt, priority=NUDGE, user_id=user.user_id)
     
     return {
         "ai_message": ai_message,
-        "completion_rate": f"{len(completed_tasks)}/{total_tasks}",
-        "completed_count": len(completed_tasks),
+        **progress_fields(completed_count, total_tasks, progress_checker)
+    }
+
+def progress_prompt(completed_count, total_tasks, progress_checker):
+    if total_tasks == 0:
+        return "User has no tasks today. Write ONE funny sentence asking if they want to add a task under 75 characters."
+    elif completed_count == 0:
+        return "User has tasks but completed ZERO of them. Write ONE super guilt-trippy funny sentence under 75 characters."
+    elif completed_count == total_tasks:
+        return "User completed ALL their tasks! Perfect day! Write ONE big celebration sentence under 75 characters."
+    elif progress_checker >= 0.5:
+        return "User has completed more than half of their tasks. Write ONE celebration sentence under 75 characters."
+    else:  # This should catch 33% completion
+        return "User has completed less than half of their tasks. Write ONE guilt-trippy sentence to motivate them under 75 characters."
+
+def progress_fields(completed_count, total_tasks, progress_checker):
+    return {
+        "completion_rate": f"{completed_count}/{total_tasks}",
+        "completed_count": completed_count,
         "total_count": total_tasks,
         "completion_percentage": int(progress_checker * 100),
-        "all_complete": len(completed_tasks) == total_tasks and total_tasks > 0
+        "all_complete": completed_count == total_tasks and total_tasks > 0
     }
 
 
 @app.post("/check-in")
-def daily_check_in():
+def daily_check_in(user: UserState = Depends(current_user)):
     """Pure streak management - no AI messages"""
-    today = datetime.datetime.now().strftime("%Y-%m-%d")
-    completed_tasks = [t for t in todo_list if t["is_completed"]]
-    total_tasks = len(todo_list)
+    with user.lock:
+        return apply_check_in(user)
+
+def apply_check_in(user: UserState):
+    """Move ``user``'s streak for their local today and log the check-in; callers hold ``user.lock``"""
+    today = user.now().date()
+    completed_count = user.tasks.completed_count
+    total_tasks = user.tasks.total_count
     
     # Get quest completion status
     quest_completed = False
-    if daily_quests:
-        quest_completed = daily_quests[0].get("is_completed", False)
+    if user.quests:
+        quest_completed = user.quests[0].get("is_completed", False)
     
     # Calculate completion metrics
-    completion_rate = len(completed_tasks) / total_tasks if total_tasks > 0 else 0
+    completion_rate = user.tasks.completion_rate
     perfect_day = (completion_rate == 1.0 and quest_completed)
-    already_incremented_today = (user_stats.last_streak_date == today)
+    old_streak = user.stats.current_streak
     
     # STREAK LOGIC ONLY - No AI message generation
-    if perfect_day and not already_incremented_today:
+    outcome = advance_streak(user.stats, today, perfect_day, active=completed_count > 0 or quest_completed)
+    user.save_stats()
+    user.record(CHECK_IN, perfect_day=perfect_day, streak=user.stats.current_streak)
+    
+    fields = {
+        "completion_rate": f"{completed_count}/{total_tasks}",
+        "tasks_completed": completed_count,
+        "quest_completed": quest_completed
+    }
+    if outcome == PUSHED:
         # PERFECT DAY = Push streak forward
-        if user_stats.last_activity_date == yesterday_string():
-            user_stats.current_streak += 1
-        else:
-            user_stats.current_streak = 1
-        
-        user_stats.longest_streak = max(user_stats.longest_streak, user_stats.current_streak)
-        user_stats.last_activity_date = today
-        user_stats.last_streak_date = today
-        
         return {
-            "streak": user_stats.current_streak,
-            "longest_streak": user_stats.longest_streak,
+            "streak": user.stats.current_streak,
+            "longest_streak": user.stats.longest_streak,
             "perfect_day": True,
             "streak_pushed_forward": True,
-            "completion_rate": f"{len(completed_tasks)}/{total_tasks}",
-            "tasks_completed": len(completed_tasks),
-            "quest_completed": quest_completed
+            **fields
         }
-    
-    elif len(completed_tasks) > 0 or quest_completed:
+    if outcome == MAINTAINED:
         # PARTIAL COMPLETION = Maintain streak
-        user_stats.last_activity_date = today
-        
         return {
-            "streak": user_stats.current_streak,
-            "longest_streak": user_stats.longest_streak,
+            "streak": user.stats.current_streak,
+            "longest_streak": user.stats.longest_streak,
             "streak_maintained": True,
-            "completion_rate": f"{len(completed_tasks)}/{total_tasks}",
-            "tasks_completed": len(completed_tasks),
-            "quest_completed": quest_completed
-        }
-    
-    else:
-        # NO COMPLETION = Break streak
-        old_streak = user_stats.current_streak
-        user_stats.current_streak = 0
-        user_stats.last_streak_date = None
-        
-        return {
-            "streak": 0,
-            "longest_streak": user_stats.longest_streak,
-            "streak_broken": True,
-            "old_streak": old_streak,
-            "completion_rate": f"{len(completed_tasks)}/{total_tasks}",
-            "tasks_completed": len(completed_tasks),
-            "quest_completed": quest_completed
+            **fields
         }
+    # NO COMPLETION = Break streak
+    return {
+        "streak": 0,
+        "longest_streak": user.stats.longest_streak,
+        "streak_broken": True,
+        "old_streak": old_streak,
+        **fields
+    }
 
 @app.get("/streak")
-async def get_streak():
+async def get_streak(user: UserState = Depends(current_user)):
     return {
-        'current_streak': user_stats.current_streak,
-        'longest_streak': user_stats.longest_streak,
+        'current_streak': user.stats.current_streak,
+        'longest_streak': user.stats.longest_streak,
         'status': 'success'
     }
 
+@app.get("/history")
+def get_history(start: Optional[datetime.date] = None, end: Optional[datetime.date] = None,
+                user: UserState = Depends(current_user)):
+    """Day-by-day activity between ``start`` and ``end`` (inclusive, the user's local
+    dates), read from the activity log's rollups. Defaults to the last 30 days.
+    """
+    with user.read_lock:
+        end = end or user.now().date()
+        start = start or end - datetime.timedelta(days=29)
+        if start > end:
+            raise HTTPException(status_code=400, detail="start must not be after end")
+        if (end - start).days + 1 > MAX_HISTORY_DAYS:
+            raise HTTPException(status_code=400, detail=f"history is limited to {MAX_HISTORY_DAYS} days")
+        history = user.activity.history(start, end)
+        timezone = user.stats.timezone
+
+    days = []
+    for day, rollup in history:
+        if rollup is None:
+            days.append({"date": day, "completed": 0, "uncompleted": 0, "net_completed": 0, "quests_completed": 0,
+                         "checked_in": False, "perfect_day": False, "streak": None})
+        else:
+            days.append({
+                "date": day,
+                "completed": rollup.completed,
+                "uncompleted": rollup.uncompleted,
+                "net_completed": rollup.completed - rollup.uncompleted,
+                "quests_completed": rollup.quests_completed,
+                "checked_in": rollup.check_ins > 0,
+                "perfect_day": rollup.perfect_day,
+                "streak": rollup.streak,
+            })
+    return {
+        "timezone": timezone,
+        "start": start,
+        "end": end,
+        "days": days,
+        "totals": {
+            "completed": sum(day["completed"] for day in days),
+            "net_completed": sum(day["net_completed"] for day in days),
+            "quests_completed": sum(day["quests_completed"] for day in days),
+            "perfect_days": sum(day["perfect_day"] for day in days),
+            "active_days": sum(1 for day in days if day["completed"] or day["quests_completed"]),
+        },
+    }
+
 
 @app.get("/character/stats")
-def get_character_stats():
+def get_character_stats(user: UserState = Depends(current_user)):
     return {
-        "current_streak": user_stats.current_streak,
-        "longest_streak": user_stats.longest_streak,
-        "total_tasks_completed": user_stats.total_tasks_completed,
-        "timezone": user_stats.timezone
+        "current_streak": user.stats.current_streak,
+        "longest_streak": user.stats.longest_streak,
+        "total_tasks_completed": user.stats.total_tasks_completed,
+        "timezone": user.stats.timezone
     }  # FIXED: Added missing closing brace
 
 @app.get("/daily-status")
-def get_daily_completion_status():
-    completed_tasks = [t for t in todo_list if t["is_completed"]]
-    total_tasks = len(todo_list)
+def get_daily_completion_status(user: UserState = Depends(current_user)):
+    completed_count = user.tasks.completed_count
+    total_tasks = user.tasks.total_count
     
     quest_completed = False
-    if daily_quests:
-        quest_completed = daily_quests[0].get("is_completed", False)
+    if user.quests:
+        quest_completed = user.quests[0].get("is_completed", False)
     
     # Show button when ALL tasks AND daily quest are complete
-    all_done = (total_tasks > 0 and len(completed_tasks) == total_tasks and quest_completed)
-    completion_rate = len(completed_tasks) / total_tasks if total_tasks > 0 else 0
+    all_done = (total_tasks > 0 and completed_count == total_tasks and quest_completed)
+    completion_rate = user.tasks.completion_rate
     
     return {
         "all_tasks_complete": all_done,
-        "completed_count": len(completed_tasks),
+        "completed_count": completed_count,
         "total_count": total_tasks,
         "quest_completed": quest_completed,
         "show_call_it_day_button": all_done,
@@ -373,20 +767,73 @@ def get_daily_completion_status():
     }  # FIXED: Added missing closing brace
 
 @app.post("/call-it-a-day")
-def call_it_a_day():
+async def call_it_a_day(user: UserState = Depends(current_user)):
     # This is just for celebration - streak already moved in /check-in
     today = today_string()
     
-    celebration_context = f"User completed ALL tasks and daily quest! Perfect day! Current streak: {user_stats.current_streak} days. Write ONE SUPER HYPE and funny Potato food joke celebration sentence under 100 characters."
-    ai_celebration = generate_reminder(celebration_context)
+    # Bucketed streak instead of the exact count, so the celebration pool can be shared
+    streak_range = streak_bucket(user.stats.current_streak)
+    celebration_context = f"User completed ALL tasks and daily quest! Perfect day! Current streak: {streak_range}. Write ONE SUPER HYPE and funny Potato food joke celebration sentence under 100 characters."
+    ai_celebration = await response_cache.get(celebration_context, bucket=streak_range,
+                                              priority=CELEBRATION, user_id=user.user_id)
     
     return {
         "celebration_message": ai_celebration,
-        "current_streak": user_stats.current_streak,
-        "longest_streak": user_stats.longest_streak,
+        "current_streak": user.stats.current_streak,
+        "longest_streak": user.stats.longest_streak,
         "perfect_day": True
     } 
 
+@app.get("/bootstrap")
+def bootstrap(request: Request, user: UserState = Depends(current_user)):
+    """Everything the home screen needs in one response: tasks, quest, streak,
+    daily status and progress. The encoded body is cached per user and reused
+    until a write changes the tasks, quest or stats (or the day rolls over).
+    """
+    with user.read_lock:
+        quest = current_quest(user)
+        key = (user.tasks.version, user.revision, user.now().date().isoformat())
+        etag = '"{}.{}.{}"'.format(*key)
+        headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "X-User-Id"}
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=headers)
+        cached = user.snapshot
+        snapshot = build_snapshot(user, quest) if cached is None or cached[0] != key else None
+    if snapshot is None:
+        body = cached[1]
+    else:
+        # Encoded after the lock is released; the key pins the versions it was built from
+        body = JSONResponse(jsonable_encoder(snapshot)).body
+        user.snapshot = (key, body)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+def build_snapshot(user: UserState, quest):
+    tasks = user.tasks
+    completed_count = tasks.completed_count
+    total_count = tasks.total_count
+    completion_rate = tasks.completion_rate
+    quest_completed = bool(quest and quest.get("is_completed", False))
+    all_done = total_count > 0 and completed_count == total_count and quest_completed
+    return {
+        "version": tasks.version,
+        "tasks": detached(tasks.all()),
+        "daily_quest": dict(quest) if quest else quest,
+        "streak": {
+            "current_streak": user.stats.current_streak,
+            "longest_streak": user.stats.longest_streak,
+        },
+        "daily_status": {
+            "all_tasks_complete": all_done,
+            "completed_count": completed_count,
+            "total_count": total_count,
+            "quest_completed": quest_completed,
+            "show_call_it_day_button": all_done,
+            "completion_rate": completion_rate,
+            "progress_percentage": int(completion_rate * 100)
+        },
+        "progress": progress_fields(completed_count, total_count, completion_rate),
+    }
+
 # UPDATED: Improved persona for shorter responses
 persona = """
 You're a funny and hilarious potato with different moods based on user progress.
@@ -410,18 +857,69 @@ Examples:
 “ONE MORE STREAK? Oh great, now I’m so proud I smell like fries.”
 """
 
-genai_client = genai.Client(api_key=api_key)
+def make_genai_client():
+    """Built on the first model call, so importing the app never pays for google.genai.
+    POTATODO_GEMINI_BASE_URL points it at another endpoint (fake_gemini.py for benchmarks)"""
+    from google import genai
 
-def generate_reminder(task_status: str):
-    full_prompt = f"{persona}\n\nSituation: {task_status}\n\n"
+    return genai.Client(
+        api_key=api_key,
+        http_options=genai.types.HttpOptions(base_url=os.getenv("POTATODO_GEMINI_BASE_URL")),
+    )
 
-    response = genai_client.models.generate_content(
-        model="gemini-2.5-flash-lite-preview-06-17",
-        contents=full_prompt
-    )  # FIXED: Added missing closing parenthesis
+# Every model call goes through this gateway: async client, bounded concurrency,
+# per-attempt timeouts, jittered retries and a fallback line past the deadline.
+# The persona is its system instruction, so prompts carry only the situation.
+# No caller waits past the latency budget, a call slower than the hedge delay is
+# raced by a second one, and a circuit breaker stops calling the model while it
+# is slow or failing.
+llm = LLMGateway(
+    None,
+    client_factory=make_genai_client,
+    model="gemini-2.5-flash-lite-preview-06-17",
+    system_instruction=persona.strip(),
+    cache_ttl=3600,
+    latency_budget=float(os.getenv("POTATODO_LLM_LATENCY_BUDGET", "2.5")),
+    hedge_after=float(os.getenv("POTATODO_LLM_HEDGE_AFTER", "1.0")),
+)
+
+# Offline potato lines used whenever the model cannot answer in time
+local_jokes = LocalJokeGenerator()
+
+def build_prompt(task_status: str):
+    return f"Situation: {compact_prompt(task_status)}"
+
+def build_batch_prompt(task_statuses):
+    numbered = "\n".join(f"{number}. {compact_prompt(status)}" for number, status in enumerate(task_statuses, 1))
+    return (
+        f"One line per situation, {len(task_statuses)} lines, each starting with its number and a period, nothing else."
+        f"\n{numbered}"
+    )
+
+# Generations that arrive within a few milliseconds of each other (many users
+# completing tasks at once, pool refills) share one model call
+llm_batcher = MicroBatcher(llm, build_prompt, build_batch_prompt, window=0.02, max_items=8)
+
+# Admission control in front of both: interactive completions go before
+# reminders, nudges and celebrations, each user has a per-minute budget, and
+# work that cannot be admitted gets its fallback line instead of waiting
+llm_work = LLMWorkScheduler()
+
+async def generate_reminder(task_status: str, fallback: Optional[str] = None,
+                            priority: int = BACKGROUND, user_id: Optional[str] = None):
+    if fallback is None:
+        fallback = lambda: local_jokes.generate(task_status)
+    with span("model"):
+        response_text = await llm_work.run(
+            lambda: llm_batcher.generate(task_status, fallback=fallback),
+            priority=priority,
+            user_id=user_id,
+            fallback=fallback,
+            cost=estimate_tokens(task_status),
+        )
 
     # Ensure response is under 100 characters and single line
-    ai_text = response.text.strip()
+    ai_text = response_text.strip()
     if len(ai_text) > 100:
         ai_text = ai_text[:247] + "..."
     
@@ -429,93 +927,391 @@ def generate_reminder(task_status: str):
     ai_text = ai_text.replace('\n', ' ').replace('\r', ' ')
     return ai_text
 
+# Rotating pools of pre-generated lines for the fixed-situation prompts
+response_cache = ResponseCache(generate_reminder)
+
+def completion_prompt(description: str):
+    return f"User just completed the task '{description}'. Make a funny potato comment specifically about this task they just finished. Don't mention how many tasks are left."
+
+def last_completion_prompt(description: str):
+    return f"User just completed '{description}', their LAST task! ALL of their tasks are now complete! Write ONE big celebration message about finishing everything."
+
+# Completion lines for each task, generated when it is created or renamed
+speculative = SpeculativeLines(generate_reminder, completion_prompt, last_completion_prompt)
+
 @app.get("/reminder/{task_id}")
-def get_task_reminder(task_id: int):
+async def get_task_reminder(task_id: int, user: UserState = Depends(current_user)):
     """Get AI reminder message for a specific task"""
     try:
-        user_timezone = user_stats.timezone
+        user_timezone = user.stats.timezone
         now = datetime.datetime.now(ZoneInfo(user_timezone))
         
-        target_task = None
-        for task in todo_list:
-            if task["id"] == task_id and not task["is_completed"]:
-                target_task = task
-                break
+        target_task = user.tasks.get(task_id)
+        if target_task is not None and target_task["is_completed"]:
+            target_task = None
         
         if not target_task:
             return {"reminder": "Task not found or already completed! 🎉"}
         
-        # Generate different prompts based on reminder type
-        if target_task.get("deadline"):
-            # Deadline-based reminder
-            task_deadline = convert_to_user_timezone(target_task["deadline"], user_timezone)
-            prompt = f"""
-            Task "{target_task['description']}" is due at {task_deadline.strftime('%I:%M %p')}. Write ONE urgent but encouraging reminder 
-            message under 50 characters.
-            """
-        else:
-            # Time-based reminder (no deadline)
-            prompt = f"""
-            The user wanted to be reminded about this Task "{target_task['description']}". Write ONE friendly reminder 
-            message under 50 characters.
-            """
-        
-        response = genai_client.models.generate_content(
-            model="gemini-2.5-flash-lite-preview-06-17",
-            contents=prompt
+        response_text = await generate_direct(
+            reminder_prompt(target_task, user_timezone),
+            fallback=f"⏰ Don't forget: {target_task['description']}!",
+            priority=REMINDER,
+            user_id=user.user_id,
         )
         
-        return {"reminder": response.text.strip()}
+        return {"reminder": response_text.strip()}
         
     except Exception as e:
-        print(f"ERROR in get_task_reminder: {type(e).__name__}: {str(e)}")
+        log.error("reminder failed", user_id=user.user_id, task_id=task_id, error=type(e).__name__, detail=str(e))
         return {"reminder": f"⏰ Don't forget: {target_task['description'] if 'target_task' in locals() else 'your task'}!"}
 
+async def generate_direct(prompt: str, fallback, priority: int, user_id: Optional[str] = None):
+    """A single unbatched generation, admitted through the work scheduler"""
+    with span("model"):
+        return await llm_work.run(
+            lambda: llm.generate(prompt, fallback=fallback),
+            priority=priority,
+            user_id=user_id,
+            fallback=fallback,
+            cost=estimate_tokens(prompt),
+        )
+
+def reminder_prompt(task, user_timezone):
+    # Generate different prompts based on reminder type
+    if task.get("deadline"):
+        # Deadline-based reminder
+        task_deadline = to_local(deadline_ts(task["deadline"]), user_timezone)
+        return compact_prompt(f"""
+        Task "{task['description']}" is due at {task_deadline.strftime('%I:%M %p')}. Write ONE urgent but encouraging reminder 
+        message under 50 characters.
+        """)
+    else:
+        # Time-based reminder (no deadline)
+        return compact_prompt(f"""
+        The user wanted to be reminded about this Task "{task['description']}". Write ONE friendly reminder 
+        message under 50 characters.
+        """)
+
+# === SERVER-SIDE REMINDERS ===
+# Reminder timers live here rather than in the renderer: each reminder's text is
+# generated shortly before it is due and pushed to clients on /events. Entries
+# are keyed by (user_id, task_id), so one heap serves every user.
+async def scheduled_task(key):
+    user_id, task_id = key
+    return (await off_loop(users.get, user_id)).tasks.get(task_id)
+
+async def generate_task_reminder(key, task):
+    user = await off_loop(users.get, key[0])
+    response_text = await generate_direct(
+        reminder_prompt(task, user.stats.timezone),
+        fallback=f"⏰ Don't forget: {task['description']}!",
+        priority=REMINDER,
+        user_id=key[0],
+    )
+    return response_text.strip()
+
+async def deliver_task_reminder(key, task, text):
+    user = await off_loop(users.get, key[0])
+    # fired, so it is not rescheduled after a restart
+    await run_locked(user, lambda: user.tasks.update(task["id"], reminder_at=None))
+    message_hub.publish(user.user_id, "reminder", {"task_id": task["id"], "reminder": text})
+
+reminder_scheduler = ReminderScheduler(generate_task_reminder, deliver_task_reminder)
+
+# === STREAMING AI MESSAGES ===
+# Same messages as above, streamed token by token as server-sent events so the
+# typewriter effect can start on the first token. Time-to-first-character is
+# recorded per endpoint and served by /stream/metrics.
+ttfc_recorder = TTFCRecorder()
+
+def sse_response(frames):
+    return StreamingResponse(frames, media_type="text/event-stream")
+
+def line_stream(prompt: str, priority: int, user: UserState):
+    """The model's chunks for ``prompt``; streamed calls are admitted like any other,
+    and a shed stream gets a local line"""
+    fallback = lambda: local_jokes.generate(prompt)
+    return llm_work.stream(
+        lambda: llm.stream(build_prompt(prompt), fallback=fallback),
+        priority=priority,
+        user_id=user.user_id,
+        fallback=fallback,
+        cost=estimate_tokens(prompt),
+    )
+
+@app.get("/stream/task-progress-check")
+async def stream_task_progress(user: UserState = Depends(current_user)):
+    started_at = time.perf_counter()
+    completed_count = user.tasks.completed_count
+    total_tasks = user.tasks.total_count
+    progress_checker = user.tasks.completion_rate
+
+    ai_prompt = progress_prompt(completed_count, total_tasks, progress_checker)
+    pooled = response_cache.take(ai_prompt)
+    chunks = once(pooled) if pooled is not None else line_stream(ai_prompt, NUDGE, user)
+
+    meta = progress_fields(completed_count, total_tasks, progress_checker)
+    return sse_response(stream_message("/stream/task-progress-check", chunks, started_at, ttfc_recorder, meta))
+
+@app.get("/stream/task-line/{task_id}")
+async def stream_task_line(task_id: int, user: UserState = Depends(current_user)):
+    """The line for a task's latest toggle, the celebration when it was the last one open;
+    for clients that toggled it with ``stream`` instead of waiting on /events"""
+    started_at = time.perf_counter()
+    task = user.tasks.get(task_id)
+    if task is None:
+        return sse_response(stream_message("/stream/task-line", once("Task not found! 🥔"), started_at,
+                                           ttfc_recorder, {"task_id": task_id}))
+    total_count, remaining = user.tasks.total_count, user.tasks.remaining_count
+
+    line = None
+    if task["is_completed"]:
+        # The line was generated when the task was created; no model call needed
+        line = speculative.take((user.user_id, task_id), task["description"], last=remaining == 0)
+    prompt, bucket = task_line_prompt(task, total_count, remaining)
+    if line is None and bucket is not None:
+        line = response_cache.take(prompt, bucket)
+    chunks = once(line) if line is not None else line_stream(prompt, INTERACTIVE, user)
+
+    meta = {"task_id": task_id, "is_completed": task["is_completed"], "all_tasks_complete": remaining == 0}
+    return sse_response(stream_message("/stream/task-line", chunks, started_at, ttfc_recorder, meta))
+
+@app.get("/stream/daily-quest")
+async def stream_daily_quest(user: UserState = Depends(current_user)):
+    """The line for today's completed quest, for clients that completed it with ``stream``"""
+    started_at = time.perf_counter()
+    quest = user.quests[0] if user.quests else None
+    if quest is None or not quest["is_completed"]:
+        chunks = once("No completed daily quest yet! 🥔")
+        meta = {"progress": None}
+    else:
+        completed_tasks, total_tasks = user.tasks.completed_count, user.tasks.total_count
+        prompt, bucket = quest_line_prompt(quest, completed_tasks, total_tasks, user.tasks.remaining_count)
+        pooled = response_cache.take(prompt, bucket) if bucket is not None else None
+        chunks = once(pooled) if pooled is not None else line_stream(prompt, INTERACTIVE, user)
+        meta = {"progress": f"{completed_tasks}/{total_tasks}"}
+    return sse_response(stream_message("/stream/daily-quest", chunks, started_at, ttfc_recorder, meta))
+
+@app.get("/stream/reminder/{task_id}")
+async def stream_task_reminder(task_id: int, user: UserState = Depends(current_user)):
+    started_at = time.perf_counter()
+    target_task = user.tasks.get(task_id)
+    if target_task is None or target_task["is_completed"]:
+        chunks = once("Task not found or already completed! 🎉")
+    else:
+        prompt = reminder_prompt(target_task, user.stats.timezone)
+        fallback = f"⏰ Don't forget: {target_task['description']}!"
+        chunks = llm_work.stream(
+            lambda: llm.stream(prompt, fallback=fallback),
+            priority=REMINDER,
+            user_id=user.user_id,
+            fallback=fallback,
+            cost=estimate_tokens(prompt),
+        )
+    return sse_response(stream_message("/stream/reminder", chunks, started_at, ttfc_recorder, {"task_id": task_id}))
+
+@app.get("/stream/metrics")
+def stream_metrics():
+    """Time-to-first-character per streaming endpoint"""
+    return ttfc_recorder.summary()
+
+@app.get("/llm/metrics")
+def llm_metrics():
+    """Items per model call, the wait added by micro-batching, token usage, breaker
+    state, the hit rate of pre-generated completion lines and queueing by priority"""
+    return {
+        **llm_batcher.stats(),
+        "tokens": llm.usage.summary(),
+        "breaker": llm.breaker.summary(),
+        "hedges": {"sent": llm.hedges, "won": llm.hedge_wins},
+        "speculative": speculative.stats(),
+        "scheduler": llm_work.stats(),
+    }
+
+@app.get("/metrics")
+def prometheus_metrics():
+    """Request, model-call and cache metrics in the Prometheus text format"""
+    usage = llm.usage
+    lines = [
+        *request_metrics.render(),
+        *llm.call_seconds.render(),
+        *render_samples("potatodo_llm_budget_misses_total", "Callers given the fallback at the latency budget",
+                        "counter", {(): llm.budget_misses}),
+        *render_samples("potatodo_llm_hedges_total", "Second calls sent for a slow model call", "counter",
+                        {(): llm.hedges}),
+        *render_samples("potatodo_llm_hedge_wins_total", "Answers that came from the hedged second call", "counter",
+                        {(): llm.hedge_wins}),
+        *render_samples("potatodo_llm_tokens_total", "Tokens reported by the model", "counter", {
+            ("prompt",): usage.prompt_tokens,
+            ("cached",): usage.cached_tokens,
+            ("output",): usage.output_tokens,
+        }, ("kind",)),
+        *render_samples("potatodo_llm_breaker_open", "1 while the circuit breaker is not closed", "gauge",
+                        {(): int(llm.breaker.state != "closed")}),
+        *render_samples("potatodo_llm_breaker_trips_total", "Times the circuit breaker opened", "counter",
+                        {(): llm.breaker.trips}),
+        *render_samples("potatodo_llm_batched_items_total", "Generations sent through the micro-batcher", "counter",
+                        {(): llm_batcher.items}),
+        *render_samples("potatodo_llm_batch_calls_total", "Model calls made by the micro-batcher", "counter",
+                        {(): llm_batcher.model_calls}),
+        *render_samples("potatodo_llm_shed_total", "Model work shed to its fallback", "counter", {
+            tuple(key.split(":")): count for key, count in llm_work.shed.items()
+        }, ("priority", "reason")),
+        *render_samples("potatodo_cache_hits_total", "Lines served without a model call", "counter", {
+            ("response",): response_cache.hits,
+            ("speculative",): speculative.hits,
+        }, ("cache",)),
+        *render_samples("potatodo_cache_misses_total", "Lines that needed a model call", "counter", {
+            ("response",): response_cache.misses,
+            ("speculative",): speculative.misses,
+        }, ("cache",)),
+        *render_samples("potatodo_midnight_resets_total", "Users reset by the midnight sweeper", "counter",
+                        {(): midnight_sweeper.resets}),
+        *render_samples("potatodo_midnight_bucket_users", "Users per timezone bucket", "gauge", {
+            (zone,): count for zone, count in midnight_sweeper.zones().items()
+        }, ("zone",)),
+    ]
+    return Response("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
+
 @app.patch("/tasks/{task_id}")
-def update_task_details(task_id: int, task: Task):
+async def update_task_details(task_id: int, task: Task, user: UserState = Depends(current_user)):
     """Update task details (description, deadline, reminder)"""
-    for existing_task in todo_list:
-        if existing_task["id"] == task_id:
-            # Update only the fields that are provided
-            existing_task["description"] = task.description
-            existing_task["deadline"] = task.deadline
-            existing_task["reminder_minutes"] = task.reminder_minutes
-            
-            return {
-                "message": "Task updated successfully!",
-                "task": existing_task
-            }
-    
-    raise HTTPException(status_code=404, detail="Task not found")
+    existing_task = await run_locked(user, apply_task_update, user, task_id, task)
+    if existing_task is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    speculative.prepare((user.user_id, task_id), existing_task["description"])  # no-op unless renamed
+
+    return {
+        "message": "Task updated successfully!",
+        "task": existing_task
+    }
+
+def apply_task_update(user: UserState, task_id: int, task: Task):
+    """Edit one of ``user``'s tasks; callers hold ``user.lock`` and then refresh its completion lines"""
+    current = user.tasks.get(task_id)
+    if current is None:
+        return None
+    fields = {"description": task.description, "deadline": task.deadline, "reminder_minutes": task.reminder_minutes}
+    # Only a new deadline or lead time moves the reminder; without a deadline it counts
+    # from when it was set, so recomputing on a rename would push it back
+    if (deadline_ts(current.get("deadline")) != deadline_ts(task.deadline)
+            or current.get("reminder_minutes") != task.reminder_minutes):
+        fields["reminder_at"] = reminder_due_at(task.model_dump())
+    existing_task = user.tasks.update(task_id, **fields)
+    reminder_scheduler.schedule((user.user_id, task_id), existing_task)
+    return existing_task
+
+# === BULK TASK OPERATIONS ===
+class BatchOperation(BaseModel):
+    op: Literal["create", "complete", "uncomplete", "update", "delete"]
+    task_id: Optional[int] = None
+    task: Optional[Task] = None
+
+    @model_validator(mode="after")
+    def check_fields(self):
+        if self.op in ("create", "update") and self.task is None:
+            raise ValueError(f"'{self.op}' needs a task")
+        if self.op != "create" and self.task_id is None:
+            raise ValueError(f"'{self.op}' needs a task_id")
+        return self
+
+# A batch holds the user's lock while it applies, so its size is capped
+MAX_BATCH_OPERATIONS = 200
+
+class TaskBatch(BaseModel):
+    operations: List[BatchOperation] = Field(max_length=MAX_BATCH_OPERATIONS)
+
+@app.post("/tasks/batch")
+async def apply_task_batch(batch: TaskBatch, user: UserState = Depends(current_user)):
+    """Apply many task operations in one request, with one AI line for the whole batch"""
+    # The whole batch is applied under the user's lock, so it lands atomically
+    # with respect to that user's other requests
+    results, done, completed_count, total_count = await run_locked(user, apply_operations, user, batch.operations)
+    for task in done["create"] + done["update"]:
+        if user.tasks.get(task["id"]) is task:  # not deleted later in the batch
+            speculative.prepare((user.user_id, task["id"]), task["description"])
+    ticket = None
+    summary = batch_summary(done)
+    if summary:
+        task_context = f"User just {summary} in one go. Progress: {completed_count}/{total_count}. Write ONE funny potato sentence about the whole batch under 75 characters."
+        produce = lambda: generate_reminder(task_context, priority=INTERACTIVE, user_id=user.user_id)
+        ticket = message_hub.submit(user.user_id, "batch", produce)
+
+    return {
+        "message": "Batch applied!",
+        "results": results,
+        "succeeded": sum(1 for r in results if r["ok"]),
+        "failed": sum(1 for r in results if not r["ok"]),
+        "message_ticket": ticket,
+        "progress": f"{completed_count}/{total_count}",
+        "all_tasks_complete": total_count > 0 and completed_count == total_count
+    }
+
+def apply_operations(user: UserState, operations: List[BatchOperation]):
+    """Apply a batch's operations in order; callers hold ``user.lock``.
+
+    Returns the per-operation results, the tasks each op touched and the progress counts.
+    """
+    results = []
+    done = {"create": [], "complete": [], "uncomplete": [], "update": [], "delete": []}
+    for index, operation in enumerate(operations):
+        if operation.op == "create":
+            task = create_task_record(user, operation.task)
+        elif operation.op in ("complete", "uncomplete"):
+            task = user.set_task_completed(operation.task_id, operation.op == "complete")
+            if task is not None:
+                reminder_scheduler.schedule((user.user_id, operation.task_id), task)
+        elif operation.op == "update":
+            task = apply_task_update(user, operation.task_id, operation.task)
+        else:
+            task = user.tasks.delete(operation.task_id)
+            if task is not None:
+                reminder_scheduler.cancel((user.user_id, operation.task_id))
+                speculative.discard((user.user_id, operation.task_id))
+
+        if task is None:
+            results.append({"index": index, "op": operation.op, "ok": False, "error": "Task not found."})
+        else:
+            results.append({"index": index, "op": operation.op, "ok": True, "task": task})
+            done[operation.op].append(task)
+    return results, done, user.tasks.completed_count, user.tasks.total_count
+
+def batch_summary(done):
+    def names(tasks):
+        shown = ", ".join(f"'{t['description']}'" for t in tasks[:3])
+        return shown + (f" and {len(tasks) - 3} more" if len(tasks) > 3 else "")
+
+    parts = []
+    if done["complete"]:
+        parts.append(f"completed {len(done['complete'])} task(s): {names(done['complete'])}")
+    if done["uncomplete"]:
+        parts.append(f"unchecked {len(done['uncomplete'])} task(s): {names(done['uncomplete'])}")
+    if done["create"]:
+        parts.append(f"added {len(done['create'])} new task(s)")
+    if done["update"]:
+        parts.append(f"edited {len(done['update'])} task(s)")
+    if done["delete"]:
+        parts.append(f"deleted {len(done['delete'])} task(s)")
+    return "; ".join(parts)
 
 @app.post("/midnight-reset")
-async def midnight_reset():
+async def midnight_reset(user: UserState = Depends(current_user)):
     """Reset all tasks and daily quest at midnight for fresh start"""
     try:
-        global todo_list, daily_quests
-        
-        # Count what we're clearing for logging
-        tasks_cleared = len(todo_list)
-        quest_cleared = len(daily_quests)
-        
-        # Clear all tasks
-        todo_list.clear()
-        
-        # Clear/uncheck daily quest
-        if daily_quests:
-            daily_quests[0]["is_completed"] = False
-            daily_quests[0]["completed_at"] = None
+        # The backend sweeper also resets at the user's midnight; whichever comes first does it
+        tasks_cleared, quest_reset = await run_locked(user, reset_if_due, user)
         
         return {
             "status": "success",
-            "message": "Midnight reset completed",
+            "message": "Midnight reset completed" if quest_reset is not None else "Already reset today",
             "tasks_cleared": tasks_cleared,
-            "daily_quest_reset": quest_cleared > 0,
+            "daily_quest_reset": bool(quest_reset),
             "reset_timestamp": datetime.datetime.now().isoformat()
         }
         
     except Exception as e:
-        print(f"Error during midnight reset: {e}")
+        log.error("midnight reset failed", user_id=user.user_id, error=type(e).__name__, detail=str(e))
         return {
             "status": "error",
             "message": str(e),
@@ -523,3 +1319,11 @@ async def midnight_reset():
             "daily_quest_reset": False
         }
 
+def reset_if_due(user: UserState):
+    """Close yesterday for ``user`` unless today was already reset (the sweeper's rule); callers
+    hold ``user.lock``. Returns (tasks cleared, quest reset), the latter None when nothing was due."""
+    today = user.now().date()
+    if not due_for_reset(user.stats.last_reset_date, today):
+        return 0, None
+    return close_day(user, today)
+
@@ -0,0 +1,115 @@
+import asyncio
+import itertools
+import json
+
+from background import spawn
+from telemetry import StructuredLogger
+
+log = StructuredLogger("message_channel")
+
+
+class MessageHub:
+    """Delivers AI messages to connected clients after the mutation has returned.
+
+    A mutation endpoint calls ``submit`` with a coroutine factory that
+    produces the message and immediately gets back a ticket to return to
+    the client. The message is generated in the background and published to
+    every subscriber of the server-sent-events stream, tagged with that
+    ticket. Submissions sharing a ``coalesce_key`` within ``coalesce_window``
+    seconds (rapid re-toggles of one task) collapse into a single
+    generation for the latest state, published under every ticket issued.
+    Subscribers and coalesce keys are per user, so one user's messages never
+    reach another user's stream.
+
+    When the latest state's message is produced elsewhere (a pre-generated
+    line returned with the response), ``supersede`` answers the pending
+    tickets with it and drops any line still being generated for an older
+    state, so the latest state wins either way.
+    """
+
+    def __init__(self, coalesce_window: float = 0.25, keepalive: float = 15.0):
+        self.coalesce_window = coalesce_window
+        self.keepalive = keepalive
+        self._subscribers = {}  # user id -> set of subscriber queues
+        self._pending = {}  # (user id, coalesce key) -> {"tickets": [...], "produce": factory, "extra": {...}}
+        self._running = {}  # (user id, coalesce key) -> job whose message is being generated
+        self._ticket_ids = itertools.count(1)
+
+    # --- publishing ---
+
+    def publish(self, user_id: str, event: str, data: dict):
+        for queue in list(self._subscribers.get(user_id, ())):
+            queue.put_nowait((event, data))
+
+    def submit(self, user_id: str, coalesce_key: str, produce, **extra) -> str:
+        """Schedule ``produce()`` and return the ticket its message will carry."""
+        ticket = f"msg-{next(self._ticket_ids)}"
+        key = (user_id, coalesce_key)
+        job = self._pending.get(key)
+        if job is None:
+            job = self._pending[key] = {"tickets": []}
+            spawn(self._run(key, job), "AI message job")
+        job["tickets"].append(ticket)
+        job["produce"] = produce
+        job["extra"] = extra
+        return ticket
+
+    def supersede(self, user_id: str, coalesce_key: str, ai_message: str, **extra):
+        """Answer ``coalesce_key``'s pending tickets with ``ai_message`` and drop older lines."""
+        key = (user_id, coalesce_key)
+        running = self._running.get(key)
+        if running is not None:
+            running["superseded"] = True
+        job = self._pending.pop(key, None)
+        if job is not None:
+            self.publish(user_id, "ai_message", {
+                "ticket": job["tickets"][-1],
+                "tickets": job["tickets"],
+                "ai_message": ai_message,
+                **extra,
+            })
+
+    async def _run(self, key, job):
+        await asyncio.sleep(self.coalesce_window)
+        if self._pending.get(key) is not job:
+            return  # superseded while it waited
+        del self._pending[key]
+        self._running[key] = job
+        try:
+            ai_message = await job["produce"]()
+        except Exception as e:
+            log.error("message channel job failed", error=type(e).__name__, detail=str(e))
+            return
+        finally:
+            if self._running.get(key) is job:
+                del self._running[key]
+        if job.get("superseded"):
+            return
+        self.publish(key[0], "ai_message", {
+            "ticket": job["tickets"][-1],
+            "tickets": job["tickets"],
+            "ai_message": ai_message,
+            **job["extra"],
+        })
+
+    # --- subscribing ---
+
+    async def stream(self, user_id: str):
+        """Async generator of SSE frames for one subscriber of ``user_id``'s messages."""
+        queue = asyncio.Queue()
+        self._subscribers.setdefault(user_id, set()).add(queue)
+        try:
+            yield ": connected\n\n"
+            while True:
+                try:
+                    event, data = await asyncio.wait_for(queue.get(), self.keepalive)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+        finally:
+            queues = self._subscribers.get(user_id)
+            if queues is not None:
+                queues.discard(queue)
+                if not queues:
+                    del self._subscribers[user_id]
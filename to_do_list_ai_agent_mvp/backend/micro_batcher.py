@@ -0,0 +1,112 @@
+import asyncio
+import re
+import time
+from collections import deque
+
+from background import spawn
+from llm_gateway import resolve_fallback
+
+_NUMBERED_LINE = re.compile(r"^\s*(\d+)\s*[.):\-]\s*(.*\S)")
+
+
+def parse_numbered(text: str, count: int) -> dict:
+    """Map item number -> line for a numbered multi-item reply, ignoring anything else."""
+    lines = {}
+    for raw in text.splitlines():
+        match = _NUMBERED_LINE.match(raw)
+        if match:
+            number = int(match.group(1))
+            if 1 <= number <= count and number not in lines:
+                lines[number] = match.group(2).strip()
+    return lines
+
+
+class _Batch:
+    def __init__(self, loop):
+        self.loop = loop
+        self.items = []  # (situation, fallback, future, queued_at)
+        self.timer = None
+
+
+class MicroBatcher:
+    """Collects generation requests that arrive close together into one model call.
+
+    The first request opens a batch; it is sent ``window`` seconds later, or
+    as soon as it holds ``max_items``. A lone request goes out as its usual
+    single prompt. Several go out as one numbered multi-item prompt, and the
+    numbered reply is split back to each waiting caller. An item missing
+    from the reply is retried on its own; if the batched call fails
+    outright, every item gets its fallback, since the gateway already
+    retried it.
+    """
+
+    def __init__(self, gateway, single_prompt, batch_prompt, window: float = 0.02, max_items: int = 8):
+        self.gateway = gateway
+        self.single_prompt = single_prompt  # (situation) -> prompt
+        self.batch_prompt = batch_prompt  # ([situation, ...]) -> numbered prompt
+        self.window = window
+        self.max_items = max_items
+        self._batch = None
+        self.model_calls = 0
+        self.items = 0
+        self._waits = deque(maxlen=1000)  # seconds each item spent waiting for its batch to go out
+
+    async def generate(self, situation: str, fallback=None) -> str:
+        loop = asyncio.get_running_loop()
+        batch = self._batch
+        if batch is None or batch.loop is not loop:
+            batch = self._batch = _Batch(loop)
+            batch.timer = loop.call_later(self.window, self._flush, batch)
+        future = loop.create_future()
+        batch.items.append((situation, fallback, future, time.perf_counter()))
+        if len(batch.items) >= self.max_items:
+            batch.timer.cancel()
+            self._flush(batch)
+        return await future
+
+    def _flush(self, batch: _Batch):
+        if self._batch is batch:
+            self._batch = None
+        spawn(self._send(batch.items), "model batch", batch.loop)
+
+    async def _send(self, items):
+        sent_at = time.perf_counter()
+        self._waits.extend(sent_at - queued_at for _, _, _, queued_at in items)
+        self.items += len(items)
+        if len(items) == 1:
+            await self._send_one(*items[0][:3])
+            return
+
+        self.model_calls += 1
+        # An empty fallback marks a failed call
+        text = await self.gateway.generate(self.batch_prompt([item[0] for item in items]), fallback="")
+        lines = parse_numbered(text, len(items)) if text else {}
+
+        retries = []
+        for number, (situation, fallback, future, _) in enumerate(items, 1):
+            if number in lines:
+                _resolve(future, lines[number])
+            elif text:
+                retries.append(self._send_one(situation, fallback, future))
+            else:
+                _resolve(future, resolve_fallback(fallback))
+        await asyncio.gather(*retries)
+
+    async def _send_one(self, situation: str, fallback, future):
+        self.model_calls += 1
+        _resolve(future, await self.gateway.generate(self.single_prompt(situation), fallback=fallback))
+
+    def stats(self) -> dict:
+        waits = sorted(self._waits)
+        return {
+            "model_calls": self.model_calls,
+            "items": self.items,
+            "items_per_call": round(self.items / self.model_calls, 2) if self.model_calls else 0,
+            "batch_wait_p50_ms": round(waits[len(waits) // 2] * 1000, 2) if waits else None,
+            "batch_wait_p99_ms": round(waits[min(len(waits) - 1, int(len(waits) * 0.99))] * 1000, 2) if waits else None,
+        }
+
+
+def _resolve(future, text: str):
+    if not future.done():  # the caller may have given up
+        future.set_result(text)
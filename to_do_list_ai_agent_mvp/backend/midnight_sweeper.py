@@ -0,0 +1,162 @@
+import asyncio
+import datetime
+import heapq
+import threading
+import time
+from typing import Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from telemetry import StructuredLogger
+
+log = StructuredLogger("midnight_sweeper")
+
+
+def zone_name(timezone: Optional[str]) -> str:
+    """The bucket a stored timezone belongs to; unknown names reset on UTC midnight."""
+    try:
+        ZoneInfo(timezone)
+        return timezone
+    except (ZoneInfoNotFoundError, ValueError, TypeError):
+        return "UTC"
+
+
+def next_midnight(zone: str, now: float) -> float:
+    """Unix time of the first local midnight in ``zone`` after ``now``."""
+    tz = ZoneInfo(zone)
+    tomorrow = datetime.datetime.fromtimestamp(now, tz).date() + datetime.timedelta(days=1)
+    return datetime.datetime.combine(tomorrow, datetime.time(0), tzinfo=tz).timestamp()
+
+
+def due_for_reset(stamp: Optional[str], today: datetime.date, at_boundary: bool = True) -> bool:
+    """Whether a user last reset for local day ``stamp`` (None if never) is due a reset
+    for ``today``. A user never reset is only due at a midnight boundary, not on a catch-up."""
+    return stamp < today.isoformat() if stamp else at_boundary
+
+
+class MidnightSweeper:
+    """Resets every user's day at their own local midnight, from inside the backend.
+
+    Users are bucketed by timezone and the heap holds one entry per bucket,
+    keyed by that zone's next midnight, so the loop wakes once per boundary
+    however many users share it (zones whose midnights coincide wake
+    together). A bucket is swept ``batch_size`` users at a time on a worker
+    thread, so the event loop is never blocked by a sweep. Within a chunk,
+    every ``commit_size`` users hold their locks together and are committed
+    as one storage transaction. Between those slices the storage's write
+    lock is released, so a crowded zone never stalls other writers (other
+    workers' requests, in multi-worker mode) behind one long transaction.
+
+    ``reset(user, today)`` records ``today`` as the user's
+    ``last_reset_date``, which makes sweeping idempotent: a user already
+    reset for the day (by another worker, the ``/midnight-reset`` endpoint
+    or an earlier run) is skipped. At startup every bucket is checked once,
+    so resets missed while the server was down are caught up.
+    """
+
+    def __init__(self, reset, batch_size: int = 200, commit_size: int = 20, clock=time.time):
+        self.reset = reset  # (user, local date) -> None; called holding user.lock
+        self.batch_size = batch_size
+        self.commit_size = commit_size
+        self.clock = clock
+        self.resets = 0
+        self._buckets = {}  # zone -> ids of the users living in it
+        self._zone_of = {}  # user id -> zone
+        self._heap = []  # (next midnight, zone), one entry per non-empty bucket
+        self._scheduled = set()  # zones with a heap entry
+        self._lock = threading.Lock()  # tracking happens on request threads
+        self._wakeup = asyncio.Event()
+        self._loop = None
+
+    def __len__(self) -> int:
+        return len(self._zone_of)
+
+    def zones(self) -> dict:
+        """zone -> number of users in its bucket"""
+        with self._lock:
+            return {zone: len(user_ids) for zone, user_ids in self._buckets.items() if user_ids}
+
+    def track(self, user_id: str, timezone: Optional[str]):
+        """Put a user in their timezone's bucket, moving them if it changed."""
+        zone = zone_name(timezone)
+        with self._lock:
+            old_zone = self._zone_of.get(user_id)
+            if old_zone == zone:
+                return
+            if old_zone is not None:
+                self._buckets[old_zone].discard(user_id)
+            self._zone_of[user_id] = zone
+            self._buckets.setdefault(zone, set()).add(user_id)
+            if zone in self._scheduled:
+                return
+            entry = (next_midnight(zone, self.clock()), zone)
+            heapq.heappush(self._heap, entry)
+            self._scheduled.add(zone)
+            woken = self._heap[0] is entry
+        if woken and self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def run(self, users):
+        """Sweep forever; ``users`` is the registry the buckets' user ids resolve in."""
+        self._loop = asyncio.get_running_loop()
+        now = self.clock()
+        for zone in list(self.zones()):
+            await self.sweep(users, zone, now, at_boundary=False)
+        while True:
+            now = self.clock()
+            with self._lock:
+                due = []
+                while self._heap and self._heap[0][0] <= now:
+                    _, zone = heapq.heappop(self._heap)
+                    self._scheduled.discard(zone)
+                    due.append(zone)
+            for zone in due:
+                try:
+                    swept = await self.sweep(users, zone, now)
+                    log.info("midnight sweep", zone=zone, users_reset=swept)
+                except Exception as e:  # the rest of the bucket is retried at its next midnight
+                    log.error("midnight sweep failed", zone=zone, error=type(e).__name__, detail=str(e))
+                with self._lock:
+                    if self._buckets.get(zone) and zone not in self._scheduled:
+                        heapq.heappush(self._heap, (next_midnight(zone, now), zone))
+                        self._scheduled.add(zone)
+                    elif not self._buckets.get(zone):
+                        self._buckets.pop(zone, None)
+
+            with self._lock:
+                timeout = self._heap[0][0] - self.clock() if self._heap else None
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), None if timeout is None else max(0.0, timeout))
+            except asyncio.TimeoutError:
+                pass
+
+    async def sweep(self, users, zone: str, now: float, at_boundary: bool = True) -> int:
+        """Reset the bucket's users who are not yet reset for their local day at ``now``.
+
+        At a boundary that includes users never reset before; the startup
+        catch-up only resets users whose last reset is from an earlier day,
+        so it cannot wipe a new user's first day.
+        """
+        today = datetime.datetime.fromtimestamp(now, ZoneInfo(zone)).date()
+        with self._lock:
+            user_ids = sorted(self._buckets.get(zone, ()))
+        swept = 0
+        for start in range(0, len(user_ids), self.batch_size):
+            chunk = user_ids[start:start + self.batch_size]
+            swept += await asyncio.to_thread(self._sweep_chunk, users, zone, chunk, today, at_boundary)
+        self.resets += swept
+        return swept
+
+    def _sweep_chunk(self, users, zone: str, user_ids, today: datetime.date, at_boundary: bool) -> int:
+        swept = 0
+        for start in range(0, len(user_ids), self.commit_size):
+            held = [users.get(user_id) for user_id in user_ids[start:start + self.commit_size]]
+            with users.hold(held) as users_in_order:
+                for user in users_in_order:
+                    with user.lock:  # in multi-worker mode this also picks up another worker's reset
+                        if zone_name(user.stats.timezone) != zone:
+                            continue  # moved to another bucket since the sweep started
+                        if due_for_reset(user.stats.last_reset_date, today, at_boundary):
+                            self.reset(user, today)
+                            swept += 1
+        return swept
@@ -0,0 +1,179 @@
+import asyncio
+import datetime
+import heapq
+import inspect
+import itertools
+import threading
+import time
+from typing import Optional
+
+from background import spawn
+
+
+def _as_utc(dt) -> datetime.datetime:
+    if isinstance(dt, str):
+        dt = datetime.datetime.fromisoformat(dt.replace('Z', '+00:00'))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=datetime.timezone.utc)
+    return dt.astimezone(datetime.timezone.utc)
+
+
+def has_reminder(task: dict) -> bool:
+    """Whether a task asks for a reminder at all; 0 or no minutes mean none."""
+    return bool(task.get("reminder_minutes"))
+
+
+def reminder_due_at(task: dict, now: Optional[datetime.datetime] = None) -> Optional[datetime.datetime]:
+    """When a task's reminder should fire, using the same rules the app always had.
+
+    With a deadline the reminder fires ``reminder_minutes`` before it; without
+    one it fires ``reminder_minutes`` from now.
+    """
+    if not has_reminder(task):
+        return None
+    offset = datetime.timedelta(minutes=task["reminder_minutes"])
+    if task.get("deadline"):
+        return _as_utc(task["deadline"]) - offset
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    return now + offset
+
+
+async def _resolved(value):
+    return await value if inspect.isawaitable(value) else value
+
+
+class ReminderScheduler:
+    """Backend reminder timers on a single deadline-ordered min-heap.
+
+    Each pending reminder is one heap entry keyed by the time its text should
+    start generating (``lead_time`` seconds before it is due). Reminders are
+    identified by a caller-chosen hashable key (the app uses
+    ``(user_id, task_id)``, so every user shares one heap). Rescheduling
+    or cancelling just records the key's current entry and leaves the old
+    one in the heap to be skipped when popped, so every update is O(log n);
+    the heap is compacted when stale entries outnumber live ones.
+
+    The ``run`` loop sleeps until the earliest entry, pre-generates that
+    reminder's text, waits for the due time and hands the text to
+    ``deliver``. Due times are stored on the task (``reminder_at``), so the
+    heap is rebuilt from the task store after a restart.
+
+    ``schedule`` and ``cancel`` are called from request threads and the
+    registry's reload hook as well as the event loop, so the heap is
+    guarded by a thread lock and the loop is woken with
+    ``call_soon_threadsafe``.
+    """
+
+    def __init__(self, generate, deliver, lead_time: float = 60.0):
+        self.generate = generate  # async (key, task) -> reminder text
+        self.deliver = deliver  # (key, task, text) -> None, or an awaitable
+        self.lead_time = lead_time
+        self._heap = []  # (generate_at, seq, key, due_at)
+        self._live = {}  # key -> seq of its current entry
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._wakeup = asyncio.Event()
+        self._loop = None
+
+    def __len__(self) -> int:
+        return len(self._live)
+
+    def rebuild(self, entries):
+        """Rebuild the heap from scratch in O(n) from ``(key, task)`` pairs, e.g. at startup."""
+        heap, live = [], {}
+        for key, task in entries:
+            if task.get("reminder_at") and not task["is_completed"]:
+                due_at = _as_utc(task["reminder_at"]).timestamp()
+                seq = next(self._seq)
+                live[key] = seq
+                heap.append((due_at - self.lead_time, seq, key, due_at))
+        heapq.heapify(heap)
+        with self._lock:
+            self._heap, self._live = heap, live
+        self._wake()
+
+    def schedule(self, key, task: dict):
+        """Add or move a task's reminder, or drop it if the task no longer needs one."""
+        if not task.get("reminder_at") or task["is_completed"]:
+            self.cancel(key)
+            return
+        due_at = _as_utc(task["reminder_at"]).timestamp()
+        with self._lock:
+            seq = next(self._seq)
+            self._live[key] = seq
+            entry = (due_at - self.lead_time, seq, key, due_at)
+            heapq.heappush(self._heap, entry)
+            woken = self._heap[0] is entry
+            self._compact()
+        if woken:
+            self._wake()
+
+    def cancel(self, key):
+        with self._lock:
+            if self._live.pop(key, None) is not None:
+                self._compact()
+
+    def clear(self):
+        with self._lock:
+            self._heap = []
+            self._live = {}
+
+    def next_due(self) -> Optional[float]:
+        with self._lock:
+            self._drop_stale_top()
+            return self._heap[0][3] if self._heap else None
+
+    def _wake(self):
+        # asyncio.Event is not thread-safe, so it is only ever set on the loop
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def _is_live(self, entry) -> bool:
+        return self._live.get(entry[2]) == entry[1]
+
+    def _drop_stale_top(self):
+        while self._heap and not self._is_live(self._heap[0]):
+            heapq.heappop(self._heap)
+
+    def _compact(self):
+        if len(self._heap) > 2 * len(self._live) + 64:
+            self._heap = [entry for entry in self._heap if self._is_live(entry)]
+            heapq.heapify(self._heap)
+
+    async def run(self, get_task):
+        """Fire reminders forever; ``get_task(key)`` (or its awaitable) is the latest task state."""
+        self._loop = asyncio.get_running_loop()
+        while True:
+            self._wakeup.clear()  # before reading the heap, so a wakeup during the read is kept
+            now = time.time()
+            due = []
+            with self._lock:
+                self._drop_stale_top()
+                while self._heap and self._heap[0][0] <= now:
+                    _, seq, key, due_at = heapq.heappop(self._heap)
+                    if self._live.get(key) == seq:
+                        due.append((key, seq, due_at))
+                    self._drop_stale_top()
+                timeout = self._heap[0][0] - now if self._heap else None
+            for key, seq, due_at in due:
+                spawn(self._fire(get_task, key, seq, due_at), "reminder", self._loop)
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _fire(self, get_task, key, seq: int, due_at: float):
+        task = await _resolved(get_task(key))
+        if task is None:
+            return
+        text = await self.generate(key, task)
+        await asyncio.sleep(max(0.0, due_at - time.time()))
+        # The task may have been edited, completed or deleted while we waited
+        with self._lock:
+            if self._live.get(key) != seq:
+                return
+            del self._live[key]
+        task = await _resolved(get_task(key))
+        if task is not None and not task["is_completed"]:
+            await _resolved(self.deliver(key, task, text))
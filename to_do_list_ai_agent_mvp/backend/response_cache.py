@@ -0,0 +1,121 @@
+import asyncio
+import re
+import time
+from collections import OrderedDict, deque
+
+from background import spawn
+
+
+def normalize_template(prompt: str) -> str:
+    return re.sub(r"\s+", " ", prompt).strip().lower()
+
+
+def streak_bucket(streak: int) -> str:
+    if streak <= 1:
+        return "first day"
+    if streak < 7:
+        return "a few days"
+    if streak < 30:
+        return "weeks"
+    return "a month or more"
+
+
+def count_bucket(count: int) -> str:
+    if count <= 1:
+        return "one"
+    if count <= 5:
+        return "a handful"
+    return "loads"
+
+
+class _Pool:
+    def __init__(self, prompt: str):
+        self.prompt = prompt
+        self.variants = deque()  # (created_at, text)
+        self.served = deque(maxlen=50)  # recent lines, so a refill never brings one back
+        self.refilling = False
+
+
+class ResponseCache:
+    """Rotating pools of pre-generated lines for fixed-situation prompts.
+
+    Pools are keyed by the normalised prompt template plus a state bucket
+    (completion band, streak range, ...). Each line is served once and then
+    dropped, which keeps the persona's "never repeat" rule. When a pool runs
+    low it is refilled in the background, so the request path only waits on
+    the model when a pool is completely empty. Lines expire after ``ttl``
+    seconds and the least recently used pools are evicted past ``max_pools``.
+    """
+
+    def __init__(self, generate, pool_size: int = 6, low_water: int = 2,
+                 ttl: float = 6 * 3600, max_pools: int = 256):
+        self.generate = generate  # async (prompt, fallback=...) -> str
+        self.pool_size = pool_size
+        self.low_water = low_water
+        self.ttl = ttl
+        self.max_pools = max_pools
+        self._pools = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, prompt: str, bucket: str = "", fallback=None, **options) -> str:
+        """A pooled line, or on a miss a fresh one (``options`` go to ``generate``)."""
+        text = self.take(prompt, bucket)
+        if text is None:
+            text = await self.generate(prompt, fallback=fallback, **options)
+            self.remember(prompt, bucket, text)
+        return text
+
+    def take(self, prompt: str, bucket: str = ""):
+        """Pop a pooled line without waiting, or return None on a miss.
+
+        Either way the pool is topped up in the background if it is low.
+        """
+        pool = self._pool((normalize_template(prompt), bucket), prompt)
+        self._expire(pool)
+
+        text = None
+        if pool.variants:
+            self.hits += 1
+            _, text = pool.variants.popleft()
+            pool.served.append(text)
+        else:
+            self.misses += 1
+
+        if len(pool.variants) <= self.low_water and not pool.refilling:
+            pool.refilling = True
+            spawn(self._refill(pool), "response pool refill")
+        return text
+
+    def remember(self, prompt: str, bucket: str, text: str):
+        """Record a line generated on a miss, so refills never bring it back."""
+        self._pool((normalize_template(prompt), bucket), prompt).served.append(text)
+
+    def _pool(self, key, prompt: str) -> _Pool:
+        pool = self._pools.get(key)
+        if pool is None:
+            pool = self._pools[key] = _Pool(prompt)
+            if len(self._pools) > self.max_pools:
+                self._pools.popitem(last=False)
+        else:
+            self._pools.move_to_end(key)
+        return pool
+
+    def _expire(self, pool: _Pool):
+        cutoff = time.monotonic() - self.ttl
+        while pool.variants and pool.variants[0][0] < cutoff:
+            pool.variants.popleft()
+
+    async def _refill(self, pool: _Pool):
+        try:
+            missing = self.pool_size - len(pool.variants)
+            # An empty fallback marks a failed generation, which is never pooled
+            texts = await asyncio.gather(*(self.generate(pool.prompt, fallback="") for _ in range(missing)))
+            known = set(pool.served) | {text for _, text in pool.variants}
+            now = time.monotonic()
+            for text in texts:
+                if text and text not in known:
+                    known.add(text)
+                    pool.variants.append((now, text))
+        finally:
+            pool.refilling = False
@@ -0,0 +1,174 @@
+import bisect
+import heapq
+import math
+import re
+from collections import Counter
+from typing import Dict, Hashable, List, Tuple
+
+_WORD = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-cased word tokens; punctuation and emoji separate words."""
+    return _WORD.findall(text.casefold()) if text else []
+
+
+class SearchIndex:
+    """Inverted index over short texts (task descriptions), updated in place.
+
+    ``_postings`` maps each term to the documents containing it and how
+    often, ``_tiers`` splits the same documents by (text length, count),
+    and ``_terms`` keeps the vocabulary sorted, so a prefix expands to its
+    terms with one bisect. Adding, replacing or dropping a document only
+    touches that document's own terms; nothing is ever rebuilt.
+
+    A query matches documents containing every term; with ``prefix`` the
+    last term may be the start of a word, as it is while someone types.
+    Matches are ranked by BM25, so rarer terms and shorter texts weigh more,
+    and equal scores go to the most recently indexed text. All texts in a
+    tier share an upper bound on their score, so tiers are visited from the
+    highest bound down and the search stops as soon as nothing left can
+    beat the results it has; a common word costs about as much as a rare
+    one. Prefixes expand to at most ``max_expansions`` terms, as
+    autocomplete only needs the likeliest ones.
+    """
+
+    K1 = 1.2
+    B = 0.75
+
+    def __init__(self, max_expansions: int = 64):
+        self.max_expansions = max_expansions
+        self._postings: Dict[str, Dict[Hashable, int]] = {}  # term -> {doc id: count}
+        self._tiers: Dict[str, Dict[Tuple[int, int], Dict[Hashable, None]]] = {}  # term -> {(length, count): doc ids}
+        self._doc_terms: Dict[Hashable, Counter] = {}  # doc id -> its term counts
+        self._doc_lengths: Dict[Hashable, int] = {}
+        self._terms: List[str] = []  # the vocabulary, sorted
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return len(self._doc_terms)
+
+    def add(self, doc_id: Hashable, text: str):
+        """Index ``text`` under ``doc_id``, replacing what was indexed for it before."""
+        terms = Counter(tokenize(text))
+        if self._doc_terms.get(doc_id) == terms:
+            return
+        self.discard(doc_id)
+        self._doc_terms[doc_id] = terms
+        self._doc_lengths[doc_id] = length = sum(terms.values())
+        self._total_length += length
+        for term, count in terms.items():
+            docs = self._postings.get(term)
+            if docs is None:
+                docs = self._postings[term] = {}
+                self._tiers[term] = {}
+                bisect.insort(self._terms, term)
+            docs[doc_id] = count
+            self._tiers[term].setdefault((length, count), {})[doc_id] = None  # dicts keep insertion order
+
+    def discard(self, doc_id: Hashable):
+        terms = self._doc_terms.pop(doc_id, None)
+        if terms is None:
+            return
+        length = self._doc_lengths.pop(doc_id)
+        self._total_length -= length
+        for term, count in terms.items():
+            docs = self._postings[term]
+            del docs[doc_id]
+            tiers = self._tiers[term]
+            tier = tiers[(length, count)]
+            del tier[doc_id]
+            if not tier:
+                del tiers[(length, count)]
+            if not docs:
+                del self._postings[term]
+                del self._tiers[term]
+                del self._terms[bisect.bisect_left(self._terms, term)]
+
+    def clear(self):
+        self._postings = {}
+        self._tiers = {}
+        self._doc_terms = {}
+        self._doc_lengths = {}
+        self._terms = []
+        self._total_length = 0
+
+    def expand(self, prefix: str) -> List[str]:
+        """Vocabulary terms starting with ``prefix``, most widely used first."""
+        start = bisect.bisect_left(self._terms, prefix)
+        end = bisect.bisect_left(self._terms, prefix + "\U0010ffff")
+        terms = self._terms[start:end]
+        if len(terms) > self.max_expansions:
+            terms = sorted(terms, key=lambda term: len(self._postings[term]), reverse=True)[:self.max_expansions]
+        return terms
+
+    def search(self, query: str, limit: int = 20, prefix: bool = True) -> List[Tuple[Hashable, float]]:
+        """``(doc id, score)`` of the best ``limit`` matches, best first."""
+        tokens = tokenize(query)
+        if not tokens or not self._doc_terms or limit < 1:
+            return []
+        # Each query token is a group of alternative terms; a document must match every group
+        groups = [[token] for token in dict.fromkeys(tokens)]
+        if prefix and not query[-1:].isspace():
+            groups[-1] = self.expand(tokens[-1])
+        groups = [[term for term in group if term in self._postings] for group in groups]
+        if not all(groups):
+            return []
+        # Documents are drawn from the smallest group and checked against the others
+        groups.sort(key=lambda group: sum(len(self._postings[term]) for term in group))
+
+        total = len(self._doc_terms)
+        average_length = self._total_length / total or 1
+        k1, b = self.K1, self.B
+
+        def weight(term):
+            frequency = len(self._postings[term])
+            return math.log(1 + (total - frequency + 0.5) / (frequency + 0.5)) * (k1 + 1)
+
+        def norm(length):
+            return k1 * (1 - b + b * length / average_length)
+
+        first, rest = groups[0], [[(self._postings[term], weight(term)) for term in group] for group in groups[1:]]
+        rest_weights = [max(w for _, w in group) for group in rest]
+        tiers = []  # (score bound, tier) for every tier of the first group
+        for term in first:
+            w = weight(term)
+            for (length, count), docs in self._tiers[term].items():
+                n = norm(length)
+                # another group's term occurs at most ``length`` times, and a higher count only scores more
+                bound = w * count / (count + n) + sum(rw * length / (length + n) for rw in rest_weights)
+                tiers.append((bound, length, w * count / (count + n), docs))
+        tiers.sort(key=lambda tier: tier[0], reverse=True)
+
+        best = []  # min-heap of the top (score, -visit order, doc id) so far
+        seen = set() if len(first) > 1 else None
+        visited = 0
+        for bound, length, first_score, docs in tiers:
+            if len(best) == limit and best[0][0] >= bound:
+                break  # every tier after this one is bounded lower still
+            n = norm(length)
+            for doc_id in reversed(docs):  # newest first, so they win ties
+                if seen is not None:
+                    if doc_id in seen:
+                        continue  # matched a better term of the same group already
+                    seen.add(doc_id)
+                score = first_score
+                for group in rest:
+                    top = 0.0
+                    for postings, w in group:
+                        count = postings.get(doc_id)
+                        if count:
+                            top = max(top, w * count / (count + n))
+                    if not top:
+                        break
+                    score += top
+                else:
+                    visited += 1
+                    entry = (score, -visited, doc_id)
+                    if len(best) < limit:
+                        heapq.heappush(best, entry)
+                    elif entry > best[0]:
+                        heapq.heapreplace(best, entry)
+                    if len(best) == limit and best[0][0] >= bound:
+                        break
+        return [(doc_id, score) for score, _, doc_id in sorted(best, reverse=True)]
@@ -0,0 +1,85 @@
+import asyncio
+import time
+from collections import deque
+from typing import Optional
+
+from background import spawn
+
+
+class _Lines:
+    def __init__(self, description: str):
+        self.description = description
+        self.completed = None  # line for completing this task while others remain
+        self.last = None  # line for completing it as the last open task
+        self.pending = True
+
+
+class SpeculativeLines:
+    """Completion lines generated ahead of time, one pair per task.
+
+    A task's completion line depends only on its description and on whether
+    it is the last open task, so both lines are generated in the background
+    as soon as the task is created or renamed. Completing the task then
+    takes a ready line with no model call on the request path. Each line is
+    served once; a task that is unchecked gets a fresh pair. Lines generated
+    for an old description are never served.
+    """
+
+    def __init__(self, generate, completed_prompt, last_prompt):
+        self.generate = generate  # async (prompt, fallback=...) -> str
+        self.completed_prompt = completed_prompt  # (description) -> prompt
+        self.last_prompt = last_prompt  # (description) -> prompt
+        self._lines = {}  # task key -> _Lines
+        self.hits = 0
+        self.misses = 0
+        self._fill_seconds = deque(maxlen=500)
+
+    def prepare(self, key, description: str):
+        lines = self._lines.get(key)
+        if lines is not None and lines.description == description and (lines.pending or (lines.completed and lines.last)):
+            return
+        lines = self._lines[key] = _Lines(description)
+        spawn(self._fill(key, lines), "completion line pre-generation")
+
+    async def _fill(self, key, lines: _Lines):
+        started = time.perf_counter()
+        # An empty fallback marks a failed generation, which is never stored
+        completed, last = await asyncio.gather(
+            self.generate(self.completed_prompt(lines.description), fallback=""),
+            self.generate(self.last_prompt(lines.description), fallback=""),
+        )
+        self._fill_seconds.append(time.perf_counter() - started)
+        lines.pending = False
+        if self._lines.get(key) is lines:  # not renamed or deleted meanwhile
+            lines.completed = completed or None
+            lines.last = last or None
+
+    def take(self, key, description: str, last: bool) -> Optional[str]:
+        """Pop the ready line for completing this task, or None on a miss."""
+        lines = self._lines.get(key)
+        text = None
+        if lines is not None and lines.description == description:
+            if last:
+                text, lines.last = lines.last, None
+            else:
+                text, lines.completed = lines.completed, None
+        if text is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return text
+
+    def discard(self, key):
+        self._lines.pop(key, None)
+
+    def stats(self) -> dict:
+        fills = sorted(self._fill_seconds)
+        served = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / served, 3) if served else None,
+            "tasks_prepared": len(self._lines),
+            "fill_p50_ms": round(fills[len(fills) // 2] * 1000, 2) if fills else None,
+            "fill_p95_ms": round(fills[min(len(fills) - 1, int(len(fills) * 0.95))] * 1000, 2) if fills else None,
+        }
@@ -0,0 +1,602 @@
+import contextlib
+import datetime
+import json
+import os
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from telemetry import span
+
+# Task fields that hold datetimes and need converting back after a JSON round trip
+DATETIME_FIELDS = ("deadline", "created_at", "reminder_at")
+
+
+def _encode(value):
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialise {type(value).__name__}")
+
+
+def _decode_task(data) -> dict:
+    """A stored task (its JSON, or the dict parsed from an archive) with datetimes restored."""
+    task = json.loads(data) if isinstance(data, str) else data
+    for field in DATETIME_FIELDS:
+        if isinstance(task.get(field), str):
+            task[field] = datetime.datetime.fromisoformat(task[field])
+    return task
+
+
+class MemoryStorage:
+    """Default backend: nothing is persisted, state lives only in the process.
+
+    ``for_user`` hands out the storage view for one user's partition. Every
+    view exposes the same methods, so the task store and the endpoints call
+    them unconditionally; this backend is its own (no-op) view.
+    """
+
+    shared = False  # True when several worker processes share the backend
+
+    def for_user(self, user_id: str):
+        return self
+
+    def user_ids(self) -> List[str]:
+        return []
+
+    def load_tasks(self) -> List[dict]:
+        return []
+
+    def load_next_task_id(self) -> int:
+        return 1
+
+    def save_task(self, task: dict, next_task_id: int):
+        pass
+
+    def delete_task(self, task_id: int):
+        pass
+
+    def clear_tasks(self):
+        pass
+
+    def load_quests(self) -> List[dict]:
+        return []
+
+    def save_quests(self, quests: List[dict]):
+        pass
+
+    def load_user_stats(self) -> Optional[dict]:
+        return None
+
+    def save_user_stats(self, stats: dict):
+        pass
+
+    def append_event(self, day: str, ts: int, kind: int, task_id: Optional[int]):
+        pass
+
+    def load_rollups(self) -> dict:
+        return {}
+
+    def save_rollup(self, day: str, rollup: dict):
+        pass
+
+    def archive_day(self, day: str, archive: dict):
+        pass
+
+    def load_archived_tasks(self, days: int) -> List[Tuple[str, dict]]:
+        return []
+
+    def batch(self):
+        """Commit the writes made inside as one transaction."""
+        return contextlib.nullcontext()
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class _SQLitePartition(MemoryStorage):
+    """One user's view of a SQLiteStorage; calls are timed as a request's storage span."""
+
+    def __init__(self, backend, user_id: str):
+        self.backend = backend
+        self.user_id = user_id
+
+    def load_tasks(self):
+        with span("storage"):
+            return self.backend.load_tasks(self.user_id)
+
+    def load_next_task_id(self):
+        with span("storage"):
+            return self.backend.load_next_task_id(self.user_id)
+
+    def save_task(self, task, next_task_id):
+        with span("storage"):
+            self.backend.save_task(self.user_id, task, next_task_id)
+
+    def delete_task(self, task_id):
+        with span("storage"):
+            self.backend.delete_task(self.user_id, task_id)
+
+    def clear_tasks(self):
+        with span("storage"):
+            self.backend.clear_tasks(self.user_id)
+
+    def load_quests(self):
+        with span("storage"):
+            return self.backend.load_quests(self.user_id)
+
+    def save_quests(self, quests):
+        with span("storage"):
+            self.backend.save_quests(self.user_id, quests)
+
+    def load_user_stats(self):
+        with span("storage"):
+            return self.backend.load_user_stats(self.user_id)
+
+    def save_user_stats(self, stats):
+        with span("storage"):
+            self.backend.save_user_stats(self.user_id, stats)
+
+    def append_event(self, day, ts, kind, task_id):
+        with span("storage"):
+            self.backend.append_event(self.user_id, day, ts, kind, task_id)
+
+    def load_rollups(self):
+        with span("storage"):
+            return self.backend.load_rollups(self.user_id)
+
+    def save_rollup(self, day, rollup):
+        with span("storage"):
+            self.backend.save_rollup(self.user_id, day, rollup)
+
+    def archive_day(self, day, archive):
+        with span("storage"):
+            self.backend.archive_day(self.user_id, day, archive)
+
+    def load_archived_tasks(self, days):
+        with span("storage"):
+            return self.backend.load_archived_tasks(self.user_id, days)
+
+
+class SQLiteStorage:
+    """SQLite (WAL) backend with write-behind group commits.
+
+    Every table is partitioned by ``user_id``; ``for_user`` returns the view
+    one user's state is loaded from and written through. Reads are served
+    by the in-memory structures, so writes are only queued here, with
+    repeated writes to the same row collapsing into one. A writer thread
+    commits the queue in one transaction when it holds ``batch_size`` task
+    rows or ``flush_interval`` seconds after the first queued write,
+    whichever comes first, so requests never wait on a commit. All SQL is
+    fixed text, so sqlite3's statement cache keeps each one prepared.
+    """
+
+    shared = False
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS tasks (
+            user_id TEXT NOT NULL,
+            id INTEGER NOT NULL,
+            is_completed INTEGER NOT NULL DEFAULT 0,
+            deadline TEXT,
+            data TEXT NOT NULL,
+            PRIMARY KEY (user_id, id)
+        );
+        CREATE INDEX IF NOT EXISTS idx_tasks_is_completed ON tasks (user_id, is_completed);
+        CREATE INDEX IF NOT EXISTS idx_tasks_deadline ON tasks (user_id, deadline);
+        CREATE TABLE IF NOT EXISTS daily_quests (
+            user_id TEXT NOT NULL,
+            id INTEGER NOT NULL,
+            data TEXT NOT NULL,
+            PRIMARY KEY (user_id, id)
+        );
+        CREATE TABLE IF NOT EXISTS user_stats (
+            user_id TEXT PRIMARY KEY,
+            data TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS next_task_ids (
+            user_id TEXT PRIMARY KEY,
+            next_id INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS events (
+            user_id TEXT NOT NULL,
+            day TEXT NOT NULL,
+            ts INTEGER NOT NULL,
+            kind INTEGER NOT NULL,
+            task_id INTEGER
+        );
+        CREATE INDEX IF NOT EXISTS idx_events_day ON events (user_id, day);
+        CREATE TABLE IF NOT EXISTS day_rollups (
+            user_id TEXT NOT NULL,
+            day TEXT NOT NULL,
+            data TEXT NOT NULL,
+            PRIMARY KEY (user_id, day)
+        );
+        CREATE TABLE IF NOT EXISTS day_archives (
+            user_id TEXT NOT NULL,
+            day TEXT NOT NULL,
+            data TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_day_archives_day ON day_archives (user_id, day);
+    """
+
+    UPSERT_TASK = "INSERT OR REPLACE INTO tasks (user_id, id, is_completed, deadline, data) VALUES (?, ?, ?, ?, ?)"
+    DELETE_TASK = "DELETE FROM tasks WHERE user_id = ? AND id = ?"
+    CLEAR_TASKS = "DELETE FROM tasks WHERE user_id = ?"
+    SET_NEXT_TASK_ID = "INSERT OR REPLACE INTO next_task_ids (user_id, next_id) VALUES (?, ?)"
+    CLEAR_QUESTS = "DELETE FROM daily_quests WHERE user_id = ?"
+    INSERT_QUEST = "INSERT INTO daily_quests (user_id, id, data) VALUES (?, ?, ?)"
+    UPSERT_USER_STATS = "INSERT OR REPLACE INTO user_stats (user_id, data) VALUES (?, ?)"
+    INSERT_EVENT = "INSERT INTO events (user_id, day, ts, kind, task_id) VALUES (?, ?, ?, ?, ?)"
+    UPSERT_ROLLUP = "INSERT OR REPLACE INTO day_rollups (user_id, day, data) VALUES (?, ?, ?)"
+    INSERT_ARCHIVE = "INSERT INTO day_archives (user_id, day, data) VALUES (?, ?, ?)"
+
+    def __init__(self, path: str, batch_size: int = 64, flush_interval: float = 0.05):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(self.SCHEMA)
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        # Serialises use of the connection between request threads and the writer thread;
+        # reentrant so a shared-mode transaction can read while it holds it
+        self._write_lock = threading.RLock()
+        self._closed = False
+        self._reset_pending()
+        self._writer = threading.Thread(target=self._writer_loop, name="sqlite-writer", daemon=True)
+        self._writer.start()
+
+    def for_user(self, user_id: str):
+        return _SQLitePartition(self, user_id)
+
+    # --- reads (once per user, when their partition is first loaded) ---
+
+    def _read(self, sql, params=()):
+        with self._write_lock:  # the connection is shared with the writer thread
+            return self._conn.execute(sql, params).fetchall()
+
+    def user_ids(self) -> List[str]:
+        """Users with stored tasks or quests, so their reminders and midnight resets are scheduled at startup."""
+        return [user_id for (user_id,) in self._read("SELECT user_id FROM tasks UNION SELECT user_id FROM daily_quests")]
+
+    def load_tasks(self, user_id: str) -> List[dict]:
+        rows = self._read("SELECT data FROM tasks WHERE user_id = ? ORDER BY id", (user_id,))
+        return [_decode_task(data) for (data,) in rows]
+
+    def load_next_task_id(self, user_id: str) -> int:
+        rows = self._read("SELECT next_id FROM next_task_ids WHERE user_id = ?", (user_id,))
+        return rows[0][0] if rows else 1
+
+    def load_quests(self, user_id: str) -> List[dict]:
+        rows = self._read("SELECT data FROM daily_quests WHERE user_id = ? ORDER BY id", (user_id,))
+        return [json.loads(data) for (data,) in rows]
+
+    def load_user_stats(self, user_id: str) -> Optional[dict]:
+        rows = self._read("SELECT data FROM user_stats WHERE user_id = ?", (user_id,))
+        return json.loads(rows[0][0]) if rows else None
+
+    def load_rollups(self, user_id: str) -> dict:
+        rows = self._read("SELECT day, data FROM day_rollups WHERE user_id = ?", (user_id,))
+        return {day: json.loads(data) for day, data in rows}
+
+    def load_archives(self, user_id: str, day: str) -> List[dict]:
+        rows = self._read("SELECT data FROM day_archives WHERE user_id = ? AND day = ? ORDER BY rowid", (user_id, day))
+        return [json.loads(data) for (data,) in rows]
+
+    def load_archived_tasks(self, user_id: str, days: int) -> List[Tuple[str, dict]]:
+        """(day, task) for every task in the user's last ``days`` archived days, oldest first."""
+        rows = self._read(
+            "SELECT day, data FROM day_archives WHERE user_id = ? AND day IN"
+            " (SELECT DISTINCT day FROM day_archives WHERE user_id = ? ORDER BY day DESC LIMIT ?)"
+            " ORDER BY rowid", (user_id, user_id, days))
+        tasks = []
+        for day, data in rows:
+            tasks.extend((day, _decode_task(task)) for task in json.loads(data)["tasks"])
+        return tasks
+
+    # --- writes (queued) ---
+
+    def save_task(self, user_id: str, task: dict, next_task_id: int):
+        deadline = task.get("deadline")
+        row = (
+            user_id,
+            task["id"],
+            int(task["is_completed"]),
+            _encode(deadline) if isinstance(deadline, datetime.datetime) else deadline,
+            json.dumps(task, default=_encode),
+        )
+        with self._lock:
+            self._task_writes[(user_id, task["id"])] = row
+            self._next_task_ids[user_id] = next_task_id
+            self._queued_locked()
+
+    def delete_task(self, user_id: str, task_id: int):
+        with self._lock:
+            self._task_writes[(user_id, task_id)] = None
+            self._queued_locked()
+
+    def clear_tasks(self, user_id: str):
+        with self._lock:
+            for key in [key for key in self._task_writes if key[0] == user_id]:
+                del self._task_writes[key]
+            self._cleared_users.add(user_id)  # the id sequence carries on
+            self._queued_locked()
+
+    def save_quests(self, user_id: str, quests: List[dict]):
+        rows = [(user_id, q["id"], json.dumps(q, default=_encode)) for q in quests]
+        with self._lock:
+            self._quest_rows[user_id] = rows
+            self._queued_locked()
+
+    def save_user_stats(self, user_id: str, stats: dict):
+        with self._lock:
+            self._user_stats_rows[user_id] = (user_id, json.dumps(stats, default=_encode))
+            self._queued_locked()
+
+    def append_event(self, user_id: str, day: str, ts: int, kind: int, task_id: Optional[int]):
+        with self._lock:
+            self._events.append((user_id, day, ts, kind, task_id))  # append-only, so never collapsed
+            self._queued_locked()
+
+    def save_rollup(self, user_id: str, day: str, rollup: dict):
+        with self._lock:
+            self._rollup_rows[(user_id, day)] = (user_id, day, json.dumps(rollup))
+            self._queued_locked()
+
+    def archive_day(self, user_id: str, day: str, archive: dict):
+        with self._lock:
+            self._archives.append((user_id, day, json.dumps(archive, default=_encode)))
+            self._queued_locked()
+
+    def _queued_locked(self):
+        # Repeated writes to the same row inside one batch collapse into the
+        # last one, so only distinct rows count towards the batch size.
+        self._dirty = True
+        if len(self._task_writes) >= self.batch_size:
+            self._wakeup.notify()
+
+    def _writer_loop(self):
+        while True:
+            with self._wakeup:
+                self._wakeup.wait_for(lambda: self._dirty or self._closed)
+                if self._closed:
+                    return
+                # Give the batch up to flush_interval to fill before committing
+                self._wakeup.wait_for(
+                    lambda: len(self._task_writes) >= self.batch_size or self._closed,
+                    timeout=self.flush_interval,
+                )
+            self.flush()
+
+    @contextlib.contextmanager
+    def batch(self):
+        """Hold back the writer thread so everything queued inside commits as one transaction."""
+        with self._write_lock:
+            yield
+            self.flush()
+
+    def flush(self):
+        """Commit everything queued so far in one transaction."""
+        with self._write_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                batch = self._take_pending()
+            self._commit(batch)
+
+    def _commit(self, batch):
+        self._conn.execute("BEGIN")
+        try:
+            self._apply(batch)
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+
+    def _apply(self, batch):
+        task_writes, cleared_users, next_task_ids, quest_rows, user_stats_rows, events, rollup_rows, archives = batch
+        deletes = [key for key, row in task_writes.items() if row is None]
+        upserts = [row for row in task_writes.values() if row is not None]
+        if cleared_users:
+            self._conn.executemany(self.CLEAR_TASKS, [(user_id,) for user_id in cleared_users])
+        if deletes:
+            self._conn.executemany(self.DELETE_TASK, deletes)
+        if upserts:
+            self._conn.executemany(self.UPSERT_TASK, upserts)
+        if next_task_ids:
+            self._conn.executemany(self.SET_NEXT_TASK_ID, next_task_ids.items())
+        for user_id, rows in quest_rows.items():
+            self._conn.execute(self.CLEAR_QUESTS, (user_id,))
+            self._conn.executemany(self.INSERT_QUEST, rows)
+        if user_stats_rows:
+            self._conn.executemany(self.UPSERT_USER_STATS, user_stats_rows.values())
+        if events:
+            self._conn.executemany(self.INSERT_EVENT, events)
+        if rollup_rows:
+            self._conn.executemany(self.UPSERT_ROLLUP, rollup_rows.values())
+        if archives:
+            self._conn.executemany(self.INSERT_ARCHIVE, archives)
+
+    def _take_pending(self):
+        batch = (self._task_writes, self._cleared_users, self._next_task_ids,
+                 self._quest_rows, self._user_stats_rows, self._events, self._rollup_rows, self._archives)
+        self._reset_pending()
+        return batch
+
+    def _reset_pending(self):
+        self._task_writes = {}  # (user id, task id) -> row to upsert, or None to delete
+        self._cleared_users = set()
+        self._next_task_ids = {}
+        self._quest_rows = {}
+        self._user_stats_rows = {}
+        self._events = []  # rows to insert, in order
+        self._rollup_rows = {}  # (user id, day) -> row to upsert
+        self._archives = []  # rows to insert, in order
+        self._dirty = False
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            self._wakeup.notify()
+        self._writer.join()
+        self.flush()
+        self._conn.close()
+
+
+class SharedSQLiteStorage(SQLiteStorage):
+    """SQLiteStorage for several worker processes sharing one database.
+
+    Each worker still serves reads from its own in-memory partitions, so
+    writes can no longer be deferred: a user's writes are made inside a
+    write transaction (``begin`` / ``commit``) that the user's lock holds,
+    which also serialises writers across processes. Every commit appends
+    the user to the ``changes`` log; ``changed_users`` polls it (only when
+    ``PRAGMA data_version`` says another connection committed) so each
+    worker can reload the partitions another worker changed.
+    """
+
+    shared = True
+
+    CHANGES_SCHEMA = """
+        CREATE TABLE IF NOT EXISTS changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_changes_user ON changes (user_id, seq);
+    """
+    RECORD_CHANGE = "INSERT INTO changes (user_id) VALUES (?)"
+
+    def __init__(self, path: str, keep_changes: int = 10_000, **kwargs):
+        super().__init__(path, **kwargs)
+        self.keep_changes = keep_changes
+        self._conn.executescript(self.CHANGES_SCHEMA)
+        self._data_version = None
+        self._seen_seq = self._latest_seq()
+        self._in_batch = False  # only changed while holding _write_lock
+
+    def _latest_seq(self) -> int:
+        return self._read("SELECT COALESCE(MAX(seq), 0) FROM changes")[0][0]
+
+    def user_seq(self, user_id: str) -> int:
+        """The last change recorded for ``user_id``; read before loading the partition."""
+        rows = self._read("SELECT COALESCE(MAX(seq), 0) FROM changes WHERE user_id = ?", (user_id,))
+        return rows[0][0]
+
+    # --- a user's write transaction ---
+
+    def begin(self, user_id: str) -> int:
+        """Take the database write lock and return the user's last change.
+
+        Inside ``batch`` the user's writes join the batch's transaction.
+        """
+        self._write_lock.acquire()
+        try:
+            if not self._in_batch:
+                self._conn.execute("BEGIN IMMEDIATE")
+            return self.user_seq(user_id)
+        except Exception:
+            self._write_lock.release()
+            raise
+
+    def commit(self, user_id: str) -> Optional[int]:
+        """Write what the transaction queued and release the lock; returns the new change, if any."""
+        try:
+            seq = None
+            with self._lock:
+                changed = self._dirty
+                batch = self._take_pending()
+            if changed:
+                # The queue can also hold other users' write-behind rows; each of them is recorded too
+                seq = self._apply_and_record(batch).get(user_id)
+            if not self._in_batch:  # a batch commits (or rolls back) everything when it ends
+                self._conn.execute("COMMIT")
+            return seq
+        except Exception:
+            if not self._in_batch:
+                self._conn.execute("ROLLBACK")
+            raise
+        finally:
+            self._write_lock.release()
+
+    @contextlib.contextmanager
+    def batch(self):
+        """One write transaction that the user transactions begun inside join."""
+        with self._write_lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._in_batch = True
+            try:
+                yield
+                with self._lock:
+                    batch = self._take_pending()
+                self._apply_and_record(batch)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            finally:
+                self._in_batch = False
+
+    def _commit(self, batch):
+        # Writes made outside a user's transaction still notify the other workers
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._apply_and_record(batch)
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+
+    def _apply_and_record(self, batch) -> Dict[str, int]:
+        """Write ``batch`` and log a change for every user in it; returns user id -> its change."""
+        task_writes, cleared_users, next_task_ids, quest_rows, user_stats_rows, events, rollup_rows, archives = batch
+        users = ({key[0] for key in task_writes} | cleared_users | set(next_task_ids) | set(quest_rows)
+                 | set(user_stats_rows) | {row[0] for row in events} | {key[0] for key in rollup_rows}
+                 | {row[0] for row in archives})
+        self._apply(batch)
+        seqs = {user_id: self._conn.execute(self.RECORD_CHANGE, (user_id,)).lastrowid for user_id in sorted(users)}
+        if seqs:
+            latest = max(seqs.values())
+            if latest // 1000 != (latest - len(seqs)) // 1000:  # passed a multiple of 1000
+                self._conn.execute("DELETE FROM changes WHERE seq <= ?", (latest - self.keep_changes,))
+        return seqs
+
+    # --- change notifications ---
+
+    def changed_users(self) -> Optional[dict]:
+        """user id -> latest change committed since the last call, or None when
+        this worker fell behind the pruned log and must reload everyone."""
+        with self._write_lock:
+            version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+            if version == self._data_version:
+                return {}
+            self._data_version = version
+            oldest = self._conn.execute("SELECT MIN(seq) FROM changes").fetchone()[0]
+            rows = self._conn.execute(
+                "SELECT user_id, MAX(seq) FROM changes WHERE seq > ? GROUP BY user_id", (self._seen_seq,)
+            ).fetchall()
+            behind = oldest is not None and oldest > self._seen_seq + 1
+            if rows:
+                self._seen_seq = max(seq for _, seq in rows)
+        return None if behind else dict(rows)
+
+
+def open_storage(path: Optional[str] = None, shared: Optional[bool] = None):
+    """Pick the storage backend: SQLite when a database path is configured, memory otherwise.
+
+    With POTATODO_MULTI_WORKER=1 the database is shared between worker processes.
+    """
+    path = path or os.getenv("POTATODO_DB_PATH")
+    if shared is None:
+        shared = os.getenv("POTATODO_MULTI_WORKER") == "1"
+    if shared:
+        if not path:
+            raise RuntimeError("POTATODO_MULTI_WORKER needs POTATODO_DB_PATH: workers share state through it")
+        return SharedSQLiteStorage(path)
+    if path:
+        return SQLiteStorage(path)
+    return MemoryStorage()
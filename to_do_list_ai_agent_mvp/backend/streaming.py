@@ -0,0 +1,81 @@
+import json
+import time
+from collections import defaultdict, deque
+
+MAX_MESSAGE_CHARS = 100
+
+
+def sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class SingleLineLimiter:
+    """Applies the single-line and length rules to a message as it streams in."""
+
+    def __init__(self, max_chars: int = MAX_MESSAGE_CHARS):
+        self.max_chars = max_chars
+        self.emitted = 0
+        self.done = False
+
+    def feed(self, chunk: str) -> str:
+        if self.done:
+            return ""
+        text = chunk.replace('\n', ' ').replace('\r', ' ')
+        if self.emitted == 0:
+            text = text.lstrip()
+        room = self.max_chars - self.emitted
+        if len(text) > room:
+            text = text[:room].rstrip() + "..."
+            self.done = True
+        self.emitted += len(text)
+        return text
+
+
+class TTFCRecorder:
+    """Rolling time-to-first-character samples per streaming endpoint."""
+
+    def __init__(self, window: int = 500):
+        self._samples = defaultdict(lambda: deque(maxlen=window))
+
+    def record(self, endpoint: str, seconds: float):
+        self._samples[endpoint].append(seconds)
+
+    def summary(self) -> dict:
+        report = {}
+        for endpoint, samples in self._samples.items():
+            ordered = sorted(samples)
+            report[endpoint] = {
+                "count": len(ordered),
+                "p50_ms": round(ordered[len(ordered) // 2] * 1000, 2),
+                "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 2),
+                "last_ms": round(samples[-1] * 1000, 2),
+            }
+        return report
+
+
+async def stream_message(endpoint: str, chunks, started_at: float, recorder: TTFCRecorder, meta: dict = None):
+    """Turn raw text chunks into SSE frames: an optional ``meta`` event,
+    one ``token`` event per cleaned chunk, then ``done`` with the TTFC."""
+    if meta is not None:
+        yield sse("meta", meta)
+    limiter = SingleLineLimiter()
+    ttfc = None
+    try:
+        async for chunk in chunks:
+            text = limiter.feed(chunk)
+            if text:
+                if ttfc is None:
+                    ttfc = time.perf_counter() - started_at
+                    recorder.record(endpoint, ttfc)
+                yield sse("token", {"text": text})
+            if limiter.done:
+                break
+    finally:
+        if hasattr(chunks, "aclose"):
+            await chunks.aclose()
+    yield sse("done", {"ttfc_ms": round(ttfc * 1000, 2) if ttfc is not None else None})
+
+
+async def once(text: str):
+    """A one-chunk stream, for lines that are already known (pooled or canned)."""
+    yield text
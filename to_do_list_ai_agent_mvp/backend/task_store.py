@@ -0,0 +1,285 @@
+import itertools
+import math
+import time
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from deadline_index import DeadlineIndex, deadline_ts
+from list_index import TaskListIndex
+from search_index import SearchIndex
+from storage import MemoryStorage
+
+ARCHIVE_DAYS = 30  # past days whose tasks stay searchable in memory
+
+
+class TaskStore:
+    """In-memory task repository.
+
+    Tasks are plain dicts (the same shape the API returns) kept in an
+    id -> task hash index, so lookups, toggles and deletes are O(1).
+    Completed/total counters are maintained on every write, so progress
+    queries never rescan the list.
+
+    Completion state must be changed through ``set_completed`` so the
+    counters stay in sync; other fields go through ``update``. Every write
+    is passed on to the storage backend, and the store is rebuilt from it
+    on startup.
+
+    Every write also bumps ``version`` and records the task (or, for a
+    delete, a tombstone) in a change log ordered by version, so
+    ``changes_since`` can answer a delta sync by walking only the entries
+    newer than the client's version. The version is seeded from the clock
+    (or ``min_version``, when a store replaces one), so it keeps rising
+    across restarts and reloads and a client's old version is simply
+    answered with a full resync.
+
+    Open tasks with a deadline are also kept in a ``DeadlineIndex`` (the
+    deadline normalised to epoch seconds as it is written), so due-soon,
+    overdue and next-due queries bisect instead of scanning, every
+    description is kept in a ``SearchIndex`` for ``search``, and every task
+    in a ``TaskListIndex`` so ``page`` reads a filtered, sorted page without
+    touching the rest of the list.
+
+    Tasks of the last ``archive_days`` past days (``archive``, and the
+    storage's day archives when the store is built) stay searchable: they
+    are kept as read-only copies carrying their ``archived_day`` and indexed
+    under their own doc ids, so clearing live ids never touches them. Older
+    days drop out of memory and the index; they remain in the storage.
+    """
+
+    def __init__(self, storage=None, max_tombstones: int = 1000, min_version: int = 0,
+                 archive_days: int = ARCHIVE_DAYS):
+        self.storage = storage or MemoryStorage()
+        self._tasks: Dict[int, dict] = {}  # insertion ordered, so iteration keeps creation order
+        self._next_id = self.storage.load_next_task_id()
+        self._completed_count = 0
+        self.deadlines = DeadlineIndex()
+        self.search_index = SearchIndex()
+        self.lists = TaskListIndex()
+        self.archive_days = archive_days
+        self._archived: Dict[tuple, dict] = {}  # ("archived", n) -> archived copy of a task
+        self._archived_by_day = OrderedDict()  # day -> its doc ids, oldest day first
+        self._archive_seq = itertools.count()
+        for task in self.storage.load_tasks():
+            self._insert(task)
+        for day, task in self.storage.load_archived_tasks(archive_days):
+            self._archive_one(day, task)
+
+        self.version = max(int(time.time() * 1000), min_version)
+        self._floor = self.version  # deltas are complete for any ``since`` at or above this
+        self._changed = OrderedDict()  # task id -> version of its last write, oldest first
+        self._deleted = OrderedDict()  # task id -> version it was deleted at, oldest first
+        self.max_tombstones = max_tombstones
+
+    # --- reads ---
+
+    def __len__(self) -> int:
+        return len(self._tasks)
+
+    def __iter__(self) -> Iterator[dict]:
+        return iter(self._tasks.values())
+
+    def __contains__(self, task_id) -> bool:
+        return task_id in self._tasks
+
+    def get(self, task_id: int) -> Optional[dict]:
+        return self._tasks.get(task_id)
+
+    def all(self) -> list:
+        return list(self._tasks.values())
+
+    @property
+    def total_count(self) -> int:
+        return len(self._tasks)
+
+    @property
+    def completed_count(self) -> int:
+        return self._completed_count
+
+    @property
+    def remaining_count(self) -> int:
+        return len(self._tasks) - self._completed_count
+
+    @property
+    def completion_rate(self) -> float:
+        return self._completed_count / len(self._tasks) if self._tasks else 0
+
+    def due_between(self, start: float, end: float) -> List[dict]:
+        """Open tasks due in ``[start, end)`` (epoch seconds), soonest first."""
+        return [self._tasks[task_id] for task_id in self.deadlines.between(start, end)]
+
+    def overdue(self, now: float, limit: Optional[int] = None) -> List[dict]:
+        """Open tasks whose deadline passed before ``now``, most overdue first."""
+        return [self._tasks[task_id] for task_id in self.deadlines.before(now, limit)]
+
+    def next_due(self, now: float, n: int) -> List[dict]:
+        """The ``n`` open tasks due soonest at or after ``now``."""
+        return [self._tasks[task_id] for task_id in self.deadlines.next(now, n)]
+
+    def search(self, query: str, limit: int = 20, prefix: bool = True) -> List[Tuple[dict, float]]:
+        """``(task, score)`` for the tasks whose description best matches ``query``.
+
+        Archived tasks are matched too; theirs are the copies with an ``archived_day``.
+        """
+        return [(self._tasks[doc_id] if isinstance(doc_id, int) else self._archived[doc_id], score)
+                for doc_id, score in self.search_index.search(query, limit, prefix)]
+
+    def page(self, sort: str = "created", limit: int = 50, after: Optional[tuple] = None,
+             descending: bool = False, completed: Optional[bool] = None, has_deadline: Optional[bool] = None,
+             has_reminder: Optional[bool] = None, created: Tuple[float, float] = (-math.inf, math.inf)
+             ) -> Tuple[List[dict], Optional[tuple]]:
+        """One page of tasks in ``sort`` order after the cursor key ``after``.
+
+        Filters left as None match either way. Returns the tasks and the key
+        to pass as ``after`` for the next page, or None on the last page.
+        """
+        flags = itertools.product(*([flag] if flag is not None else (False, True)
+                                    for flag in (completed, has_deadline, has_reminder)))
+        keys = self.lists.page(sort, flags, limit + 1, after, descending, created)
+        more = len(keys) > limit
+        keys = keys[:limit]
+        return [self._tasks[key[-1]] for key in keys], (keys[-1] if more else None)
+
+    def changes_since(self, since: int) -> Optional[dict]:
+        """Tasks written and ids deleted after version ``since``, oldest first.
+
+        Returns None when ``since`` predates the change log (a restart, or
+        tombstones that have been pruned), so the caller must resync fully.
+        """
+        if since < self._floor or since > self.version:
+            return None
+        upserts = []
+        for task_id, version in reversed(self._changed.items()):
+            if version <= since:
+                break
+            upserts.append(self._tasks[task_id])
+        deleted = []
+        for task_id, version in reversed(self._deleted.items()):
+            if version <= since:
+                break
+            deleted.append(task_id)
+        upserts.reverse()
+        deleted.reverse()
+        return {"version": self.version, "upserts": upserts, "deleted": deleted}
+
+    # --- writes ---
+
+    def allocate_id(self) -> int:
+        """Hand out the next id. Ids are never reused, even after a delete or a ``clear``."""
+        task_id = self._next_id
+        self._next_id += 1
+        return task_id
+
+    def add(self, task_data: dict) -> dict:
+        """Store a task dict, assigning it a fresh id if it has none."""
+        if task_data.get("id") is None:
+            task_data["id"] = self.allocate_id()
+        task_data["is_completed"] = bool(task_data.get("is_completed", False))
+        self._insert(task_data)
+        self._touch(task_data["id"])
+        self.storage.save_task(task_data, self._next_id)
+        return task_data
+
+    def _insert(self, task_data: dict):
+        previous = self._tasks.get(task_data["id"])
+        if previous is not None and previous["is_completed"]:
+            self._completed_count -= 1
+        self._tasks[task_data["id"]] = task_data
+        if task_data["is_completed"]:
+            self._completed_count += 1
+        self._next_id = max(self._next_id, task_data["id"] + 1)
+        self._index(task_data)
+        self.search_index.add(task_data["id"], task_data.get("description", ""))
+
+    def archive(self, day: str):
+        """Keep the current tasks searchable as ``day``'s, before they are cleared."""
+        for task in self._tasks.values():
+            self._archive_one(day, task)
+
+    def _archive_one(self, day: str, task: dict):
+        doc_ids = self._archived_by_day.get(day)
+        if doc_ids is None:
+            doc_ids = self._archived_by_day[day] = []
+            while len(self._archived_by_day) > self.archive_days:
+                _, expired = self._archived_by_day.popitem(last=False)
+                for doc_id in expired:
+                    del self._archived[doc_id]
+                    self.search_index.discard(doc_id)
+        doc_id = ("archived", next(self._archive_seq))
+        doc_ids.append(doc_id)
+        self._archived[doc_id] = archived = {**task, "archived_day": day}
+        self.search_index.add(doc_id, archived.get("description", ""))
+
+    def _index(self, task: dict):
+        self.lists.add(task)
+        if task["is_completed"]:
+            self.deadlines.discard(task["id"])
+        else:
+            self.deadlines.add(task["id"], deadline_ts(task.get("deadline")))
+
+    def _touch(self, task_id: int):
+        self.version += 1
+        self._changed[task_id] = self.version
+        self._changed.move_to_end(task_id)
+        self._deleted.pop(task_id, None)  # ids restart after a clear
+
+    def _tombstone(self, task_id: int):
+        self.version += 1
+        self._changed.pop(task_id, None)
+        self._deleted[task_id] = self.version
+        self._deleted.move_to_end(task_id)
+        if len(self._deleted) > self.max_tombstones:
+            _, pruned = self._deleted.popitem(last=False)
+            self._floor = pruned
+
+    def set_completed(self, task_id: int, is_completed: bool) -> Optional[dict]:
+        task = self._tasks.get(task_id)
+        if task is None:
+            return None
+        if task["is_completed"] != is_completed:
+            self._completed_count += 1 if is_completed else -1
+            task["is_completed"] = is_completed
+            self._index(task)
+            self._touch(task_id)
+            self.storage.save_task(task, self._next_id)
+        return task
+
+    def update(self, task_id: int, **fields) -> Optional[dict]:
+        """Update non-completion fields of a task in place."""
+        task = self._tasks.get(task_id)
+        if task is None:
+            return None
+        if "is_completed" in fields:
+            self.set_completed(task_id, bool(fields.pop("is_completed")))
+        task.update(fields)
+        self._index(task)
+        if "description" in fields:
+            self.search_index.add(task_id, task["description"])
+        self._touch(task_id)
+        self.storage.save_task(task, self._next_id)
+        return task
+
+    def delete(self, task_id: int) -> Optional[dict]:
+        task = self._tasks.pop(task_id, None)
+        if task is None:
+            return None
+        if task["is_completed"]:
+            self._completed_count -= 1
+        self.deadlines.discard(task_id)
+        self.search_index.discard(task_id)
+        self.lists.discard(task_id)
+        self._tombstone(task_id)
+        self.storage.delete_task(task_id)
+        return task
+
+    def clear(self):
+        """Drop every task. The id sequence carries on, so state still keyed by an
+        old task id (a queued AI line, a reminder in flight) never lands on a new task."""
+        for task_id in self._tasks:
+            self._tombstone(task_id)
+            self.search_index.discard(task_id)  # archived tasks stay indexed
+        self._tasks.clear()
+        self.deadlines.clear()
+        self.lists.clear()
+        self._completed_count = 0
+        self.storage.clear_tasks()
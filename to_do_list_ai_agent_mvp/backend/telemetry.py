@@ -0,0 +1,281 @@
+import atexit
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from fastapi.routing import APIRoute
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+# --- Prometheus text format ---
+
+def _labels(names, values) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{str(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def render_samples(name: str, help_text: str, kind: str, samples: dict, label_names=()) -> list:
+    """Exposition lines for values read from a component, keyed by label values."""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+    for label_values, value in samples.items():
+        lines.append(f"{name}{_labels(label_names, label_values)} {value}")
+    return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram with one series per label-value tuple."""
+
+    def __init__(self, name: str, help_text: str, label_names=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [per-bucket counts (last is +Inf), sum, count]
+
+    def observe(self, value: float, *label_values):
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def count(self, *label_values) -> int:
+        series = self._series.get(label_values)
+        return series[2] if series else 0
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for label_values, (counts, total, count) in self._series.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += bucket_count
+                labels = _labels(self.label_names + ("le",), label_values + (bound,))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _labels(self.label_names, label_values)
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+# --- request-scoped trace spans ---
+
+_trace = contextvars.ContextVar("potatodo_trace", default=None)
+
+
+class Trace:
+    """Time spent per span name within one request."""
+
+    def __init__(self):
+        self.spans = {}
+        self.handler_started = None
+        self.handler_ended = None
+
+    def add(self, name: str, seconds: float):
+        self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+
+@contextmanager
+def span(name: str):
+    """Attribute the enclosed time to ``name`` in the current request's trace, if any."""
+    trace = _trace.get()
+    if trace is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(name, time.perf_counter() - started)
+
+
+def _traced_endpoint(endpoint):
+    def started():
+        trace = _trace.get()
+        if trace is not None:
+            trace.handler_started = time.perf_counter()
+        return trace
+
+    def ended(trace):
+        if trace is not None:
+            trace.handler_ended = time.perf_counter()
+            trace.add("handler", trace.handler_ended - trace.handler_started)
+
+    if inspect.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def traced(*args, **kwargs):
+            trace = started()
+            try:
+                return await endpoint(*args, **kwargs)
+            finally:
+                ended(trace)
+    else:
+        @functools.wraps(endpoint)
+        def traced(*args, **kwargs):
+            trace = started()
+            try:
+                return endpoint(*args, **kwargs)
+            finally:
+                ended(trace)
+    return traced
+
+
+class TracedRoute(APIRoute):
+    """APIRoute that splits a request into validation (parameter parsing and
+    dependencies), handler and serialization spans."""
+
+    def __init__(self, path, endpoint, **kwargs):
+        super().__init__(path, _traced_endpoint(endpoint), **kwargs)
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def traced_handler(request):
+            trace = _trace.get()
+            started = time.perf_counter()
+            response = await handler(request)
+            if trace is not None and trace.handler_started is not None:
+                trace.add("validation", trace.handler_started - started)
+                trace.add("serialization", time.perf_counter() - trace.handler_ended)
+            return response
+
+        return traced_handler
+
+
+class RequestMetrics:
+    """Per-route latency histograms, an in-flight gauge and span breakdowns."""
+
+    def __init__(self):
+        self.in_flight = 0
+        self.latency = Histogram(
+            "potatodo_request_seconds", "Request latency by route", ("route", "method", "status")
+        )
+        self.spans = Histogram(
+            "potatodo_request_span_seconds", "Time per span within a request", ("route", "span")
+        )
+
+    def render(self) -> list:
+        return [
+            *self.latency.render(),
+            *self.spans.render(),
+            *render_samples("potatodo_requests_in_flight", "Requests being served", "gauge", {(): self.in_flight}),
+        ]
+
+
+class TelemetryMiddleware:
+    """Starts a trace for every request and records it into ``metrics``.
+
+    The spans go into ``potatodo_request_span_seconds`` and back to the
+    client as a ``Server-Timing`` header. Routes are labelled by their path
+    template, so ``/tasks/1`` and ``/tasks/2`` share a series.
+    """
+
+    def __init__(self, app, metrics: RequestMetrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        trace = Trace()
+        token = _trace.set(trace)
+        status = 500
+        started = time.perf_counter()
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if trace.spans:
+                    timing = ", ".join(f"{name};dur={seconds * 1000:.2f}" for name, seconds in trace.spans.items())
+                    message["headers"] = [*message.get("headers", []), (b"server-timing", timing.encode())]
+            await send(message)
+
+        metrics = self.metrics
+        metrics.in_flight += 1
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            metrics.in_flight -= 1
+            _trace.reset(token)
+            route = scope.get("route")
+            path = route.path if route is not None else "unmatched"
+            metrics.latency.observe(time.perf_counter() - started, path, scope["method"], status)
+            for name, seconds in trace.spans.items():
+                metrics.spans.observe(seconds, path, name)
+
+
+# --- structured logging off the request path ---
+
+class _JSONFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "event": record.getMessage(),
+            **getattr(record, "fields", {}),
+        }
+        return json.dumps(entry, default=str)
+
+
+_listener = None
+
+
+def _start_listener():
+    global _listener
+    log_queue = queue.SimpleQueue()
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(_JSONFormatter())
+    _listener = logging.handlers.QueueListener(log_queue, handler)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+    root = logging.getLogger("potatodo")
+    root.setLevel(os.getenv("POTATODO_LOG_LEVEL", "INFO").upper())
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.propagate = False
+
+
+class StructuredLogger:
+    """JSON-lines logger whose records are written by a background thread.
+
+    Calls only put the record on a queue, so logging never blocks a request
+    on stdout. Levels below ``POTATODO_LOG_LEVEL`` (default INFO) are
+    dropped before any formatting.
+    """
+
+    def __init__(self, name: str):
+        if _listener is None:
+            _start_listener()
+        self._logger = logging.getLogger(f"potatodo.{name}")
+
+    def _log(self, level: int, event: str, fields: dict):
+        if self._logger.isEnabledFor(level):
+            self._logger.log(level, event, extra={"fields": fields})
+
+    def debug(self, event: str, **fields):
+        self._log(logging.DEBUG, event, fields)
+
+    def info(self, event: str, **fields):
+        self._log(logging.INFO, event, fields)
+
+    def warning(self, event: str, **fields):
+        self._log(logging.WARNING, event, fields)
+
+    def error(self, event: str, **fields):
+        self._log(logging.ERROR, event, fields)
@@ -1,25 +1,31 @@
 from fastapi.testclient import TestClient
-from main import app, user_stats, daily_quests, todo_list
+from main import DEFAULT_USER_ID, app, users
+from task_store import TaskStore
 import datetime
 
 client = TestClient(app)
 
+def default_user():
+    """The desktop app's user, looked up afresh: a reload replaces its tasks, quests and stats"""
+    return users.get(DEFAULT_USER_ID)
+
 def setup_function():
     """Reset data before each test"""
-    user_stats.current_streak = 0
-    user_stats.longest_streak = 0
-    user_stats.total_tasks_completed = 0
-    user_stats.last_activity_date = None
-    user_stats.timezone = "UTC"
-    daily_quests.clear()
-    todo_list.clear()
+    user = default_user()
+    user.stats.current_streak = 0
+    user.stats.longest_streak = 0
+    user.stats.total_tasks_completed = 0
+    user.stats.last_activity_date = None
+    user.stats.timezone = "UTC"
+    user.quests.clear()
+    user.tasks = TaskStore(user.storage, min_version=user.tasks.version + 1)  # ids start again at 1
 
 def test_onboarding():
     """Test timezone setup"""
     response = client.post("/onboarding?timezone=America/New_York")
     assert response.status_code == 200
     assert response.json() == {"message": "Timezone set to America/New_York"}
-    assert user_stats.timezone == "America/New_York"
+    assert default_user().stats.timezone == "America/New_York"
 
 def test_create_daily_quest():
     """Test daily quest creation"""
@@ -28,7 +34,7 @@ def test_create_daily_quest():
     data = response.json()
     assert data["message"] == "Daily quest created!"
     assert data["quest"]["quest_name"] == "Drink 8 glasses of water"
-    assert len(daily_quests) == 1
+    assert len(default_user().quests) == 1
 
 def test_get_daily_quest():
     """Test getting daily quest"""
@@ -66,7 +72,7 @@ def test_add_task():
     data = response.json()
     assert data["message"] == "Task added successfully!"
     assert data["task"]["description"] == "Finish project report"
-    assert len(todo_list) == 1
+    assert len(default_user().tasks) == 1
 
 def test_complete_task():
     """Test marking task as completed"""
@@ -131,7 +137,7 @@ def test_check_in_productive_day():
 def test_check_in_unproductive_day():
     """Test check-in with no completed tasks (breaks streak)"""
     # Set up a streak first
-    user_stats.current_streak = 5
+    default_user().stats.current_streak = 5
     
     # Don't complete anything
     client.post("/tasks/", json={"description": "Task 1"})
@@ -161,9 +167,9 @@ def test_call_it_a_day():
 
 def test_character_stats():
     """Test getting character stats"""
-    user_stats.current_streak = 7
-    user_stats.longest_streak = 10
-    user_stats.timezone = "America/New_York"
+    default_user().stats.current_streak = 7
+    default_user().stats.longest_streak = 10
+    default_user().stats.timezone = "America/New_York"
     
     response = client.get("/character/stats")
     assert response.status_code == 200
@@ -188,3 +194,1223 @@ def test_reminder_all_complete():
     assert response.status_code == 200
     data = response.json()
     assert data["reminder"] == "You're doing great! All caught up. 🎉"
+
+def test_task_ids_not_reused_after_delete():
+    """Test that deleting a task never frees its id for a new task"""
+    client.post("/tasks/", json={"description": "Task 1"})
+    client.post("/tasks/", json={"description": "Task 2"})
+    client.delete("/tasks/1")
+
+    response = client.post("/tasks/", json={"description": "Task 3"})
+    assert response.json()["task"]["id"] == 3
+    assert [t["id"] for t in client.get("/tasks/").json()] == [2, 3]
+
+def test_daily_status_counts_follow_deletes():
+    """Test that completion counters stay correct when a completed task is deleted"""
+    client.post("/tasks/", json={"description": "Task 1"})
+    client.post("/tasks/", json={"description": "Task 2"})
+    default_user().tasks.set_completed(1, True)
+    client.delete("/tasks/1")
+
+    data = client.get("/daily-status").json()
+    assert data["completed_count"] == 0
+    assert data["total_count"] == 1
+
+def test_sqlite_storage_survives_restart(tmp_path):
+    """Test that tasks, completion counters and the id sequence reload from SQLite"""
+    from storage import SQLiteStorage
+    from task_store import TaskStore
+
+    db_path = str(tmp_path / "potatodo.db")
+    backend = SQLiteStorage(db_path)
+    store = TaskStore(backend.for_user("1"))
+    store.add({"description": "Task 1", "deadline": datetime.datetime(2025, 1, 2, 17, 0)})
+    store.add({"description": "Task 2"})
+    TaskStore(backend.for_user("2")).add({"description": "Someone else's task"})
+    store.set_completed(1, True)
+    store.delete(2)
+    backend.close()
+
+    reloaded = TaskStore(SQLiteStorage(db_path).for_user("1"))
+    assert [t["description"] for t in reloaded] == ["Task 1"]
+    assert reloaded.completed_count == 1
+    assert reloaded.get(1)["deadline"] == datetime.datetime(2025, 1, 2, 17, 0)
+    assert reloaded.allocate_id() == 3
+
+class _StubModels:
+    """Stand-in for genai_client.aio.models with scripted behaviour"""
+    def __init__(self, behaviours):
+        self.behaviours = list(behaviours)
+        self.calls = 0
+
+    async def generate_content(self, model, contents, config=None):
+        import asyncio
+        self.calls += 1
+        behaviour = self.behaviours.pop(0) if self.behaviours else "hang"
+        if behaviour == "hang":
+            await asyncio.sleep(60)
+        if behaviour == "error":
+            raise RuntimeError("upstream error")
+        return type("Response", (), {"text": behaviour})()
+
+def _stub_client(*behaviours):
+    models = _StubModels(behaviours)
+    client = type("Client", (), {})()
+    client.aio = type("Aio", (), {"models": models})()
+    return client, models
+
+def test_llm_gateway_retries_then_succeeds():
+    """Test that transient upstream errors are retried"""
+    import asyncio
+    from llm_gateway import LLMGateway
+
+    client, models = _stub_client("error", "Spud-tacular!")
+    gateway = LLMGateway(client, model="test", backoff=0.01)
+    assert asyncio.run(gateway.generate("prompt")) == "Spud-tacular!"
+    assert models.calls == 2
+
+def test_llm_gateway_falls_back_at_deadline():
+    """Test that a hanging model yields the fallback line once the deadline passes"""
+    import asyncio
+    import time
+    from llm_gateway import LLMGateway
+
+    client, _ = _stub_client("hang", "hang", "hang")
+    gateway = LLMGateway(client, model="test", attempt_timeout=0.05, deadline=0.2, backoff=0.01)
+    start = time.monotonic()
+    assert asyncio.run(gateway.generate("prompt", fallback="Fries later!")) == "Fries later!"
+    assert time.monotonic() - start < 1
+
+def test_llm_gateway_hedges_a_slow_call():
+    """Test that a call slower than the hedge delay is raced by a second one, and the first reply wins"""
+    import asyncio
+    import time
+    from llm_gateway import LLMGateway
+
+    client, models = _stub_client("hang", "Hedged!")
+    gateway = LLMGateway(client, model="test", attempt_timeout=1, deadline=1, max_retries=0,
+                         latency_budget=0.5, hedge_after=0.02)
+    start = time.monotonic()
+    assert asyncio.run(gateway.generate("prompt", fallback="Fries later!")) == "Hedged!"
+    assert time.monotonic() - start < 0.3
+    assert models.calls == 2 and gateway.hedges == 1 and gateway.hedge_wins == 1
+
+    client, models = _stub_client("Quick!")
+    gateway = LLMGateway(client, model="test", hedge_after=0.5)
+    assert asyncio.run(gateway.generate("prompt")) == "Quick!"
+    assert models.calls == 1 and gateway.hedges == 0
+
+def test_background_tasks_are_kept_until_done_and_failures_logged(monkeypatch):
+    """Test that fire-and-forget tasks stay referenced while running and their errors are logged"""
+    import asyncio
+    import background
+
+    logged = []
+    monkeypatch.setattr(background.log, "error", lambda event, **fields: logged.append((event, fields["task"])))
+
+    async def boom():
+        await asyncio.sleep(0)
+        raise RuntimeError("no spuds")
+
+    async def scenario():
+        task = background.spawn(boom(), "test job")
+        assert task in background._running
+        await asyncio.sleep(0.01)
+        return task
+
+    task = asyncio.run(scenario())
+    assert task not in background._running
+    assert logged == [("background task failed", "test job")]
+
+def test_response_cache_serves_pool_without_repeats():
+    """Test that fixed-situation prompts are answered from a refilled pool, never repeating a line"""
+    import asyncio
+    import itertools
+    from response_cache import ResponseCache
+
+    counter = itertools.count()
+
+    async def fake_generate(prompt, fallback=None):
+        return f"joke {next(counter)}"
+
+    async def scenario():
+        cache = ResponseCache(fake_generate, pool_size=4, low_water=1)
+        lines = [await cache.get("User has no tasks today.")]
+        await asyncio.sleep(0.01)  # let the background refill run
+        for _ in range(6):
+            lines.append(await cache.get("  user has no   tasks today. "))
+            await asyncio.sleep(0.01)
+        return cache, lines
+
+    cache, lines = asyncio.run(scenario())
+    assert len(set(lines)) == len(lines)
+    assert cache.misses == 1
+    assert cache.hits == 6
+
+def test_complete_task_returns_message_ticket():
+    """Test that toggling responds immediately with a ticket instead of waiting for the AI line"""
+    client.post("/tasks/", json={"description": "Call mom"})
+
+    response = client.post("/tasks/1/complete")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["is_completed"] == True
+    assert data["message_ticket"].startswith("msg-")
+    assert "ai_message" not in data
+
+def test_message_hub_coalesces_rapid_toggles():
+    """Test that rapid submissions for one task produce a single message under every ticket"""
+    import asyncio
+    from message_channel import MessageHub
+
+    calls = []
+
+    async def scenario():
+        hub = MessageHub(coalesce_window=0.02)
+        events = []
+        stream = hub.stream("1")
+        await stream.__anext__()  # subscribe
+
+        for state in ("done", "undone", "done again"):
+            async def produce(state=state):
+                calls.append(state)
+                return f"Potato says {state}"
+            hub.submit("1", "task:1", produce, task_id=1)
+
+        events.append(await asyncio.wait_for(stream.__anext__(), 1))
+        await stream.aclose()
+        return events
+
+    events = asyncio.run(scenario())
+    assert calls == ["done again"]
+    assert len(events) == 1
+    assert '"tickets": ["msg-1", "msg-2", "msg-3"]' in events[0]
+    assert "Potato says done again" in events[0]
+
+    # A line produced elsewhere for the latest state supersedes queued and in-flight ones
+    async def superseded():
+        hub = MessageHub(coalesce_window=0.02)
+        stream = hub.stream("1")
+        await stream.__anext__()
+        release = asyncio.Event()
+
+        async def slow_uncheck():
+            await release.wait()
+            return "UNCHECK LINE"
+
+        async def uncheck():
+            calls.append("uncheck")
+            return "UNCHECK LINE"
+
+        hub.submit("1", "task:2", slow_uncheck, task_id=2)
+        await asyncio.sleep(0.05)  # now generating
+        hub.supersede("1", "task:2", "DONE LINE", task_id=2)
+        release.set()
+        hub.submit("1", "task:2", uncheck, task_id=2)
+        hub.supersede("1", "task:2", "DONE LINE AGAIN", task_id=2)  # still queued
+        first = await asyncio.wait_for(stream.__anext__(), 1)
+        await asyncio.sleep(0.05)
+        hub.publish("1", "marker", {})
+        second = await asyncio.wait_for(stream.__anext__(), 1)
+        await stream.aclose()
+        return first, second
+
+    first, second = asyncio.run(superseded())
+    assert "DONE LINE AGAIN" in first and '"tickets": ["msg-2"]' in first
+    assert second.startswith("event: marker") and "uncheck" not in calls
+
+def test_single_line_limiter_applies_rules_incrementally():
+    """Test that streamed chunks are cleaned to one line and cut at the length limit"""
+    from streaming import SingleLineLimiter
+
+    limiter = SingleLineLimiter(max_chars=20)
+    pieces = [limiter.feed(chunk) for chunk in ["\n  Mash", "ed it!\nFries", " forever and ever", " more"]]
+    assert pieces[0] == "Mash"
+    assert "".join(pieces) == "Mashed it! Fries for..."
+    assert pieces[-1] == ""
+
+def test_stream_reminder_emits_sse_and_records_ttfc():
+    """Test the streaming reminder endpoint's event sequence and TTFC metrics"""
+    response = client.get("/stream/reminder/99")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = [line.split(": ", 1)[1] for line in response.text.splitlines() if line.startswith("event: ")]
+    assert events == ["meta", "token", "done"]
+    assert "Task not found or already completed!" in response.text
+
+    metrics = client.get("/stream/metrics").json()
+    assert metrics["/stream/reminder"]["count"] >= 1
+
+def test_stream_task_and_quest_lines(monkeypatch):
+    """Test that toggles and the quest hand their AI line to a stream when asked to"""
+    import main
+
+    async def fake_stream(prompt, fallback=None):
+        for chunk in ("Mashed ", "it!"):
+            yield chunk
+
+    monkeypatch.setattr(main.llm, "stream", fake_stream)
+    headers = {"X-User-Id": "streamer"}
+    for name in ("Peel", "Boil"):
+        client.post("/tasks/", json={"description": name}, headers=headers)
+    main.speculative.discard(("streamer", 1))  # no pre-generated line, so the model streams it
+
+    def events(response):
+        return [line.split(": ", 1)[1] for line in response.text.splitlines() if line.startswith("event: ")]
+
+    result = client.post("/tasks/1/complete?stream=true", headers=headers).json()
+    assert result["message_ticket"] is None and result["message_stream"] == "/stream/task-line/1"
+    response = client.get(result["message_stream"], headers=headers)
+    assert events(response) == ["meta", "token", "token", "done"]
+    assert '"all_tasks_complete": false' in response.text and "Mashed " in response.text
+    assert events(client.get("/stream/task-line/99", headers=headers)) == ["meta", "token", "done"]
+
+    assert "No completed daily quest yet!" in client.get("/stream/daily-quest", headers=headers).text
+    client.post("/daily-quests/", json={"quest_name": "Stretch"}, headers=headers)
+    result = client.patch("/daily-quests/complete?stream=true", headers=headers).json()
+    assert result["ai_message"] is None and result["message_stream"] == "/stream/daily-quest"
+    response = client.get(result["message_stream"], headers=headers)
+    assert events(response) == ["meta", "token", "token", "done"] and '"progress": "1/2"' in response.text
+    assert {"/stream/task-line", "/stream/daily-quest"} <= set(client.get("/stream/metrics").json())
+
+def test_reminder_scheduler_fires_in_due_order_and_honours_updates():
+    """Test that reminders fire in due order, and edits and cancels take effect"""
+    import asyncio
+    import threading
+    import time
+    from reminder_scheduler import ReminderScheduler
+
+    now = datetime.datetime.now(datetime.timezone.utc)
+    tasks = {
+        1: {"id": 1, "description": "Later", "is_completed": False, "reminder_at": now + datetime.timedelta(seconds=0.15)},
+        2: {"id": 2, "description": "Sooner", "is_completed": False, "reminder_at": now + datetime.timedelta(seconds=0.05)},
+        3: {"id": 3, "description": "Cancelled", "is_completed": False, "reminder_at": now + datetime.timedelta(seconds=0.1)},
+        4: {"id": 4, "description": "Moved", "is_completed": False, "reminder_at": now + datetime.timedelta(seconds=0.01)},
+    }
+    fired = []
+
+    async def generate(key, task):
+        return f"Remember {task['description']}"
+
+    async def scenario():
+        scheduler = ReminderScheduler(generate, lambda key, task, text: fired.append(text), lead_time=0.02)
+        scheduler.rebuild(tasks.items())
+        runner = asyncio.create_task(scheduler.run(tasks.get))
+        scheduler.cancel(3)
+        tasks[4]["reminder_at"] = now + datetime.timedelta(seconds=0.2)
+        scheduler.schedule(4, tasks[4])
+        await asyncio.sleep(0.35)
+        runner.cancel()
+        return scheduler
+
+    scheduler = asyncio.run(scenario())
+    assert fired == ["Remember Sooner", "Remember Later", "Remember Moved"]
+    assert len(scheduler) == 0
+
+    # Scheduled from a request thread while the loop sleeps with nothing due, it still wakes the loop
+    fired_at = []
+
+    async def from_a_thread():
+        scheduler = ReminderScheduler(generate, lambda key, task, text: fired_at.append(time.monotonic()), lead_time=0.02)
+        runner = asyncio.create_task(scheduler.run(tasks.get))
+        await asyncio.sleep(0.01)
+        tasks[5] = {"id": 5, "description": "Threaded", "is_completed": False,
+                    "reminder_at": datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=0.05)}
+        started = time.monotonic()
+        threading.Timer(0.01, scheduler.schedule, args=(5, tasks[5])).start()  # lands while the loop is asleep
+        await asyncio.sleep(0.5)
+        runner.cancel()
+        return started
+
+    started = asyncio.run(from_a_thread())
+    assert len(fired_at) == 1 and fired_at[0] - started < 0.3
+
+def test_add_task_schedules_server_side_reminder():
+    """Test that a task with a reminder gets a due time and a scheduler entry"""
+    from main import reminder_scheduler
+    reminder_scheduler.clear()
+
+    response = client.post("/tasks/", json={
+        "description": "Pay rent",
+        "deadline": "2099-01-02T17:00:00Z",
+        "reminder_minutes": 30
+    })
+    assert response.json()["task"]["reminder_at"].startswith("2099-01-02T16:30:00")
+    assert len(reminder_scheduler) == 1
+
+    client.delete("/tasks/1")
+    assert len(reminder_scheduler) == 0
+
+    # A reminder without a deadline counts from when it was set, so a rename keeps it
+    reminder_at = client.post("/tasks/", json={"description": "Cal mum", "reminder_minutes": 30}).json()["task"]["reminder_at"]
+    renamed = client.patch("/tasks/2", json={"description": "Call mum", "reminder_minutes": 30}).json()
+    assert renamed["task"]["reminder_at"] == reminder_at
+    moved = client.patch("/tasks/2", json={"description": "Call mum", "reminder_minutes": 45}).json()
+    assert moved["task"]["reminder_at"] > reminder_at
+
+def test_task_batch_reports_per_item_results():
+    """Test that a batch applies every operation, reports each one and issues a single AI ticket"""
+    client.post("/tasks/", json={"description": "Existing task"})
+
+    response = client.post("/tasks/batch", json={"operations": [
+        {"op": "create", "task": {"description": "Buy milk"}},
+        {"op": "create", "task": {"description": "Walk dog"}},
+        {"op": "complete", "task_id": 1},
+        {"op": "complete", "task_id": 42},
+        {"op": "update", "task_id": 2, "task": {"description": "Buy oat milk"}},
+        {"op": "delete", "task_id": 3},
+    ]})
+    assert response.status_code == 200
+    data = response.json()
+    assert [r["ok"] for r in data["results"]] == [True, True, True, False, True, True]
+    assert data["results"][3]["error"] == "Task not found."
+    assert data["message_ticket"].startswith("msg-")
+    assert data["progress"] == "1/2"
+    assert [t["description"] for t in client.get("/tasks/").json()] == ["Existing task", "Buy oat milk"]
+
+def test_task_batch_rejects_malformed_operations():
+    """Test that the whole batch is validated up front"""
+    response = client.post("/tasks/batch", json={"operations": [
+        {"op": "create", "task": {"description": "Fine"}},
+        {"op": "complete"},
+    ]})
+    assert response.status_code == 422
+    assert len(default_user().tasks) == 0
+
+    # and capped in size, since it is applied in one go under the user's lock
+    from main import MAX_BATCH_OPERATIONS
+    operations = [{"op": "create", "task": {"description": "Spud"}}] * (MAX_BATCH_OPERATIONS + 1)
+    assert client.post("/tasks/batch", json={"operations": operations}).status_code == 422
+    assert len(default_user().tasks) == 0
+
+def test_users_have_separate_partitions():
+    """Test that tasks and stats are partitioned by the X-User-Id header"""
+    client.post("/tasks/", json={"description": "Default user's task"})
+    response = client.post("/tasks/", json={"description": "Second user's task"}, headers={"X-User-Id": "u2"})
+    assert response.json()["task"]["id"] == 1
+    client.post("/onboarding?timezone=Asia/Tokyo", headers={"X-User-Id": "u2"})
+
+    assert [t["description"] for t in client.get("/tasks/").json()] == ["Default user's task"]
+    assert [t["description"] for t in client.get("/tasks/", headers={"X-User-Id": "u2"}).json()] == ["Second user's task"]
+    assert default_user().stats.timezone == "UTC"
+    assert client.get("/character/stats", headers={"X-User-Id": "u2"}).json()["timezone"] == "Asia/Tokyo"
+
+    client.post("/midnight-reset", headers={"X-User-Id": "u2"})
+    assert len(default_user().tasks) == 1
+
+def test_concurrent_toggles_lose_no_updates():
+    """Test that concurrent toggles from many users all land in the right partition"""
+    from concurrent.futures import ThreadPoolExecutor
+    from main import users
+
+    user_ids = [f"load-{n}" for n in range(20)]
+    for user_id in user_ids:
+        for n in range(3):
+            client.post("/tasks/", json={"description": f"Task {n}"}, headers={"X-User-Id": user_id})
+
+    def toggle(args):
+        user_id, task_id = args
+        return client.put(f"/tasks/{task_id}", headers={"X-User-Id": user_id}).status_code
+
+    jobs = [(user_id, task_id) for user_id in user_ids for task_id in (1, 2, 3)]
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        assert set(pool.map(toggle, jobs)) == {200}
+
+    for user_id in user_ids:
+        assert users.get(user_id).tasks.completed_count == 3
+
+def test_task_list_etag_revalidates_with_304():
+    """Test that an unchanged task list answers If-None-Match with a bodyless 304"""
+    client.post("/tasks/", json={"description": "Peel potatoes"})
+    response = client.get("/tasks/")
+    etag = response.headers["etag"]
+
+    cached = client.get("/tasks/", headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.content == b""
+
+    client.post("/tasks/1/complete")
+    assert client.get("/tasks/", headers={"If-None-Match": etag}).status_code == 200
+
+def test_task_list_delta_since_version():
+    """Test that ?since returns only upserts and tombstones after that version"""
+    for name in ("Boil", "Mash", "Fry"):
+        client.post("/tasks/", json={"description": name})
+    version = int(client.get("/tasks/").headers["etag"].strip('"'))
+
+    client.post("/tasks/2/complete")
+    client.delete("/tasks/3")
+    delta = client.get(f"/tasks/?since={version}").json()
+    assert [t["id"] for t in delta["upserts"]] == [2]
+    assert delta["upserts"][0]["is_completed"] == True
+    assert delta["deleted"] == [3]
+    assert client.get(f"/tasks/?since={delta['version']}").json()["upserts"] == []
+
+    stale = client.get("/tasks/?since=0").json()
+    assert stale["full"] == True
+    assert [t["id"] for t in stale["upserts"]] == [1, 2]
+
+def test_bootstrap_replaces_startup_fan_out(monkeypatch):
+    """Test that /bootstrap carries the startup data in one round trip, with fewer bytes"""
+    import main
+
+    async def fake_generate(task_status, fallback=None, **options):
+        return "Spud-tacular!"
+    monkeypatch.setattr(main.response_cache, "generate", fake_generate)
+
+    client.post("/daily-quests/", json={"quest_name": "Stretch"})
+    for n in range(20):
+        client.post("/tasks/", json={"description": f"Task {n}", "deadline": "2099-01-02T17:00:00Z"})
+    client.post("/tasks/1/complete")
+
+    def fan_out():
+        return [
+            client.get("/tasks/"),
+            client.get("/streak"),
+            client.get("/daily-quests/"),
+            client.get("/daily-status"),
+            client.post("/task-progress-check"),
+        ]
+
+    fan_out()  # warm the progress pool
+    before = fan_out()
+    client.get("/bootstrap")  # warm the snapshot
+    after = client.get("/bootstrap")
+
+    def wire_bytes(response):
+        """Status line, headers and body, as they go over the socket"""
+        headers = sum(len(name) + len(value) + 4 for name, value in response.headers.items())
+        return len("HTTP/1.1 200 OK\r\n\r\n") + headers + len(response.content)
+
+    before_bytes = sum(wire_bytes(r) for r in before)
+    after_bytes = wire_bytes(after)
+    assert len(before) == 5 and all(r.status_code == 200 for r in before) and after.status_code == 200
+    assert after_bytes < before_bytes
+
+    snapshot = after.json()
+    assert snapshot["tasks"] == before[0].json()
+    assert snapshot["daily_quest"] == before[2].json()["daily_quest"]
+    assert snapshot["streak"]["current_streak"] == before[1].json()["current_streak"]
+    assert snapshot["daily_status"] == before[3].json()
+    assert snapshot["progress"]["completed_count"] == 1
+
+def test_bootstrap_snapshot_is_invalidated_by_writes():
+    """Test that the cached snapshot revalidates with 304 until a write changes it"""
+    client.post("/tasks/", json={"description": "Bake"})
+    etag = client.get("/bootstrap").headers["etag"]
+    assert client.get("/bootstrap", headers={"If-None-Match": etag}).status_code == 304
+
+    client.post("/tasks/1/complete")
+    refreshed = client.get("/bootstrap", headers={"If-None-Match": etag})
+    assert refreshed.status_code == 200
+    assert refreshed.json()["daily_status"]["completed_count"] == 1
+
+    client.post("/onboarding?timezone=Europe/Paris")
+    assert client.get("/bootstrap", headers={"If-None-Match": refreshed.headers["etag"]}).status_code == 200
+
+def test_micro_batcher_splits_numbered_reply_and_retries_missing_items():
+    """Test that concurrent generations share one call and an unparsed item gets its own"""
+    import asyncio
+    from llm_gateway import LLMGateway
+    from micro_batcher import MicroBatcher
+
+    client, models = _stub_client("1. Fry it\nsome chatter\n3) Mash it", "Boil it")
+    gateway = LLMGateway(client, model="test", backoff=0.01)
+    batcher = MicroBatcher(gateway, lambda s: s, lambda items: "\n".join(items), window=0.01)
+
+    async def scenario():
+        return await asyncio.gather(*(batcher.generate(s) for s in ("fry", "boil", "mash")))
+
+    assert asyncio.run(scenario()) == ["Fry it", "Boil it", "Mash it"]
+    assert models.calls == 2
+    assert batcher.stats()["items"] == 3
+    assert batcher.stats()["items_per_call"] == 1.5
+
+def test_prompts_fit_token_budget_with_persona_as_system_instruction():
+    """Test offline that the persona goes out once as a system instruction and prompts stay small"""
+    import asyncio
+    import main
+    from llm_gateway import LLMGateway
+
+    sent = []
+
+    class _RecordingModels:
+        async def generate_content(self, model, contents, config=None):
+            sent.append((contents, config))
+            usage = type("Usage", (), {"prompt_token_count": len(contents) // 4, "cached_content_token_count": 0,
+                                       "candidates_token_count": 10})()
+            return type("Response", (), {"text": "Spud-tacular!", "usage_metadata": usage})()
+
+    client = type("Client", (), {})()
+    client.aio = type("Aio", (), {"models": _RecordingModels()})()
+    gateway = LLMGateway(client, model="test", system_instruction=main.persona.strip(), cache_ttl=3600)
+
+    task = {"description": "Water the potatoes", "deadline": "2099-01-02T17:00:00Z"}
+    prompts = [
+        main.build_prompt(main.progress_prompt(1, 3, 1 / 3)),
+        main.reminder_prompt(task, "UTC"),
+        main.reminder_prompt({"description": "Stretch"}, "UTC"),
+        main.build_batch_prompt(["User completed 'Boil'.", "User completed 'Mash'."]),
+    ]
+    for prompt in prompts:
+        asyncio.run(gateway.generate(prompt))
+
+    budget = 40  # tokens, at roughly 4 characters per token
+    for contents, config in sent:
+        assert len(contents) // 4 <= budget, contents
+        assert "  " not in contents and "potato with different moods" not in contents
+        assert config.system_instruction == main.persona.strip()
+    assert gateway.usage.summary()["calls"] == len(prompts)
+
+def test_circuit_breaker_only_lets_the_probe_decide_while_half_open():
+    """Test that a slow call from before the trip cannot close or reopen a half-open breaker"""
+    from circuit_breaker import CircuitBreaker
+
+    breaker = CircuitBreaker(latency_budget=1, min_calls=2, open_for=0)
+    breaker.record(False, 0.1)
+    breaker.record(False, 0.1)
+    assert breaker.state == "open" and breaker.trips == 1
+    probe = breaker.probe_due()
+    assert probe is not None and breaker.state == "half_open"
+    breaker.record(True, 0.1)  # a straggler finishing well
+    breaker.record(False, 5.0)  # and one finishing badly
+    assert breaker.state == "half_open" and breaker.trips == 1
+    breaker.record(True, 0.1, probe)
+    assert breaker.state == "closed"
+
+def test_circuit_breaker_answers_locally_and_probes_for_recovery():
+    """Test that a slow model trips the breaker, callers get local lines fast, and a probe closes it"""
+    import asyncio
+    import time
+    from circuit_breaker import CircuitBreaker
+    from llm_gateway import LLMGateway
+    from local_jokes import LocalJokeGenerator
+
+    client, models = _stub_client(*["hang"] * 5, "OK", "Spud-tacular!")
+    breaker = CircuitBreaker(latency_budget=0.05, min_calls=5, open_for=0.05)
+    gateway = LLMGateway(client, model="test", attempt_timeout=0.1, deadline=0.1, max_retries=0,
+                         latency_budget=0.05, breaker=breaker)
+    jokes = LocalJokeGenerator(seed=1)
+    prompt = "User just completed the task 'Peel potatoes'."
+
+    async def scenario():
+        start = time.monotonic()
+        lines = [await gateway.generate(prompt, fallback=lambda: jokes.generate(prompt)) for _ in range(5)]
+        assert time.monotonic() - start < 0.5  # each caller waited at most the budget
+        await asyncio.sleep(0.1)  # the hung calls finish and trip the breaker
+        assert breaker.state == "open"
+        calls_when_open = models.calls
+        lines.append(await gateway.generate(prompt, fallback=lambda: jokes.generate(prompt)))
+        assert models.calls == calls_when_open  # no model call while open
+        await asyncio.sleep(0.1)
+        gateway._available()  # cooldown over: the probe goes out in the background
+        await asyncio.sleep(0.05)
+        lines.append(await gateway.generate(prompt))
+        return lines
+
+    lines = asyncio.run(scenario())
+    assert breaker.state == "closed"
+    assert lines[-1] == "Spud-tacular!"
+    assert all("Peel potatoes" in line for line in lines[:-1])  # local lines for this task
+    assert len(set(lines[:-1])) == len(lines[:-1])
+
+def test_local_jokes_match_the_situation():
+    """Test that the offline generator picks lines for the prompt's situation and stays short"""
+    from local_jokes import LocalJokeGenerator, situation_type
+
+    assert situation_type("User just completed the LAST task! ALL of their tasks (one) are now complete!") == "all_done"
+    assert situation_type("User unchecked the task 'Fry'.") == "unchecked"
+    assert situation_type("User has tasks but completed ZERO of them.") == "zero_done"
+    jokes = LocalJokeGenerator(seed=7)
+    line = jokes.generate("User just completed the task 'Water the plants'.")
+    assert "Water the plants" in line
+    assert "Buy Mom's gift" in jokes.generate("User just completed the task 'Buy Mom's gift'.")
+    assert "Rock 'n' roll" in jokes.generate("User just completed the task \"Rock 'n' roll\".")
+    assert all(len(jokes.generate("User has no tasks today.")) <= 75 for _ in range(20))
+
+def test_speculative_lines_are_served_once_and_dropped_on_rename():
+    """Test that pre-generated completion lines hit once per task and never outlive a rename"""
+    import asyncio
+    from speculative import SpeculativeLines
+
+    async def fake_generate(prompt, fallback=None):
+        return f"line for {prompt}"
+
+    async def scenario():
+        lines = SpeculativeLines(fake_generate, lambda d: f"done {d}", lambda d: f"last {d}")
+        lines.prepare(("1", 1), "Boil")
+        await asyncio.sleep(0.01)
+        first = lines.take(("1", 1), "Boil", last=False)
+        again = lines.take(("1", 1), "Boil", last=False)
+        lines.prepare(("1", 1), "Roast")
+        stale = lines.take(("1", 1), "Boil", last=True)
+        await asyncio.sleep(0.01)
+        last = lines.take(("1", 1), "Roast", last=True)
+        return lines, first, again, stale, last
+
+    lines, first, again, stale, last = asyncio.run(scenario())
+    assert first == "line for done Boil"
+    assert again is None and stale is None
+    assert last == "line for last Roast"
+    assert lines.stats()["hits"] == 2 and lines.stats()["misses"] == 2
+
+def test_complete_task_returns_pre_generated_line(monkeypatch):
+    """Test that completing a task answers with its pre-generated line and no ticket"""
+    import main
+
+    async def fake_generate(prompt, fallback=None):
+        return "Mashed it!" if "LAST" not in prompt else "Every spud is done!"
+    monkeypatch.setattr(main.speculative, "generate", fake_generate)
+
+    with TestClient(app) as live:
+        live.post("/tasks/", json={"description": "Peel"})
+        live.post("/tasks/", json={"description": "Boil"})
+        first = live.post("/tasks/1/complete").json()
+        last = live.put("/tasks/2").json()
+        metrics = live.get("/llm/metrics").json()["speculative"]
+
+    assert first["ai_message"] == "Mashed it!" and first["message_ticket"] is None
+    assert last["ai_message"] == "Every spud is done!"
+    assert metrics["hits"] >= 2
+
+def test_llm_scheduler_prioritises_and_sheds():
+    """Test that queued work runs by priority class and excess or over-budget work gets its fallback"""
+    import asyncio
+    from llm_scheduler import BACKGROUND, INTERACTIVE, NUDGE, LLMWorkScheduler
+
+    order = []
+
+    async def scenario():
+        scheduler = LLMWorkScheduler(max_in_flight=1, queue_limits={INTERACTIVE: 8, NUDGE: 1, BACKGROUND: 8},
+                                     deadlines={INTERACTIVE: 1.0, NUDGE: 1.0, BACKGROUND: 0.05},
+                                     user_requests_per_minute=3)
+        gate = asyncio.Event()
+
+        def work(name):
+            async def run():
+                if name == "blocker":
+                    await gate.wait()
+                order.append(name)
+                return name
+            return run
+
+        blocker = asyncio.create_task(scheduler.run(work("blocker"), INTERACTIVE))
+        await asyncio.sleep(0)
+        jobs = [
+            asyncio.create_task(scheduler.run(work("nudge"), NUDGE, fallback="nudge fallback")),
+            asyncio.create_task(scheduler.run(work("nudge 2"), NUDGE, fallback="nudge shed")),
+            asyncio.create_task(scheduler.run(work("refill"), BACKGROUND, fallback="refill expired")),
+            asyncio.create_task(scheduler.run(work("completion"), INTERACTIVE, user_id="u1")),
+        ]
+        await asyncio.sleep(0.1)  # the background job passes its deadline while queued
+        gate.set()
+        results = await asyncio.gather(blocker, *jobs)
+
+        budget = [await scheduler.run(work("extra"), INTERACTIVE, user_id="u1", fallback="over budget") for _ in range(3)]
+        return scheduler, results, budget
+
+    scheduler, results, budget = asyncio.run(scenario())
+    assert order[:3] == ["blocker", "completion", "nudge"]
+    assert results == ["blocker", "nudge", "nudge shed", "refill expired", "completion"]
+    assert budget == ["extra", "extra", "over budget"]
+    assert scheduler.shed == {"nudge:queue_full": 1, "background:deadline": 1, "interactive:budget": 1}
+
+    # A stream holds its slot until it ends, and an over-budget stream is just the fallback line
+    async def streams():
+        scheduler = LLMWorkScheduler(max_in_flight=1, user_requests_per_minute=1)
+
+        async def tokens():
+            for token in ("Mash", "ed it"):
+                yield token
+
+        first = scheduler.stream(tokens, NUDGE, user_id="u1", fallback="shed")
+        head = await first.__anext__()
+        held = scheduler.stats()["in_flight"]
+        rest = [chunk async for chunk in first]
+        shed = [chunk async for chunk in scheduler.stream(tokens, NUDGE, user_id="u1", fallback="shed")]
+        return head, held, rest, shed, scheduler.stats()["in_flight"], scheduler.shed
+
+    assert asyncio.run(streams()) == ("Mash", 1, ["ed it"], ["shed"], 0, {"nudge:budget": 1})
+
+    # Entries that time out stop counting towards the queue limit, and work shed for a
+    # full queue leaves its user's budget alone
+    async def expiring():
+        scheduler = LLMWorkScheduler(max_in_flight=1, queue_limits={INTERACTIVE: 2},
+                                     deadlines={INTERACTIVE: 0.02}, user_requests_per_minute=1)
+        gate = asyncio.Event()
+
+        async def blocked():
+            await gate.wait()
+            return "blocker"
+
+        async def quick():
+            return "ran"
+
+        blocker = asyncio.create_task(scheduler.run(blocked, INTERACTIVE))
+        await asyncio.sleep(0)
+        expired = await asyncio.gather(*(scheduler.run(quick, INTERACTIVE, fallback="late") for _ in range(2)))
+        queued_after_expiry = scheduler.stats()["queued"]
+        waiting = [asyncio.create_task(scheduler.run(quick, INTERACTIVE, fallback="late")) for _ in range(2)]
+        await asyncio.sleep(0)
+        full = await scheduler.run(quick, INTERACTIVE, user_id="u2", fallback="full")
+        gate.set()
+        ran = await asyncio.gather(blocker, *waiting)
+        after = await scheduler.run(quick, INTERACTIVE, user_id="u2", fallback="over budget")
+        return expired, queued_after_expiry, full, ran, after, scheduler.shed
+
+    assert asyncio.run(expiring()) == (["late", "late"], {}, "full", ["blocker", "ran", "ran"], "ran",
+                                       {"interactive:deadline": 2, "interactive:queue_full": 1})
+
+def test_metrics_report_route_latency_and_request_spans():
+    """Test that /metrics exposes per-route histograms and responses carry Server-Timing spans"""
+    client.post("/tasks/", json={"description": "Scrub potatoes"})
+    response = client.patch("/tasks/1", json={"description": "Scrub the potatoes"})
+    timing = response.headers["server-timing"]
+    assert "validation;dur=" in timing and "handler;dur=" in timing and "serialization;dur=" in timing
+
+    metrics = client.get("/metrics")
+    assert metrics.headers["content-type"].startswith("text/plain")
+    text = metrics.text
+    assert 'potatodo_request_seconds_count{route="/tasks/{task_id}",method="PATCH",status="200"}' in text
+    assert 'potatodo_request_seconds_bucket{route="/tasks/",method="POST",status="200",le="+Inf"}' in text
+    assert 'potatodo_request_span_seconds_count{route="/tasks/{task_id}",span="handler"}' in text
+    assert "potatodo_requests_in_flight 1" in text  # the /metrics request itself
+    assert 'potatodo_cache_hits_total{cache="speculative"}' in text
+    assert "# TYPE potatodo_llm_call_seconds histogram" in text
+
+def test_fake_gemini_serves_the_real_client_and_baselines_flag_regressions():
+    """Test that the benchmark's fake model answers the genai client and slower p95s are reported"""
+    import asyncio
+    from benchmark_endpoints import compare
+    from fake_gemini import FakeGemini, FakeGeminiServer
+    from llm_gateway import LLMGateway
+
+    model = FakeGemini(latency=0.01, jitter=0.0, seed=1)
+    with FakeGeminiServer(model) as server:
+        gateway = LLMGateway(server.client(), "fake-model", system_instruction="Be a potato.", cache_ttl=60)
+
+        async def both():
+            return await asyncio.gather(
+                gateway.generate("Cheer me on"),
+                gateway.generate("One line per situation.\n1. Peeled\n2. Boiled"),
+            )
+        single, batch = asyncio.run(both())
+    assert single.startswith("Spud line")
+    assert batch.splitlines()[0].startswith("1. ") and batch.splitlines()[1].startswith("2. ")
+    assert model.calls == 2 and gateway.usage.calls == 2
+
+    level = lambda p95: [{"tasks": 10, "concurrency": 1, "endpoints": {"GET /bootstrap": {"p95_ms": p95}}}]
+    assert compare(level(30.0), {"results": level(10.0)}, tolerance=1.5, min_delta_ms=2.0) == [
+        ("10 tasks x 1 users", "GET /bootstrap", 10.0, 30.0)
+    ]
+    assert compare(level(10.5), {"results": level(10.0)}, tolerance=1.5, min_delta_ms=2.0) == []
+
+def test_app_import_stays_within_startup_budget():
+    """Test that importing the app skips the genai stack and stays within its import-time budget"""
+    import os
+    import subprocess
+    import sys
+
+    budget_seconds = 1.0
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env={**os.environ, "GOOGLE_API_KEY": "import-test"},
+        capture_output=True, text=True, check=True,
+    )
+    # Each line is "import time: self [us] | cumulative | module"
+    cumulative = {}
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line and "cumulative" not in line:
+            _, total, name = line.split("|")
+            cumulative[name.strip()] = int(total)
+
+    assert not [name for name in cumulative if name.startswith(("google.genai", "google.auth", "grpc"))]
+    assert cumulative["main"] / 1e6 < budget_seconds
+
+def test_workers_sharing_a_database_see_each_others_writes(tmp_path):
+    """Test that two workers on one shared database reload what the other changed"""
+    from main import load_user_stats
+    from storage import SharedSQLiteStorage
+    from user_state import UserRegistry
+
+    path = str(tmp_path / "shared.db")
+    first = UserRegistry(SharedSQLiteStorage(path), load_user_stats)
+    second = UserRegistry(SharedSQLiteStorage(path), load_user_stats)
+    reloaded = []
+    second.on_reload = lambda user, old_tasks: reloaded.append(len(old_tasks))
+
+    user = first.get("spud")
+    other = second.get("spud")
+    with user.lock:
+        user.tasks.add({"id": user.tasks.allocate_id(), "description": "Peel", "is_completed": False})
+    snapshot_version = other.tasks.version
+
+    assert [task["description"] for task in second.get("spud").tasks] == ["Peel"]
+    assert reloaded == [0] and other.tasks.version != snapshot_version
+
+    # Writes start from the latest state, so ids never collide across workers
+    with other.lock:
+        other.tasks.add({"id": other.tasks.allocate_id(), "description": "Boil", "is_completed": False})
+        other.tasks.set_completed(1, True)
+        other.stats.current_streak = 4
+        other.save_stats()
+    with user.lock:
+        assert [task["id"] for task in user.tasks] == [1, 2]
+        assert user.tasks.completed_count == 1 and user.stats.current_streak == 4
+
+    # Another user's write-behind row committed by this user's transaction is logged for that user too
+    tater = first.get("tater")
+    second.get("tater")
+    tater.stats.current_streak = 2
+    tater.save_stats()  # queued outside any lock, as a quest bootstrap under read_lock is
+    with user.lock:
+        user.tasks.update(1, description="Peel well")
+    assert second.get("tater").stats.current_streak == 2
+
+def test_shared_mode_takes_user_locks_off_the_event_loop(tmp_path, monkeypatch):
+    """Test that async handlers' locked work and sweeper commits stay off the loop when workers share state"""
+    import asyncio
+    import threading
+    import main
+    from midnight_sweeper import MidnightSweeper
+    from storage import SharedSQLiteStorage
+    from user_state import UserRegistry
+
+    registry = UserRegistry(SharedSQLiteStorage(str(tmp_path / "shared.db")), main.load_user_stats)
+    user = registry.get("spud")
+
+    async def locked_thread():
+        return threading.get_ident(), await main.run_locked(user, threading.get_ident)
+
+    monkeypatch.setattr(main, "storage", registry.storage)
+    loop_thread, locked = asyncio.run(locked_thread())
+    assert locked != loop_thread
+
+    # The sweeper commits a few users at a time, releasing the write lock in between
+    holds = []
+    hold = registry.hold
+    monkeypatch.setattr(registry, "hold", lambda held: holds.append(len(held)) or hold(held))
+    sweeper = MidnightSweeper(lambda user, today: None, batch_size=5, commit_size=2)
+    for n in range(5):
+        sweeper.track(f"user-{n}", "UTC")
+    asyncio.run(sweeper.sweep(registry, "UTC", 0.0))
+    assert holds == [2, 2, 1]
+    registry.storage.close()
+
+def test_event_loop_keeps_running_while_a_big_list_is_read(monkeypatch):
+    """Test that reading a large task list doesn't stall the loop when the same user writes meanwhile"""
+    import asyncio
+    import time
+    import httpx
+    import main
+
+    async def fake_generate(task_status, fallback=None, **options):
+        return "Mashed it!"
+
+    monkeypatch.setattr(main, "generate_reminder", fake_generate)
+    monkeypatch.setattr(main.speculative, "generate", fake_generate)
+    user = users.get("hoarder")
+    for n in range(20_000):
+        user.tasks.add({"description": f"Task {n}", "created_at": datetime.datetime(2025, 1, 1)})
+
+    async def scenario():
+        gaps = []
+
+        async def ticker(done):
+            last = time.perf_counter()
+            while not done.is_set():
+                await asyncio.sleep(0.005)
+                now = time.perf_counter()
+                gaps.append(now - last)
+                last = now
+
+        headers = {"X-User-Id": "hoarder"}
+        done = asyncio.Event()
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as http:
+            ticking = asyncio.create_task(ticker(done))
+            listing = asyncio.create_task(http.get("/tasks/", headers=headers))
+            for _ in range(1000):  # write while the read holds the lock, if it is ever seen holding it
+                await asyncio.sleep(0.001)
+                if not user.lock.acquire(blocking=False):
+                    break
+                user.lock.release()
+            toggled = await http.post("/tasks/1/complete", headers=headers)
+            listed = await listing
+            done.set()
+            await ticking
+        return listed, toggled, max(gaps)
+
+    listed, toggled, longest_gap = asyncio.run(scenario())
+    assert listed.status_code == 200 and len(listed.json()) == 20_000
+    assert toggled.status_code == 200
+    assert longest_gap < 0.25
+
+def test_midnight_reset_endpoint_closes_yesterday_once():
+    """Test that the renderer's midnight reset archives under yesterday and defers to an earlier reset"""
+    headers = {"X-User-Id": "night-owl"}
+    client.post("/tasks/", json={"description": "Fry chips"}, headers=headers)
+    result = client.post("/midnight-reset", headers=headers).json()
+    assert result["tasks_cleared"] == 1
+
+    yesterday = (datetime.datetime.now(datetime.timezone.utc).date() - datetime.timedelta(days=1)).isoformat()
+    found = client.get("/tasks/search?q=fry", headers=headers).json()["tasks"]
+    assert [t["archived_day"] for t in found] == [yesterday]
+
+    # The sweeper (or an earlier call) already reset today, so today's new task stays
+    client.post("/tasks/", json={"description": "Bake wedges"}, headers=headers)
+    result = client.post("/midnight-reset", headers=headers).json()
+    assert result["tasks_cleared"] == 0 and result["message"] == "Already reset today"
+    assert [t["description"] for t in client.get("/tasks/", headers=headers).json()] == ["Bake wedges"]
+
+def test_history_rolls_up_activity_and_survives_the_midnight_reset(tmp_path):
+    """Test that /history reports each local day's activity from the event log"""
+    from activity_log import COMPLETE, ActivityLog
+    from storage import SQLiteStorage
+
+    headers = {"X-User-Id": "historian"}
+    client.post("/onboarding?timezone=Asia/Tokyo", headers=headers)
+    for name in ["Peel", "Mash"]:
+        client.post("/tasks/", json={"description": name}, headers=headers)
+    client.post("/daily-quests/", json={"quest_name": "Water"}, headers=headers)
+    client.post("/tasks/1/complete", headers=headers)
+    client.post("/tasks/1/complete", headers=headers)  # toggled back
+    client.post("/tasks/1/complete", headers=headers)
+    client.put("/tasks/2", headers=headers)
+    client.put("/tasks/2", headers=headers)  # already done, not logged twice
+    client.patch("/daily-quests/complete", headers=headers)
+    assert client.post("/check-in", headers=headers).json()["streak_pushed_forward"]
+    client.post("/midnight-reset", headers=headers)
+
+    history = client.get("/history", headers=headers).json()
+    assert history["timezone"] == "Asia/Tokyo" and len(history["days"]) == 30
+    today = history["days"][-1]
+    assert today["completed"] == 3 and today["uncompleted"] == 1 and today["net_completed"] == 2
+    assert today["quests_completed"] == 1 and today["checked_in"] and today["perfect_day"]
+    assert today["streak"] == 1
+    assert history["days"][0]["completed"] == 0 and history["days"][0]["streak"] is None
+    assert history["totals"]["perfect_days"] == 1 and history["totals"]["active_days"] == 1
+
+    assert client.get("/history?start=2026-02-01&end=2026-01-01", headers=headers).status_code == 400
+    assert client.get("/history?start=2024-01-01&end=2026-01-01", headers=headers).status_code == 400
+
+    # Rollups are written through, so a restarted process reads them back without replaying events
+    path = str(tmp_path / "history.db")
+    storage = SQLiteStorage(path)
+    at = datetime.datetime(2026, 3, 1, 23, 30, tzinfo=datetime.timezone.utc)
+    ActivityLog(storage.for_user("spud")).append(COMPLETE, at, 1)
+    storage.close()
+    rollups = ActivityLog(SQLiteStorage(path).for_user("spud")).rollups
+    assert rollups[datetime.date(2026, 3, 1)].completed == 1
+
+def test_midnight_sweeper_resets_each_timezone_bucket_once_at_its_midnight(tmp_path):
+    """Test that the sweeper resets and archives a bucket at its midnight, idempotently and after restarts"""
+    import asyncio
+    from zoneinfo import ZoneInfo
+    from main import load_user_stats, reset_day
+    from midnight_sweeper import MidnightSweeper, next_midnight
+    from storage import SQLiteStorage
+
+    def open_registry(path):
+        from user_state import UserRegistry
+        sweeper = MidnightSweeper(lambda user, today: reset_day(user, today, today - datetime.timedelta(days=1)),
+                                  batch_size=2)
+        storage = SQLiteStorage(path)
+        registry = UserRegistry(storage, load_user_stats,
+                                on_create=lambda user: sweeper.track(user.user_id, user.stats.timezone))
+        for user_id in storage.user_ids():
+            registry.get(user_id)
+        return storage, registry, sweeper
+
+    path = str(tmp_path / "sweep.db")
+    storage, registry, sweeper = open_registry(path)
+    zones = {"tokyo-1": "Asia/Tokyo", "tokyo-2": "Asia/Tokyo", "tokyo-3": "Asia/Tokyo", "ny": "America/New_York"}
+    for user_id, timezone in zones.items():
+        user = registry.get(user_id)
+        with user.lock:
+            user.stats.timezone = timezone
+            user.save_stats()
+            user.tasks.add({"id": user.tasks.allocate_id(), "description": "Peel", "is_completed": False})
+        sweeper.track(user_id, timezone)
+    assert sweeper.zones() == {"Asia/Tokyo": 3, "America/New_York": 1}
+
+    midnight = next_midnight("Asia/Tokyo", datetime.datetime.now().timestamp())
+    assert asyncio.run(sweeper.sweep(registry, "Asia/Tokyo", midnight)) == 3  # two chunks
+    assert asyncio.run(sweeper.sweep(registry, "Asia/Tokyo", midnight + 60)) == 0  # already reset today
+    assert [len(registry.get(user_id).tasks) for user_id in zones] == [0, 0, 0, 1]
+    tokyo_day = datetime.datetime.fromtimestamp(midnight, ZoneInfo("Asia/Tokyo")).date()
+    assert registry.get("tokyo-1").stats.last_reset_date == tokyo_day.isoformat()
+    storage.close()
+
+    # After a restart the stamps survive; a day missed while down is caught up, never-reset users are left alone
+    storage, registry, sweeper = open_registry(path)
+    archived = storage.load_archives("tokyo-1", (tokyo_day - datetime.timedelta(days=1)).isoformat())
+    assert [task["description"] for task in archived[0]["tasks"]] == ["Peel"]
+    registry.get("tokyo-2").tasks.add({"id": 1, "description": "Mash", "is_completed": False})
+    assert asyncio.run(sweeper.sweep(registry, "Asia/Tokyo", midnight + 60, at_boundary=False)) == 0
+    # Only users with something stored to reset are loaded at startup
+    assert asyncio.run(sweeper.sweep(registry, "Asia/Tokyo", midnight + 86400, at_boundary=False)) == 1
+    assert len(registry.get("tokyo-2").tasks) == 0
+    assert asyncio.run(sweeper.sweep(registry, "America/New_York", midnight + 86400, at_boundary=False)) == 0
+    assert len(registry.get("ny").tasks) == 1
+    storage.close()
+
+def test_deadline_index_answers_due_soon_overdue_and_next_due():
+    """Test that deadline queries follow completion, edits and deletes, and the endpoints use them"""
+    from task_store import TaskStore
+
+    now = datetime.datetime.now(datetime.timezone.utc)
+    store = TaskStore()
+    for n, hours in enumerate([-3, -1, 0.5, 2, 30]):
+        store.add({"description": f"Task {n + 1}", "deadline": now + datetime.timedelta(hours=hours)})
+    store.add({"description": "No deadline"})
+    store.add({"description": "As text", "deadline": (now + datetime.timedelta(hours=1)).isoformat()})
+    ts = now.timestamp()
+
+    assert [t["id"] for t in store.overdue(ts)] == [1, 2]
+    assert [t["id"] for t in store.due_between(ts, ts + 3 * 3600)] == [3, 7, 4]
+    assert [t["id"] for t in store.next_due(ts, 2)] == [3, 7]
+    store.set_completed(3, True)
+    store.update(4, deadline=now - datetime.timedelta(hours=5))
+    store.delete(7)
+    assert [t["id"] for t in store.overdue(ts)] == [4, 1, 2]
+    assert [t["id"] for t in store.next_due(ts, 5)] == [5]
+    store.set_completed(3, False)
+    assert [t["id"] for t in store.next_due(ts, 1)] == [3]
+
+    headers = {"X-User-Id": "deadlines"}
+    client.post("/onboarding?timezone=Asia/Tokyo", headers=headers)
+    for hours in [-2, 1, 3]:
+        deadline = (now + datetime.timedelta(hours=hours)).isoformat()
+        client.post("/tasks/", json={"description": f"Due in {hours}h", "deadline": deadline}, headers=headers)
+    due = client.get("/tasks/due?within_minutes=120", headers=headers).json()
+    assert [t["description"] for t in due["tasks"]] == ["Due in 1h"]
+    assert due["tasks"][0]["deadline_local"].endswith("+09:00") and 58 <= due["tasks"][0]["due_in_minutes"] <= 60
+    assert [t["description"] for t in client.get("/tasks/overdue", headers=headers).json()["tasks"]] == ["Due in -2h"]
+    next_due = client.get("/tasks/next-due?limit=5", headers=headers).json()["tasks"]
+    assert [t["description"] for t in next_due] == ["Due in 1h", "Due in 3h"]
+    assert client.get("/tasks/due?within_minutes=0", headers=headers).status_code == 422
+
+def test_search_ranks_tasks_and_completes_the_last_word(tmp_path):
+    """Test that the search index follows adds, renames and deletes, matches prefixes and keeps past days"""
+    from storage import SQLiteStorage
+    from task_store import TaskStore
+
+    store = TaskStore()
+    for description in ["Water the potatoes", "Buy potato chips", "Peel potatoes, then mash the potatoes",
+                        "Call grandma", "Wash the car"]:
+        store.add({"description": description})
+
+    assert [t["id"] for t, _ in store.search("potatoes")] == [3, 1]  # two mentions outrank one
+    assert [t["id"] for t, _ in store.search("pot")] == [2, 3, 1]  # "potato" is the rarer expansion
+    assert [t["id"] for t, _ in store.search("the wa")] == [5, 1]  # equal scores, newest first
+    assert store.search("the wa ") == []  # a finished word must match exactly
+    assert store.search("pot", prefix=False) == []
+    assert [t["id"] for t, _ in store.search("GRANDMA!")] == [4]
+
+    store.update(4, description="Call grandpa")
+    store.delete(1)
+    assert store.search("grandma") == [] and [t["id"] for t, _ in store.search("grandp")] == [4]
+    assert [t["id"] for t, _ in store.search("wa")] == [5]
+    store.clear()
+    assert store.search("car") == [] and len(store.search_index) == 0
+
+    headers = {"X-User-Id": "searcher"}
+    for description in ["Water the potatoes", "Walk the dog"]:
+        client.post("/tasks/", json={"description": description}, headers=headers)
+    found = client.get("/tasks/search?q=wat", headers=headers).json()
+    assert [t["description"] for t in found["tasks"]] == ["Water the potatoes"] and found["tasks"][0]["score"] > 0
+    assert len(client.get("/tasks/search?q=the&limit=1", headers=headers).json()["tasks"]) == 1
+
+    # After the midnight reset yesterday's tasks are still found, flagged as archived
+    client.post("/midnight-reset", headers=headers)
+    client.post("/tasks/", json={"description": "Water the garden"}, headers=headers)
+    found = client.get("/tasks/search?q=water", headers=headers).json()["tasks"]
+    assert [(t["description"], t["archived"]) for t in found] == [("Water the garden", False),
+                                                                  ("Water the potatoes", True)]
+    assert found[1]["archived_day"] and found[1]["id"] == 1
+    assert found[0]["id"] == 3  # the id sequence carries on over the reset
+
+    # and from the storage's day archives when a store is rebuilt
+    storage = SQLiteStorage(str(tmp_path / "search.db"))
+    store = TaskStore(storage.for_user("1"))
+    store.add({"description": "Mash potatoes"})
+    storage.for_user("1").archive_day("2025-01-01", {"tasks": store.all(), "quests": []})
+    store.archive("2025-01-01")
+    store.clear()
+    storage.flush()
+    assert [t["archived_day"] for t, _ in store.search("mash")] == ["2025-01-01"]
+    rebuilt = TaskStore(storage.for_user("1"))
+    assert len(rebuilt) == 0 and [t["description"] for t, _ in rebuilt.search("mash")] == ["Mash potatoes"]
+    assert rebuilt.allocate_id() == 2  # and survives a restart
+
+    # only the last ``archive_days`` days are kept searchable, in memory and on rebuild
+    rebuilt.add({"description": "Mash more potatoes"})
+    storage.for_user("1").archive_day("2025-01-02", {"tasks": rebuilt.all(), "quests": []})
+    rebuilt.archive_days = 1
+    rebuilt.archive("2025-01-02")
+    rebuilt.clear()
+    storage.flush()
+    assert [t["archived_day"] for t, _ in rebuilt.search("mash")] == ["2025-01-02"]
+    latest = TaskStore(storage.for_user("1"), archive_days=1)
+    assert [t["archived_day"] for t, _ in latest.search("mash")] == ["2025-01-02"]
+    storage.close()
+
+def test_task_pages_filter_sort_and_resume_from_a_cursor():
+    """Test that task pages follow the index through writes and that cursors stay stable"""
+    from task_store import TaskStore
+
+    base = datetime.datetime(2025, 1, 1, 9, 0)
+    store = TaskStore()
+    for n in range(1, 8):
+        store.add({"description": f"Task {n}", "created_at": base + datetime.timedelta(hours=n),
+                   "deadline": base + datetime.timedelta(days=8 - n) if n % 2 else None,
+                   "reminder_minutes": 10 if n == 3 else None})
+    store.set_completed(2, True)
+    store.set_completed(5, True)
+
+    def ids(tasks):
+        return [t["id"] for t in tasks]
+
+    tasks, after = store.page("created", limit=3)
+    assert ids(tasks) == [1, 2, 3]
+    store.add({"description": "Task 8", "created_at": base})  # lands before the cursor, so no page repeats
+    store.delete(4)
+    tasks, after = store.page("created", limit=3, after=after)
+    assert ids(tasks) == [5, 6, 7] and after is None
+    assert ids(store.page("completion", limit=10)[0]) == [8, 1, 3, 6, 7, 2, 5]
+    assert ids(store.page("deadline", limit=10)[0]) == [7, 5, 3, 1, 8, 2, 6]
+    assert ids(store.page("created", limit=10, descending=True, completed=False)[0]) == [7, 6, 3, 1, 8]
+    assert ids(store.page("created", limit=10, has_deadline=True, has_reminder=False)[0]) == [1, 5, 7]
+    window = ((base + datetime.timedelta(hours=2)).timestamp(), (base + datetime.timedelta(hours=6)).timestamp())
+    assert ids(store.page("deadline", limit=10, created=window)[0]) == [5, 3, 2]
+    assert ids(store.page("completion", limit=10, created=window)[0]) == [3, 2, 5]
+    store.update(3, reminder_minutes=0)  # no reminder fires for 0 minutes, so it is not listed as having one
+    assert ids(store.page("created", limit=10, has_reminder=True)[0]) == []
+
+    headers = {"X-User-Id": "pages"}
+    for n in range(5):
+        client.post("/tasks/", json={"description": f"Page task {n}",
+                                     "created_at": (base + datetime.timedelta(minutes=n)).isoformat()}, headers=headers)
+    client.put("/tasks/2", json={"is_completed": True}, headers=headers)
+    assert len(client.get("/tasks/", headers=headers).json()) == 5  # no paging params: the whole list
+    page = client.get("/tasks/?sort=completion&limit=2", headers=headers).json()
+    seen = [t["id"] for t in page["tasks"]]
+    while page["next_cursor"]:
+        page = client.get(f"/tasks/?sort=completion&limit=2&cursor={page['next_cursor']}", headers=headers).json()
+        seen += [t["id"] for t in page["tasks"]]
+    assert seen == [1, 3, 4, 5, 2]
+    page = client.get("/tasks/?completed=false&limit=2", headers=headers).json()
+    assert [t["id"] for t in page["tasks"]] == [1, 3]
+    assert client.get(f"/tasks/?sort=deadline&cursor={page['next_cursor']}", headers=headers).status_code == 400
+    assert client.get("/tasks/?cursor=not-a-cursor", headers=headers).status_code == 400
+    assert client.get("/tasks/?limit=2&since=1", headers=headers).status_code == 400
+
+    # Stored creation times are UTC, so an offset in the filter means the same instant
+    headers = {"X-User-Id": "pages-tz"}
+    client.post("/tasks/", json={"description": "Early", "created_at": "2025-01-01T09:00:00+02:00"}, headers=headers)
+    created = client.post("/tasks/", json={"description": "Late", "created_at": "2025-01-01T09:00:00Z"},
+                          headers=headers).json()["task"]["created_at"]
+    assert datetime.datetime.fromisoformat(created).utcoffset() == datetime.timedelta(0)
+    page = client.get("/tasks/", params={"created_from": "2025-01-01T10:30:00+02:00"}, headers=headers).json()
+    assert [t["description"] for t in page["tasks"]] == ["Late"]
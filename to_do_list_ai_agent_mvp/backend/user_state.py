@@ -0,0 +1,184 @@
+import datetime
+import threading
+from contextlib import ExitStack, contextmanager
+from zoneinfo import ZoneInfo
+
+from activity_log import COMPLETE, UNCOMPLETE, ActivityLog
+from midnight_sweeper import zone_name
+from task_store import TaskStore
+
+
+class UserState:
+    """One user's partition: tasks, daily quest and stats, plus the lock that
+    serialises that user's writes.
+
+    Handlers hold ``lock`` only around in-memory reads and writes, never
+    across an ``await``. The event loop only ever takes it without blocking
+    (``run_locked`` falls back to a worker thread when it is held), so a long
+    hold for one user never stalls the others. Different users never share a lock.
+
+    ``revision`` counts quest and stats saves; together with the task list
+    version it identifies the state a cached ``snapshot`` was built from.
+
+    ``synced_seq`` is the last change from the shared database's change log
+    that this copy reflects (0 unless workers share state). Read-only
+    handlers take ``read_lock``, which is ``lock`` itself unless workers
+    share state, where it skips the database write transaction.
+    """
+
+    def __init__(self, user_id: str, storage, stats, synced_seq: int = 0):
+        self.user_id = user_id
+        self.storage = storage  # this user's storage view
+        self.tasks = TaskStore(storage)
+        self.quests = storage.load_quests()
+        self.stats = stats
+        self.activity = ActivityLog(storage)
+        self.lock = threading.RLock()
+        self.read_lock = self.lock
+        self.revision = 0
+        self.snapshot = None  # (state key, encoded body) of the last /bootstrap response
+        self.synced_seq = synced_seq
+
+    def save_quests(self):
+        self.revision += 1
+        self.storage.save_quests(self.quests)
+
+    def save_stats(self):
+        self.revision += 1
+        self.storage.save_user_stats(self.stats.model_dump())
+
+    def now(self) -> datetime.datetime:
+        """The current time in the user's timezone (UTC if it is unknown), which decides what day it is for them."""
+        return datetime.datetime.now(ZoneInfo(zone_name(self.stats.timezone)))
+
+    def record(self, kind: int, task_id=None, **outcome):
+        """Log an activity event for the user's current local day; callers hold ``lock``."""
+        return self.activity.append(kind, self.now(), task_id, **outcome)
+
+    def set_task_completed(self, task_id: int, is_completed: bool):
+        """Change a task's completion state, logging the change; callers hold ``lock``."""
+        task = self.tasks.get(task_id)
+        if task is not None and task["is_completed"] != is_completed:
+            self.tasks.set_completed(task_id, is_completed)
+            self.record(COMPLETE if is_completed else UNCOMPLETE, task_id)
+        return task
+
+
+class _SharedLock:
+    """``UserState.lock`` when worker processes share the database.
+
+    Entering takes the thread lock and then the database write transaction,
+    and reloads the partition if another worker changed it since it was
+    loaded, so the writes that follow always start from the latest state.
+    Leaving commits them and records the change for the other workers.
+    """
+
+    def __init__(self, registry, user):
+        self.registry = registry
+        self.user = user
+        self.local = threading.RLock()  # excludes this process's other threads; the user's read_lock
+
+    def __enter__(self):
+        self.local.acquire()
+        try:
+            latest = self.registry.storage.begin(self.user.user_id)
+        except Exception:
+            self.local.release()
+            raise
+        if latest > self.user.synced_seq:
+            self.registry.reload(self.user, latest)
+        return self
+
+    def __exit__(self, *exc):
+        try:
+            seq = self.registry.storage.commit(self.user.user_id)
+            if seq is not None:
+                self.user.synced_seq = seq
+        finally:
+            self.local.release()
+
+
+class UserRegistry:
+    """Resolves a user key to that user's partition, loading it from storage on first use.
+
+    When worker processes share the storage, every lookup first polls it
+    for partitions other workers changed and reloads those in place, so
+    in-memory state and anything cached from it stay coherent;
+    ``on_reload(user, old_tasks)`` lets the app re-derive its own caches,
+    and ``on_create(user)`` sees each partition once, when it is loaded.
+    """
+
+    def __init__(self, storage, make_stats, on_reload=None, on_create=None):
+        self.storage = storage
+        self.make_stats = make_stats  # (user_id, saved stats dict or None) -> stats model
+        self.on_reload = on_reload
+        self.on_create = on_create
+        self._users = {}
+        self._lock = threading.Lock()  # only taken when a partition is created
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+    def __iter__(self):
+        return iter(list(self._users.values()))
+
+    def get(self, user_id: str) -> UserState:
+        if self.storage.shared:
+            self.refresh()
+        user = self._users.get(user_id)
+        if user is None:
+            with self._lock:
+                user = self._users.get(user_id)
+                if user is None:
+                    # The change is read first, so a write landing mid-load only causes a spare reload
+                    synced_seq = self.storage.user_seq(user_id) if self.storage.shared else 0
+                    view = self.storage.for_user(user_id)
+                    stats = self.make_stats(user_id, view.load_user_stats())
+                    user = UserState(user_id, view, stats, synced_seq)
+                    if self.storage.shared:
+                        user.lock = _SharedLock(self, user)
+                        user.read_lock = user.lock.local
+                    self._users[user_id] = user
+                    if self.on_create is not None:
+                        self.on_create(user)
+        return user
+
+    @contextmanager
+    def hold(self, users):
+        """Lock several users at once and commit their writes as one storage transaction.
+
+        Yields the users in id order, the order their locks are taken in;
+        every user's own lock is taken before the storage's, as a request
+        does, and each ``user.lock`` can still be entered inside.
+        """
+        ordered = sorted(users, key=lambda user: user.user_id)
+        with ExitStack() as stack:
+            for user in ordered:
+                stack.enter_context(user.read_lock)
+            stack.enter_context(self.storage.batch())
+            yield ordered
+
+    def refresh(self):
+        """Reload the partitions other workers changed since the last poll."""
+        changed = self.storage.changed_users()
+        if changed is None:  # too far behind the change log to tell, so reload everyone
+            changed = {user.user_id: float("inf") for user in self}
+        for user_id, seq in changed.items():
+            user = self._users.get(user_id)
+            if user is not None and seq > user.synced_seq:
+                with user.lock:  # reloads as it enters if still stale
+                    pass
+
+    def reload(self, user: UserState, synced_seq: int):
+        """Replace ``user``'s state with what is stored; callers hold ``user.lock``."""
+        old_tasks = user.tasks.all()
+        view = user.storage
+        user.tasks = TaskStore(view, min_version=user.tasks.version + 1)  # never reuse an ETag
+        user.quests = view.load_quests()
+        user.stats = self.make_stats(user.user_id, view.load_user_stats())
+        user.activity = ActivityLog(view)
+        user.revision += 1
+        user.snapshot = None
+        user.synced_seq = synced_seq
+        if self.on_reload is not None:
+            self.on_reload(user, old_tasks)
@@ -549,11 +549,7 @@ async function saveEditedTask() {
             const result = await response.json();
             console.log('Task updated successfully on backend:', result);
             
-            // Schedule reminder timer if task has deadline and reminder
-            if (result.task && result.task.deadline && result.task.reminder_minutes) {
-                scheduleReminderTimer(result.task);
-            }
-            
+            // The backend reschedules the reminder from the updated task
             localStorage.removeItem('editingTask');
             window.currentDeadline = null;
             window.currentReminderMinutes = null;
@@ -611,12 +607,6 @@ async function deleteTask() {
             if (response.ok) {
                 console.log('Task deleted successfully from backend');
                 
-                // Cancel any active reminder timer
-                if (activeReminderTimers.has(taskToDelete.id)) {
-                    clearTimeout(activeReminderTimers.get(taskToDelete.id));
-                    activeReminderTimers.delete(taskToDelete.id);
-                }
-                
                 localStorage.removeItem('editingTask');
                 window.location.href = 'index.html';
                 
@@ -706,56 +696,6 @@ document.addEventListener('DOMContentLoaded', function() {
     }
 });
 
-// Timer-based reminder system for edit-task
-let activeReminderTimers = new Map();
-
-function scheduleReminderTimer(task) {
-    if (!task.reminder_minutes) return; // Only need reminder_minutes to be set
-    
-    let reminderTime;
-    
-    if (task.deadline) {
-        // CONDITION 1: Reminder X minutes BEFORE deadline
-        const deadlineTime = new Date(task.deadline).getTime();
-        reminderTime = deadlineTime - (task.reminder_minutes * 60 * 1000);
-        console.log(`Reminder set for "${task.description}" ${task.reminder_minutes} minutes before deadline`);
-    } else {
-        // CONDITION 2: Reminder X minutes FROM NOW (not from creation time)
-        const now = Date.now();
-        reminderTime = now + (task.reminder_minutes * 60 * 1000);
-        console.log(`Reminder set for "${task.description}" ${task.reminder_minutes} minutes from now`);
-    }
-    
-    const now = Date.now();
-    
-    // Only set timer if reminder is in the future
-    if (reminderTime > now) {
-        const delay = reminderTime - now;
-        console.log(`Timer will fire in ${Math.round(delay/1000/60)} minutes`);
-        
-        const timerId = setTimeout(async () => {
-            try {
-                const response = await fetch(`${API_BASE_URL}/reminder/${task.id}`);
-                if (response.ok) {
-                    const data = await response.json();
-                    if (data.reminder) {
-                        typewriterEffect(data.reminder);
-                    }
-                }
-            } catch (error) {
-                console.error('Failed to get reminder message:', error);
-                typewriterEffect(`⏰ "${task.description}" reminder!`);
-            }
-            
-            activeReminderTimers.delete(task.id);
-        }, delay);
-        
-        activeReminderTimers.set(task.id, timerId);
-    } else {
-        console.log('Reminder time has already passed, not setting timer');
-    }
-}
-
 
 
 
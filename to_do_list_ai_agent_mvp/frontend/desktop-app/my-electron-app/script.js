@@ -16,6 +16,36 @@ async function testBackendConnection() {
     }
 }
 
+// === AI MESSAGE CHANNEL ===
+// Task toggles return a message_ticket right away; the AI line arrives here afterwards
+let aiMessageSource = null;
+
+function subscribeToAIMessages() {
+    if (aiMessageSource) {
+        return;
+    }
+    aiMessageSource = new EventSource(`${API_BASE_URL}/events`);
+    aiMessageSource.addEventListener('ai_message', (event) => {
+        const data = JSON.parse(event.data);
+        console.log('AI message received:', data);
+        if (data.ai_message) {
+            typewriterEffect(data.ai_message);
+        }
+    });
+    // Reminders are scheduled and generated by the backend and pushed here when due
+    aiMessageSource.addEventListener('reminder', (event) => {
+        const data = JSON.parse(event.data);
+        console.log('Reminder received:', data);
+        if (data.reminder) {
+            typewriterEffect(data.reminder);
+        }
+    });
+    aiMessageSource.onerror = (error) => {
+        // EventSource reconnects on its own
+        console.error('AI message channel error:', error);
+    };
+}
+
 // === POTATO IMAGE SWITCHING SYSTEM ===
 let currentPotatoState = 'default';
 let potatoRevertTimer = null;  // ← ADD THIS LINE
@@ -36,6 +66,19 @@ async function getTasksFromBackend() {
     }
 }
 
+// One request for everything the home screen shows: tasks, quest, streak and daily status
+async function fetchBootstrap() {
+    try {
+        const response = await fetch(`${API_BASE_URL}/bootstrap`);
+        if (response.ok) {
+            return await response.json();
+        }
+    } catch (error) {
+        console.error('Error fetching bootstrap snapshot:', error);
+    }
+    return null;
+}
+
 // Create new task on backend
 async function createTaskOnBackend(taskData) {
     try {
@@ -61,7 +104,7 @@ async function createTaskOnBackend(taskData) {
 // Complete task on backend and get AI response
 async function completeTaskOnBackend(taskId) {
     try {
-        const response = await fetch(`${API_BASE_URL}/tasks/${taskId}/complete`, {
+        const response = await fetch(`${API_BASE_URL}/tasks/${taskId}/complete?stream=true`, {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
@@ -72,9 +115,11 @@ async function completeTaskOnBackend(taskId) {
             const result = await response.json();
             console.log('Task completed on backend:', result);
             
-            // Update AI message if provided
-            if (result.ai_message) {
-                document.getElementById('ai-message').textContent = result.ai_message;
+            // The AI line is streamed into the typewriter as it is generated
+            if (result.message_stream) {
+                streamAIMessage(result.message_stream);
+            } else if (result.ai_message) {
+                typewriterEffect(result.ai_message);
             }
             
             // Update potato emotion if provided
@@ -116,9 +161,9 @@ async function getStreakFromBackend() {
     }
 }
 
-async function updateStreakDisplay() {
+async function updateStreakDisplay(snapshot = null) {
     try {
-        const streakData = await getStreakFromBackend();
+        const streakData = snapshot ? snapshot.streak : await getStreakFromBackend();
         const streakElement = document.getElementById('streak-count');
         
         if (streakElement && streakData) {
@@ -271,18 +316,11 @@ function scheduleCheckIns() {
 async function performSimpleCheckIn() {
     console.log('Performing check-in...');
     try {
-        const progressResponse = await fetch(`${API_BASE_URL}/task-progress-check`, {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-            }
-        });
-
-        if (progressResponse.ok) {
-            const progressResult = await progressResponse.json();
+        // The nudge is streamed; its progress numbers arrive first as the 'meta' event
+        await streamAIMessage('/stream/task-progress-check', (progressResult) => {
             console.log('Check-in result:', progressResult);
 
-            // ADD THIS: Determine potato emotion based on progress
+            // Determine potato emotion based on progress
             let potatoEmotion = 'default';
             
             if (progressResult.completed_count === 0 && progressResult.total_count > 0) {
@@ -296,22 +334,9 @@ async function performSimpleCheckIn() {
                 potatoEmotion = 'task-complete';
             }
 
-            // Display AI message
-            if (progressResult.ai_message) {
-                typewriterEffect(progressResult.ai_message, 'ai-message', true);
-            }
-
-            // ADD THIS: Switch potato emotion
-            switchPotatoImage(potatoEmotion, true); // Use revert for most states
-            
-            // Special handling for no-task-complete (don't revert)
-            if (potatoEmotion === 'no-task-complete') {
-                switchPotatoImage(potatoEmotion, false); // Don't revert disappointed potato
-            }
-
-        } else {
-            console.error('Check-in failed:', progressResponse.status);
-        }
+            // Don't revert the disappointed potato
+            switchPotatoImage(potatoEmotion, potatoEmotion !== 'no-task-complete');
+        });
     } catch (error) {
         console.error('Check-in failed:', error);
     }
@@ -403,6 +428,72 @@ function typewriterEffect(message, targetElementId = 'ai-message', scheduleRever
 
 
 
+// Stream an AI message over SSE and type it out as tokens arrive,
+// instead of waiting for the whole line before starting the typewriter
+function streamAIMessage(path, onMeta = null, targetElementId = 'ai-message') {
+    return new Promise((resolve) => {
+        const targetElement = document.getElementById(targetElementId);
+        if (!targetElement) {
+            console.error(`streamAIMessage: Element '${targetElementId}' not found`);
+            resolve(null);
+            return;
+        }
+
+        // Clear any existing typewriter timer
+        if (currentTypewriterTimer) {
+            clearInterval(currentTypewriterTimer);
+            currentTypewriterTimer = null;
+        }
+
+        const source = new EventSource(`${API_BASE_URL}${path}`);
+        let pending = '';
+        let finished = false;
+        let started = false;
+
+        targetElement.textContent = '';
+        currentTypewriterTimer = setInterval(() => {
+            if (pending.length > 0) {
+                targetElement.textContent += pending.charAt(0);
+                pending = pending.slice(1);
+            } else if (finished) {
+                clearInterval(currentTypewriterTimer);
+                currentTypewriterTimer = null;
+                if (targetElementId === 'ai-message') {
+                    scheduleAIMessageRevert();
+                }
+                resolve(targetElement.textContent);
+            }
+        }, 55);
+
+        source.addEventListener('meta', (event) => {
+            if (onMeta) {
+                onMeta(JSON.parse(event.data));
+            }
+        });
+        source.addEventListener('token', (event) => {
+            if (!started && targetElementId === 'ai-message') {
+                bouncePotatoForAI();
+            }
+            started = true;
+            pending += JSON.parse(event.data).text;
+        });
+        source.addEventListener('done', (event) => {
+            console.log('AI stream done:', JSON.parse(event.data));
+            finished = true;
+            source.close();  // otherwise EventSource reconnects
+        });
+        source.onerror = (error) => {
+            console.error('AI stream failed:', error);
+            finished = true;
+            source.close();
+        };
+    });
+}
+
+
+
+
+
 function setupDailyTaskInput() {
     const dailyInput = document.getElementById('daily-input');
     
@@ -457,11 +548,7 @@ async function addTask(taskData) {
         const newTask = await createTaskOnBackend(backendTask);
         
         if (newTask) {
-            // Schedule reminder timer immediately when task is created
-            if (newTask.deadline && newTask.reminder_minutes) {
-                scheduleReminderTimer(newTask);
-            }
-            
+            // The backend schedules the reminder and pushes it over /events when due
             return {
                 id: newTask.id,
                 name: newTask.description,
@@ -493,12 +580,6 @@ async function addTask(taskData) {
 
 async function toggleTask(taskId) {
     console.log('Toggling task:', taskId);
-
-    if (activeReminderTimers.has(taskId)) {
-        clearTimeout(activeReminderTimers.get(taskId));
-        activeReminderTimers.delete(taskId);
-        console.log('Reminder timer cancelled for completed task');
-    }
     
     // ADD: Get the task element for animation
     const taskElement = document.querySelector(`[data-task-id="${taskId}"]`);
@@ -513,16 +594,11 @@ async function toggleTask(taskId) {
         
         // Try to complete task on backend first
         const result = await completeTaskOnBackend(taskId);
+        const snapshot = await fetchBootstrap();
         
-        if (result && result.ai_message) {
-            // WITH the typewriter effect:
-            typewriterEffect(result.ai_message);
-            console.log('AI response:', result.ai_message);
-        }
-        
-        await checkAndUpdatePotatoState(result);
+        await checkAndUpdatePotatoState(result, snapshot);
 
-        const currentTasks = await getTasks();
+        const currentTasks = snapshot ? snapshot.tasks : await getTasks();
         const reorderedTasks = reorderTasksByCompletion(currentTasks);
         
         // Save reordered tasks back to localStorage (as fallback)
@@ -556,11 +632,16 @@ async function toggleTask(taskId) {
 }
 
 // Function to check and update potato state after task completion
-async function checkAndUpdatePotatoState(backendResult) {
+async function checkAndUpdatePotatoState(backendResult, snapshot = null) {
     try {
         // Get current daily status to determine potato state
-        const response = await fetch('http://localhost:8000/daily-status');
-        const status = await response.json();
+        let status;
+        if (snapshot) {
+            status = snapshot.daily_status;
+        } else {
+            const response = await fetch('http://localhost:8000/daily-status');
+            status = await response.json();
+        }
         
         console.log('=== POTATO STATE CHECK ===');
         console.log('Tasks completed:', status.completed_count);
@@ -587,7 +668,7 @@ async function checkAndUpdatePotatoState(backendResult) {
             switchPotatoImage('task-complete', true);
         }
         
-        await checkAndShowCallItADayButton();
+        await checkAndShowCallItADayButton(snapshot);
         
     } catch (error) {
         console.error('Error checking potato state:', error);
@@ -757,7 +838,7 @@ function setupDailyTaskCheckbox() {
             try {
                 if (isCompleted) {
                     // Use your existing complete endpoint
-                    const response = await fetch(`${API_BASE_URL}/daily-quests/complete`, {
+                    const response = await fetch(`${API_BASE_URL}/daily-quests/complete?stream=true`, {
                         method: 'PATCH',
                         headers: {
                             'Content-Type': 'application/json',
@@ -768,8 +849,10 @@ function setupDailyTaskCheckbox() {
                         const result = await response.json();
                         console.log('Daily quest completed:', result);
                         
-                        // Show AI message if provided
-                        if (result.ai_message) {
+                        // Stream the AI message into the typewriter as it arrives
+                        if (result.message_stream) {
+                            streamAIMessage(result.message_stream);
+                        } else if (result.ai_message) {
                             typewriterEffect(result.ai_message);
                         }
                         
@@ -793,12 +876,12 @@ function setupDailyTaskCheckbox() {
     }
 }
 
-async function loadExistingDailyQuest() {
+async function loadExistingDailyQuest(snapshot = null) {
     try {
-        // Use your existing GET endpoint
-        const response = await fetch(`${API_BASE_URL}/daily-quests/`);
-        if (response.ok) {
-            const data = await response.json();
+        // Use the bootstrap snapshot when we have one, the GET endpoint otherwise
+        const response = snapshot ? null : await fetch(`${API_BASE_URL}/daily-quests/`);
+        if (snapshot || response.ok) {
+            const data = snapshot || await response.json();
             const dailyQuest = data.daily_quest;
             
             if (dailyQuest) {
@@ -861,19 +944,18 @@ async function setupHomePage() {
         currentPotatoState = 'default';
     }
 
-    const currentTasks = await getTasks();
-    currentTasks.forEach(task => {
-        if (!task.completed && !task.is_completed) {
-            scheduleReminderTimer(task);
-        }
-    });
+    subscribeToAIMessages();
+
+    // Tasks, quest and streak arrive in one round trip
+    const snapshot = await fetchBootstrap();
+    const currentTasks = snapshot ? snapshot.tasks : await getTasks();
 
     scheduleCheckIns();
     
     // ADD: Setup daily task functionality
     setupDailyTaskInput();
     setupDailyTaskCheckbox();
-    await loadExistingDailyQuest();
+    await loadExistingDailyQuest(snapshot);
     
     if (currentTasks.length === 0) {
         // Show empty state and ensure button works
@@ -895,7 +977,7 @@ async function setupHomePage() {
         showTaskList(currentTasks);
     }
     
-    await updateStreakDisplay();
+    await updateStreakDisplay(snapshot);
 
     setupCallItADayButton();
 
@@ -915,6 +997,8 @@ async function setupAddTaskPage() {
         });
     }
 
+    setupTaskSuggestions();
+
     // Handle deadline button
     const deadlineButton = document.querySelector('.ddl-button');
     if (deadlineButton) {
@@ -982,6 +1066,52 @@ async function setupAddTaskPage() {
     }
 }
 
+// Suggest matching tasks while typing; the last word is matched as a prefix
+function setupTaskSuggestions() {
+    const input = document.querySelector('#task-name');
+    const list = document.querySelector('.task-suggestions');
+    if (!input || !list) return;
+
+    let debounceTimer = null;
+    let latestQuery = '';
+
+    input.addEventListener('input', () => {
+        clearTimeout(debounceTimer);
+        debounceTimer = setTimeout(() => showTaskSuggestions(input.value), 150);
+    });
+
+    async function showTaskSuggestions(query) {
+        latestQuery = query;
+        if (!query.trim()) {
+            list.hidden = true;
+            return;
+        }
+        try {
+            const response = await fetch(`${API_BASE_URL}/tasks/search?q=${encodeURIComponent(query)}&limit=10`);
+            if (!response.ok || query !== latestQuery) return;  // a newer keystroke owns the list
+            const { tasks } = await response.json();
+            // Past days' tasks match too, so the same description can come back more than once;
+            // ask for ten and show up to five distinct ones
+            const descriptions = [...new Set(tasks.map(task => task.description))].slice(0, 5);
+            list.replaceChildren(...descriptions.map(description => {
+                const item = document.createElement('li');
+                item.textContent = description;
+                item.addEventListener('mousedown', (e) => {
+                    e.preventDefault();  // keep focus in the textarea
+                    input.value = description;
+                    list.hidden = true;
+                });
+                return item;
+            }));
+            list.hidden = descriptions.length === 0;
+        } catch (error) {
+            console.error('Error searching tasks:', error);
+        }
+    }
+
+    input.addEventListener('blur', () => { list.hidden = true; });
+}
+
 function handleDeadlineClick() {
     console.log('Handling deadline click...');
     
@@ -1417,56 +1547,6 @@ function deleteReminder() {
     console.log('Reminder deleted');
 }
 
-// Timer-based reminder system
-let activeReminderTimers = new Map();
-
-function scheduleReminderTimer(task) {
-    if (!task.reminder_minutes) return; // Only need reminder_minutes to be set
-    
-    let reminderTime;
-    
-    if (task.deadline) {
-        // CONDITION 1: Reminder X minutes BEFORE deadline
-        const deadlineTime = new Date(task.deadline).getTime();
-        reminderTime = deadlineTime - (task.reminder_minutes * 60 * 1000);
-        console.log(`Reminder set for "${task.description}" ${task.reminder_minutes} minutes before deadline`);
-    } else {
-        // CONDITION 2: Reminder X minutes FROM NOW (not from creation time)
-        const now = Date.now();
-        reminderTime = now + (task.reminder_minutes * 60 * 1000);
-        console.log(`Reminder set for "${task.description}" ${task.reminder_minutes} minutes from now`);
-    }
-    
-    const now = Date.now();
-    
-    // Only set timer if reminder is in the future
-    if (reminderTime > now) {
-        const delay = reminderTime - now;
-        console.log(`Timer will fire in ${Math.round(delay/1000/60)} minutes`);
-        
-        const timerId = setTimeout(async () => {
-            try {
-                const response = await fetch(`${API_BASE_URL}/reminder/${task.id}`);
-                if (response.ok) {
-                    const data = await response.json();
-                    if (data.reminder) {
-                        typewriterEffect(data.reminder);
-                    }
-                }
-            } catch (error) {
-                console.error('Failed to get reminder message:', error);
-                typewriterEffect(`⏰ "${task.description}" reminder!`);
-            }
-            
-            activeReminderTimers.delete(task.id);
-        }, delay);
-        
-        activeReminderTimers.set(task.id, timerId);
-    } else {
-        console.log('Reminder time has already passed, not setting timer');
-    }
-}
-
 // Function to handle the edit task page
 function setupEditTaskPage() {
     console.log('Setting up edit task page...');
@@ -1485,16 +1565,16 @@ function setupEditTaskPage() {
 }
 
 // Function to check if "Call It a Day" button should be shown
-async function checkAndShowCallItADayButton() {
+async function checkAndShowCallItADayButton(snapshot = null) {
     console.log('=== DEBUG: checkAndShowCallItADayButton called ===');
     try {
-        const currentTasks = await getTasks();
+        const currentTasks = snapshot ? snapshot.tasks : await getTasks();
         const allTasksComplete = currentTasks.length > 0 && currentTasks.every(task => 
             task.completed || task.is_completed
         );
         
         // Check daily quest status
-        const dailyQuestComplete = await checkDailyQuestStatus();
+        const dailyQuestComplete = snapshot ? snapshot.daily_status.quest_completed : await checkDailyQuestStatus();
         
         // Show button only if both conditions are met
         const shouldShowButton = allTasksComplete && dailyQuestComplete;